@@ -0,0 +1,58 @@
+"""
+Celery application for runscore.
+
+Workers are started with ``celery -A core worker``. Tasks are discovered from
+each app's ``tasks.py``.
+
+Tasks run in the pool's child processes, and most Strava metrics are recorded
+there. With ``WORKER_METRICS_PORT`` set, the children write their samples to
+a shared ``PROMETHEUS_MULTIPROC_DIR`` and the main worker process serves the
+merged metrics on that port for Prometheus to scrape. The port has no token,
+so only expose it on a private network.
+"""
+
+import os
+import shutil
+import tempfile
+
+from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown
+
+# Like gunicorn.conf.py, this must happen before prometheus_client is imported
+METRICS_PORT = os.getenv('WORKER_METRICS_PORT')
+if METRICS_PORT:
+    _metrics_dir = os.environ.setdefault(
+        'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'runscore-worker-metrics'),
+    )
+    os.makedirs(_metrics_dir, exist_ok=True)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+app = Celery('core')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    """Serve the pool's merged metrics; runs in the main process before the pool starts."""
+    if not METRICS_PORT:
+        return
+    from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+
+    # Drop samples left by the children of a previous run
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(int(METRICS_PORT), registry=registry)
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    if METRICS_PORT:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
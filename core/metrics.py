@@ -0,0 +1,146 @@
+"""
+Prometheus metrics for runscore.
+
+Request latency and ORM query counts are recorded per view by
+``MetricsMiddleware``; Strava and Firebase calls, sync outcomes and rate-limit
+hits are recorded where they happen. Everything is served at ``/metrics`` in
+the Prometheus text format.
+
+Under gunicorn each worker writes its samples to ``PROMETHEUS_MULTIPROC_DIR``
+(set up in gunicorn.conf.py) and ``/metrics`` merges them, so one scrape
+covers every worker. Metrics recorded in Celery tasks are served by the
+Celery worker itself (see core/celery.py).
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Strava and Firebase calls take longer than a typical view
+EXTERNAL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request', ['view', 'method', 'status'],
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'ORM queries run while handling a request', ['view'], buckets=QUERY_BUCKETS,
+)
+STRAVA_REQUEST_SECONDS = Histogram(
+    'strava_request_duration_seconds', 'Strava API call latency by endpoint and status',
+    ['endpoint', 'status'], buckets=EXTERNAL_BUCKETS,
+)
+FIREBASE_REQUEST_SECONDS = Histogram(
+    'firebase_request_duration_seconds', 'Firebase call latency by operation and outcome',
+    ['operation', 'status'], buckets=EXTERNAL_BUCKETS,
+)
+STRAVA_SYNCS = Counter(
+    'strava_syncs_total', 'Strava sync runs by outcome', ['outcome'],
+)
+STRAVA_RATE_LIMIT_HITS = Counter(
+    'strava_rate_limit_hits_total', 'Strava calls refused by the local quota or a 429', ['priority', 'source'],
+)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """Observe the block's duration, labelled ``status="ok"`` or ``status="error"``."""
+    started = time.monotonic()
+    status = 'error'
+    try:
+        yield
+        status = 'ok'
+    finally:
+        histogram.labels(status=status, **labels).observe(time.monotonic() - started)
+
+
+class MetricsMiddleware:
+    """
+    Record latency and ORM query count for every request, labelled by view name.
+
+    Runs natively under both WSGI and ASGI. Database connections belong to a
+    thread, so under ASGI the query counter is installed on the connection
+    of the request's sync thread, where its views and middleware query.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        counter = _QueryCounter()
+        started = time.monotonic()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        self._observe(request, response, time.monotonic() - started, counter.queries)
+        return response
+
+    async def __acall__(self, request):
+        counter = _QueryCounter()
+        started = time.monotonic()
+        # ``connection`` must be looked up in the sync thread, not on the event loop
+        await sync_to_async(lambda: connection.execute_wrappers.append(counter))()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(lambda: connection.execute_wrappers.remove(counter))()
+        self._observe(request, response, time.monotonic() - started, counter.queries)
+        return response
+
+    @staticmethod
+    def _observe(request, response, elapsed, queries):
+        match = getattr(request, 'resolver_match', None)
+        # view_name falls back to the view's dotted path for unnamed URLs
+        view = match.view_name if match else 'unmatched'
+        REQUEST_SECONDS.labels(view, request.method, response.status_code).observe(elapsed)
+        REQUEST_QUERIES.labels(view).observe(queries)
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+def metrics_view(request):
+    """
+    Serve every metric in the Prometheus text format.
+
+    Requires the METRICS_TOKEN bearer token. Without a token configured,
+    the endpoint is only open under DEBUG.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
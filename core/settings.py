@@ -49,8 +49,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise
+    'core.middleware.StaticFilesMiddleware',  # WhiteNoise, async-capable
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -91,11 +92,108 @@ else:
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
         }
     }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Shared across workers through Redis in production, per-process locally.
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# Django REST Framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'users.authentication.FirebaseAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': [
+        'rest_framework.permissions.IsAuthenticated',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+    ],
+}
+
+
+# Celery
+# Without a broker (local dev, tests) tasks run eagerly in-process.
+
+CELERY_BROKER_URL = REDIS_URL or 'memory://'
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', 'False' if REDIS_URL else 'True') == 'True'
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Celery beat queues background Strava polls this often; each user is polled
+# every 1-24 hours depending on how much they run (see strava_integration.polling).
+STRAVA_POLL_TICK_SECONDS = int(os.getenv('STRAVA_POLL_TICK_SECONDS', '300'))
+CELERY_BEAT_SCHEDULE = {
+    'poll-strava': {
+        'task': 'strava_integration.tasks.schedule_polls',
+        'schedule': STRAVA_POLL_TICK_SECONDS,
+    },
+}
+
+
+# Strava base URLs; point them at `manage.py fake_strava` for offline load
+# and fault testing.
+
+STRAVA_API_URL = os.getenv('STRAVA_API_URL', 'https://www.strava.com/api/v3')
+STRAVA_OAUTH_URL = os.getenv('STRAVA_OAUTH_URL', 'https://www.strava.com/oauth')
+
+
+# Strava API quotas (app-wide, per 15 minutes and per day)
+# Background polling may use at most this share of each window.
+
+STRAVA_RATE_LIMIT_15MIN = int(os.getenv('STRAVA_RATE_LIMIT_15MIN', '200'))
+STRAVA_RATE_LIMIT_DAILY = int(os.getenv('STRAVA_RATE_LIMIT_DAILY', '2000'))
+STRAVA_RATE_LIMIT_BACKGROUND_SHARE = float(os.getenv('STRAVA_RATE_LIMIT_BACKGROUND_SHARE', '0.8'))
+
+
+# Strava webhooks: token echoed by Strava when subscribing, the id of our
+# subscription (events for any other id are dropped), and how long events
+# are collected per athlete before one fetch handles them all.
+
+STRAVA_WEBHOOK_VERIFY_TOKEN = os.getenv('STRAVA_WEBHOOK_VERIFY_TOKEN')
+STRAVA_WEBHOOK_SUBSCRIPTION_ID = os.getenv('STRAVA_WEBHOOK_SUBSCRIPTION_ID')
+STRAVA_WEBHOOK_COALESCE_SECONDS = int(os.getenv('STRAVA_WEBHOOK_COALESCE_SECONDS', '30'))
+
+# Opening the dashboard queues a background sync when the last one finished
+# longer ago than this.
+STRAVA_STALE_AFTER_SECONDS = int(os.getenv('STRAVA_STALE_AFTER_SECONDS', '900'))
+
+# /metrics requires "Authorization: Bearer <METRICS_TOKEN>"; with no token
+# set it is only served under DEBUG.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Limits on activity files uploaded to /api/v1/data/import, which are parsed
+# within the request. Counted across every file of an upload, with zip
+# archives counted by their activity files.
+ACTIVITY_IMPORT_MAX_FILES = int(os.getenv('ACTIVITY_IMPORT_MAX_FILES', '2000'))
+ACTIVITY_IMPORT_MAX_UPLOAD_BYTES = int(os.getenv('ACTIVITY_IMPORT_MAX_UPLOAD_BYTES', str(100 * 1024 * 1024)))
+ACTIVITY_IMPORT_MAX_UNPACKED_BYTES = int(os.getenv('ACTIVITY_IMPORT_MAX_UNPACKED_BYTES', str(500 * 1024 * 1024)))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
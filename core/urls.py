@@ -1,9 +1,13 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from core.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('auth/', include('users.urls')),
     path('strava/', include('strava_integration.urls')),
+    path('api/v1/', include('dashboard.api_urls')),
     path('', include('dashboard.urls')),
 ]
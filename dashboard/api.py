@@ -0,0 +1,92 @@
+import hashlib
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from rest_framework import status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from strava_integration.scoring import get_current_week_start, get_data_version, get_score_context
+
+
+def score_etag(user_id, current_week_start):
+    """ETag for a user's score data; it changes whenever their data version or the week does."""
+    version = get_data_version(user_id)
+    return '"%s"' % hashlib.sha1(f'{user_id}:{version}:{current_week_start.isoformat()}'.encode()).hexdigest()
+
+
+class ScoreView(APIView):
+    """
+    GET /api/v1/data/score
+
+    Current Critical Score, Recommended Capacity and weekly history as JSON.
+    The ETag is derived from the user's data version and the current week,
+    so a matching If-None-Match gets a 304 before any score is loaded.
+    """
+
+    def get(self, request):
+        user = request.user
+        current_week_start = get_current_week_start()
+        etag = score_etag(user.pk, current_week_start)
+
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if_none_match = self._if_none_match(request)
+        if etag in if_none_match or '*' in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        context = get_score_context(user)
+        data = {
+            'week_start': current_week_start,
+            'acute_mileage': context['acute_mileage'],
+            'chronic_mileage': context['chronic_mileage'],
+            'critical_score': context['critical_score'],
+            'recommended_capacity': context['recommended_capacity'],
+            'history': [
+                {
+                    'week_start': week['week_start'],
+                    'acute': week['acute'],
+                    'chronic': week['chronic'],
+                    'acwr': week['acwr'] if week['acwr'] != "N/A" else None,
+                }
+                for week in context['historical_data']
+            ],
+        }
+        return Response(data, headers=headers)
+
+    @staticmethod
+    def _if_none_match(request):
+        header = request.headers.get('If-None-Match', '')
+        return {tag.strip() for tag in header.split(',') if tag.strip()}
+
+
+class ActivityFileImportView(APIView):
+    """
+    POST /api/v1/data/import
+
+    Import uploaded GPX, TCX or FIT files, or zip archives of them such as
+    a Strava bulk export, as multipart ``files``. GPX and TCX only record
+    UTC, so an optional ``timezone`` (e.g. Europe/London) places those runs
+    in the right week. Uploads over the ACTIVITY_IMPORT_MAX_* limits get
+    a 413.
+    """
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        from strava_integration.activity_files import UploadTooLarge, import_uploaded_files
+
+        uploads = request.FILES.getlist('files')
+        if not uploads:
+            return Response({'error': 'No files uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+
+        tz = None
+        if request.data.get('timezone'):
+            try:
+                tz = ZoneInfo(request.data['timezone'])
+            except (ZoneInfoNotFoundError, ValueError):
+                return Response({'error': 'Unknown time zone'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            stats = import_uploaded_files(request.user, uploads, tz=tz)
+        except UploadTooLarge as e:
+            return Response({'error': str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        return Response(stats)
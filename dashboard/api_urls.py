@@ -0,0 +1,9 @@
+from django.urls import path
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path('data/score', api.ScoreView.as_view(), name='score'),
+    path('data/import', api.ActivityFileImportView.as_view(), name='import'),
+]
@@ -0,0 +1,235 @@
+"""
+Synthetic-data benchmarks for the score engine, the dashboard view and Strava
+ingestion.
+
+Run with ``python manage.py benchmark``. Each case is repeated and reported as
+latency percentiles plus the most ORM queries any repeat ran. Results can be
+saved as a baseline, and later runs are compared against it to flag
+regressions.
+"""
+import io
+import json
+import math
+import random
+import statistics
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory
+
+# Share of weeks that have any mileage
+DENSITIES = {'dense': 1.0, 'sparse': 0.3}
+
+# A slower p50 than baseline * (1 + tolerance) counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def generate_mileage(weeks, density, end_week, rng):
+    """Return {week_start: miles} for the ``weeks`` weeks up to ``end_week``."""
+    share = DENSITIES[density]
+    return {
+        end_week - timedelta(weeks=i): round(rng.uniform(5, 50), 1)
+        for i in range(weeks)
+        if rng.random() < share
+    }
+
+
+def generate_users(count, weeks, density, seed=0):
+    """Create ``count`` users with ``weeks`` weeks of mileage and their WeeklyScore rows."""
+    from strava_integration.batch import compute_all_scores
+    from strava_integration.models import MileageLog
+    from strava_integration.scoring import get_current_week_start
+
+    User = get_user_model()
+    rng = random.Random(seed)
+    current = get_current_week_start()
+
+    User.objects.bulk_create([
+        User(firebase_uid=f'bench_{seed}_{i}', phone_number=f'+1999{seed:03d}{i:06d}')
+        for i in range(count)
+    ])
+    users = list(User.objects.filter(firebase_uid__startswith=f'bench_{seed}_').order_by('pk'))
+    MileageLog.objects.bulk_create([
+        MileageLog(user=user, week_start_date=week, total_mileage=miles)
+        for user in users
+        for week, miles in generate_mileage(weeks, density, current, rng).items()
+    ], batch_size=2000)
+    compute_all_scores()
+    return users
+
+
+def generate_activities(count, weeks=6, seed=0, end=None):
+    """Build ``count`` Strava activity payloads spread over the last ``weeks`` weeks."""
+    from strava_integration.services import METERS_PER_MILE, RUN_TYPES
+
+    rng = random.Random(seed)
+    end = end or datetime.now(dt_timezone.utc)
+    span = timedelta(weeks=weeks).total_seconds()
+    activities = []
+    for i in range(count):
+        start = end - timedelta(seconds=rng.uniform(0, span))
+        activities.append({
+            'id': seed * 10_000_000 + i,
+            'type': rng.choice(RUN_TYPES + ['Ride', 'Walk']),
+            'distance': rng.uniform(2, 25) * METERS_PER_MILE,
+            'start_date': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'start_date_local': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        })
+    return activities
+
+
+def measure(fn, repeat, setup=None):
+    """
+    Time ``fn(setup())`` ``repeat`` times, counting ORM queries.
+
+    Returns:
+        dict: p50/p95/p99/mean in milliseconds and the highest query count
+    """
+    timings = []
+    most_queries = 0
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            started = time.perf_counter()
+            fn(arg)
+            timings.append((time.perf_counter() - started) * 1000)
+        most_queries = max(most_queries, queries)
+
+    return {
+        'p50': round(percentile(timings, 50), 3),
+        'p95': round(percentile(timings, 95), 3),
+        'p99': round(percentile(timings, 99), 3),
+        'mean': round(statistics.mean(timings), 3),
+        'queries': most_queries,
+    }
+
+
+def bench_acwr(weeks, density, repeat):
+    """Score ``weeks`` weeks of mileage with the engine alone, no database."""
+    from strava_integration.scoring import compute_weekly_scores, get_current_week_start
+
+    current = get_current_week_start()
+    mileage = generate_mileage(weeks, density, current, random.Random(1))
+    return measure(lambda _: compute_weekly_scores(mileage, current, weeks=weeks), repeat)
+
+
+def bench_dashboard(users, repeat, cold):
+    """Render ``dashboard.views.index`` end to end for random users."""
+    from dashboard.views import index
+
+    factory = RequestFactory()
+    rng = random.Random(2)
+
+    def setup():
+        if cold:
+            cache.clear()
+        request = factory.get('/')
+        request.user = rng.choice(users)
+        return request
+
+    def render(request):
+        response = index(request)
+        assert response.status_code == 200, response.status_code
+
+    if not cold:
+        for user in users:
+            request = factory.get('/')
+            request.user = user
+            render(request)
+    return measure(render, repeat, setup)
+
+
+def bench_initial_fetch(activity_count, repeat):
+    """Run ``fetch_initial_data`` for a new user against a canned activity payload."""
+    from strava_integration.services import StravaService
+
+    User = get_user_model()
+    service = StravaService()
+    created = iter(range(10 ** 9))
+    payload = []
+
+    def setup():
+        i = next(created)
+        # Fresh Strava ids every run, so each one inserts rather than updating the last run's rows
+        payload[:] = generate_activities(activity_count, seed=i + 1)
+        return User.objects.create(
+            firebase_uid=f'bench_fetch_{i}', phone_number=f'+1998{i:08d}', strava_refresh_token='refresh',
+        )
+
+    with mock.patch.object(service, 'get_access_token', return_value='access'), \
+            mock.patch.object(service, 'iter_activities', side_effect=lambda *a, **kw: iter(payload)), \
+            redirect_stdout(io.StringIO()):
+        return measure(service.fetch_initial_data, repeat, setup)
+
+
+def run_benchmarks(users=50, weeks=52, density='dense', activities=2000, repeat=30):
+    """
+    Generate synthetic data and run every case.
+
+    Must run against a disposable database; the command creates one.
+
+    Returns:
+        dict: ``{'params': {...}, 'results': {case: stats}}``
+    """
+    params = {'users': users, 'weeks': weeks, 'density': density, 'activities': activities, 'repeat': repeat}
+    cache.clear()
+    population = generate_users(users, weeks, density)
+
+    return {
+        'params': params,
+        'results': {
+            'acwr': bench_acwr(weeks, density, repeat),
+            'dashboard_cold': bench_dashboard(population, repeat, cold=True),
+            'dashboard_warm': bench_dashboard(population, repeat, cold=False),
+            'initial_fetch': bench_initial_fetch(activities, repeat),
+        },
+    }
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare a report with a stored baseline.
+
+    Returns:
+        list[str]: one message per regression, empty when there are none
+    """
+    regressions = []
+    for case, stats in report['results'].items():
+        base = baseline['results'].get(case)
+        if not base:
+            continue
+        if stats['p50'] > base['p50'] * (1 + tolerance):
+            regressions.append(f"{case}: p50 {stats['p50']:.2f}ms vs baseline {base['p50']:.2f}ms")
+        if stats['queries'] > base['queries']:
+            regressions.append(f"{case}: {stats['queries']} queries vs baseline {base['queries']}")
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(report, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
@@ -0,0 +1,217 @@
+"""
+Concurrent-request throughput of gunicorn sync workers against ASGI workers.
+
+Run with ``python manage.py benchmark_servers``. Both setups serve the same
+throwaway database with the same number of worker processes, while a fake
+Strava adds realistic latency to every call. Many concurrent clients then
+load the dashboard and the Strava callback, whose time is mostly spent
+waiting on Strava. A sync worker holds a whole process for that wait; an
+ASGI worker runs the view on a thread and serves other requests in the
+meantime.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import urlparse, urlunparse
+
+import httpx
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client
+
+from .benchmarks import generate_users, percentile
+
+# gunicorn application and extra arguments per server setup
+SERVERS = {
+    'sync': ['core.wsgi:application'],
+    'asgi': ['core.asgi:application', '--worker-class', 'uvicorn_worker.UvicornWorker'],
+}
+
+# Seconds to wait for a server to accept requests
+STARTUP_TIMEOUT = 30
+
+# Strava quota for the fake and the servers under load; only latency should limit throughput
+UNLIMITED = 10 ** 9
+
+
+def database_env(settings_dict):
+    """Environment variables that point a child process at the database in ``settings_dict``."""
+    if settings_dict['ENGINE'] == 'django.db.backends.sqlite3':
+        return {'SQLITE_PATH': str(settings_dict['NAME'])}
+    url = urlparse(os.environ['DATABASE_URL'])
+    return {'DATABASE_URL': urlunparse(url._replace(path=f"/{settings_dict['NAME']}"))}
+
+
+def seed_sessions(users, weeks):
+    """
+    Create ``users`` connected, freshly synced users with ``weeks`` weeks of mileage.
+
+    Returns:
+        list: (user, session cookie header) pairs
+    """
+    User = get_user_model()
+    population = generate_users(users, weeks, 'dense', seed=7)
+    User.objects.filter(pk__in=[user.pk for user in population]).update(
+        strava_refresh_token='refresh', strava_synced_at=datetime.now(dt_timezone.utc),
+    )
+
+    sessions = []
+    for user in population:
+        client = Client()
+        client.force_login(user)
+        cookie = client.cookies[settings.SESSION_COOKIE_NAME]
+        sessions.append((user, f'{settings.SESSION_COOKIE_NAME}={cookie.value}'))
+    return sessions
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind, workers, env, config):
+    """
+    Start gunicorn for ``kind`` (a key of SERVERS) and wait until it answers.
+
+    Returns:
+        tuple: (process, base URL)
+    """
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', *SERVERS[kind], '--workers', str(workers),
+         '--bind', f'127.0.0.1:{port}', '--config', str(config)],
+        cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError(f'{kind} server exited with status {process.returncode}')
+        try:
+            httpx.get(f'{url}/users/login/', timeout=1)
+            return process, url
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                stop_server(process)
+                raise RuntimeError(f'{kind} server did not start within {STARTUP_TIMEOUT}s')
+            time.sleep(0.2)
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_load(requests, concurrency, timeout=60):
+    """
+    Send ``requests`` with ``concurrency`` clients at once.
+
+    Args:
+        requests: (url, headers) pairs, each sent once
+        concurrency: requests in flight at any time
+        timeout: seconds before a single request counts as failed
+
+    Returns:
+        dict: requests sent, errors, requests per second and p50/p95/p99
+        latency in milliseconds. Anything but a 2xx or 3xx is an error.
+    """
+    async def load():
+        pending = iter(requests)
+        timings = []
+        errors = 0
+
+        async def client(session):
+            nonlocal errors
+            for url, headers in pending:
+                started = time.perf_counter()
+                try:
+                    response = await session.get(url, headers=headers)
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                timings.append((time.perf_counter() - started) * 1000)
+                errors += not ok
+
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(timeout=timeout, limits=limits) as session:
+            started = time.perf_counter()
+            await asyncio.gather(*(client(session) for _ in range(concurrency)))
+            return timings, errors, time.perf_counter() - started
+
+    timings, errors, seconds = asyncio.run(load())
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'rps': round(len(timings) / seconds, 1),
+        'p50': round(percentile(timings, 50), 1),
+        'p95': round(percentile(timings, 95), 1),
+        'p99': round(percentile(timings, 99), 1),
+    }
+
+
+def run_server_benchmarks(workdir, latency=0.25, workers=2, concurrency=50, requests=500, users=20, weeks=52):
+    """
+    Load every server setup in SERVERS with dashboard and callback requests.
+
+    The database must be disposable and readable by child processes; the
+    command sets one up. Config files go in ``workdir``, and every Strava
+    call takes about ``latency`` seconds.
+
+    Returns:
+        dict: ``{'params': {...}, 'results': {server: {case: stats}}}``
+    """
+    from strava_integration.fake_server import FakeStrava, FakeStravaServer
+
+    params = {
+        'latency': latency, 'workers': workers, 'concurrency': concurrency, 'requests': requests, 'users': users,
+    }
+    sessions = seed_sessions(users, weeks)
+
+    config = os.path.join(workdir, 'gunicorn.conf.py')
+    # Skip the production hooks (Firebase warm-up, shared metrics directory)
+    open(config, 'w').close()
+
+    env = dict(os.environ)
+    # Keep cache and broker in-process so queued tasks go nowhere
+    for name in ('REDIS_URL', 'DATABASE_URL', 'PROMETHEUS_MULTIPROC_DIR'):
+        env.pop(name, None)
+    env.update(database_env(connection.settings_dict))
+    env.update({
+        'DEBUG': 'False',
+        'ALLOWED_HOSTS': '127.0.0.1',
+        'CELERY_TASK_ALWAYS_EAGER': 'False',
+        'STRAVA_RATE_LIMIT_15MIN': str(UNLIMITED),
+        'STRAVA_RATE_LIMIT_DAILY': str(UNLIMITED),
+    })
+
+    results = {}
+    fake = FakeStrava(latency=latency, short_limit=UNLIMITED, long_limit=UNLIMITED)
+    with FakeStravaServer(fake) as strava:
+        env.update({'STRAVA_API_URL': strava.api_url, 'STRAVA_OAUTH_URL': strava.oauth_url})
+        for kind in SERVERS:
+            process, url = start_server(kind, workers, env, config)
+            try:
+                cases = {
+                    'dashboard': [(f'{url}/', {'Cookie': cookie}) for _, cookie in sessions],
+                    'callback': [
+                        (f'{url}/strava/callback/?code={user.pk}', {'Cookie': cookie}) for user, cookie in sessions
+                    ],
+                }
+                results[kind] = {
+                    case: run_load([batch[i % len(batch)] for i in range(requests)], concurrency)
+                    for case, batch in cases.items()
+                }
+            finally:
+                stop_server(process)
+
+    return {'params': params, 'results': results}
@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from dashboard import benchmarks
+
+DEFAULT_BASELINE = settings.BASE_DIR / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the ACWR engine, the dashboard view and initial Strava ingestion on synthetic data. '
+        'Runs against a throwaway test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Synthetic users to create')
+        parser.add_argument('--weeks', type=int, default=52, help='Weeks of history per user')
+        parser.add_argument('--density', choices=sorted(benchmarks.DENSITIES), default='dense',
+                            help='Share of weeks with mileage')
+        parser.add_argument('--activities', type=int, default=2000, help='Activities in the initial fetch payload')
+        parser.add_argument('--repeat', type=int, default=30, help='Timed runs per case')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='Baseline JSON file')
+        parser.add_argument('--save-baseline', action='store_true', help='Store this run as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=benchmarks.DEFAULT_TOLERANCE,
+                            help='Allowed p50 slowdown against the baseline, as a fraction')
+
+    def handle(self, *args, **options):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(CACHES=locmem):
+                report = benchmarks.run_benchmarks(
+                    users=options['users'],
+                    weeks=options['weeks'],
+                    density=options['density'],
+                    activities=options['activities'],
+                    repeat=options['repeat'],
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f"{'case':<16}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}{'queries':>9}")
+        for case, stats in report['results'].items():
+            self.stdout.write(
+                f"{case:<16}{stats['p50']:>8.2f}ms{stats['p95']:>8.2f}ms{stats['p99']:>8.2f}ms"
+                f"{stats['mean']:>8.2f}ms{stats['queries']:>9}"
+            )
+
+        baseline_path = options['baseline']
+        if options['save_baseline']:
+            from pathlib import Path
+
+            benchmarks.save_baseline(report, Path(baseline_path))
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline to {baseline_path}"))
+            return
+
+        try:
+            baseline = benchmarks.load_baseline(baseline_path)
+        except FileNotFoundError:
+            self.stdout.write(f"No baseline at {baseline_path}; run with --save-baseline to create one")
+            return
+
+        if baseline['params'] != report['params']:
+            self.stdout.write(self.style.WARNING(
+                f"Baseline was recorded with {baseline['params']}; timings are not comparable"
+            ))
+            return
+
+        regressions = benchmarks.compare(report, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError('Regressions against baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
@@ -0,0 +1,50 @@
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from dashboard import loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare concurrent-request throughput of gunicorn sync workers and ASGI workers '
+        'against a fake Strava. Runs against a throwaway test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Worker processes per server')
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight at once')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per case')
+        parser.add_argument('--users', type=int, default=20, help='Logged-in users to spread requests over')
+        parser.add_argument('--latency', type=float, default=0.25, help='Seconds each fake Strava call takes')
+
+    def handle(self, *args, **options):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with tempfile.TemporaryDirectory() as workdir:
+            if connection.vendor == 'sqlite':
+                # The servers run in other processes, so the test database can't live in memory
+                connection.settings_dict['TEST']['NAME'] = str(Path(workdir) / 'benchmark.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                with override_settings(CACHES=locmem):
+                    report = loadtest.run_server_benchmarks(
+                        workdir,
+                        latency=options['latency'],
+                        workers=options['workers'],
+                        concurrency=options['concurrency'],
+                        requests=options['requests'],
+                        users=options['users'],
+                    )
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f"{'server':<8}{'case':<11}{'req/s':>9}{'p50':>11}{'p95':>11}{'p99':>11}{'errors':>8}")
+        for server, cases in report['results'].items():
+            for case, stats in cases.items():
+                self.stdout.write(
+                    f"{server:<8}{case:<11}{stats['rps']:>9.1f}{stats['p50']:>9.1f}ms{stats['p95']:>9.1f}ms"
+                    f"{stats['p99']:>9.1f}ms{stats['errors']:>8}"
+                )
@@ -3,6 +3,8 @@ from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
+from unittest import mock
+from django.core.cache import cache
 from strava_integration.models import MileageLog
 
 User = get_user_model()
@@ -55,3 +57,360 @@ class DashboardCalculationTests(TestCase):
         self.assertEqual(response.context['acute_mileage'], 0.0)
         self.assertEqual(response.context['chronic_mileage'], 0.0)
         self.assertEqual(response.context['critical_score'], 0.0)
+
+
+class ScoreEngineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(firebase_uid='engine_user', phone_number='+15555555556')
+        self.client.force_login(self.user)
+        self.dashboard_url = reverse('dashboard:index')
+
+    def test_compute_weekly_scores_sliding_window(self):
+        from strava_integration.scoring import compute_weekly_scores
+
+        current = timezone.now().date()
+        current = current - timedelta(days=current.weekday())
+        mileage = {current - timedelta(weeks=i): m for i, m in enumerate([25.0, 20.0, 22.0, 18.0, 24.0, 8.0])}
+
+        scores = compute_weekly_scores(mileage, current)
+
+        self.assertEqual(len(scores), 6)
+        self.assertEqual(scores[0]['week_start'], current)
+        self.assertEqual(scores[0]['chronic'], 21.0)
+        self.assertAlmostEqual(scores[0]['acwr'], 25.0 / 21.0)
+        self.assertEqual(scores[0]['recommended_capacity'], 26.25)
+        # Previous week: 20 / avg(22, 18, 24, 8)
+        self.assertEqual(scores[1]['chronic'], 18.0)
+        # Oldest week has no chronic baseline
+        self.assertIsNone(scores[5]['acwr'])
+
+    def test_dashboard_uses_single_query_for_scores(self):
+        from strava_integration.scoring import get_current_week_start
+
+        current = get_current_week_start()
+        for i in range(10):
+            MileageLog.objects.create(user=self.user, week_start_date=current - timedelta(weeks=i), total_mileage=10.0 + i)
+
+        # Session + user lookups plus one mileage query
+        with self.assertNumQueries(3):
+            response = self.client.get(self.dashboard_url)
+
+        self.assertEqual(response.context['acute_mileage'], 10.0)
+        self.assertEqual(response.context['chronic_mileage'], 12.5)
+        self.assertEqual(len(response.context['historical_data']), 6)
+        self.assertEqual(response.context['historical_data'][0]['week_label'], "Current Week")
+
+    def test_repeat_views_are_served_from_cache(self):
+        from strava_integration.scoring import get_current_week_start
+
+        current = get_current_week_start()
+        log = MileageLog.objects.create(user=self.user, week_start_date=current, total_mileage=10.0)
+        self.client.get(self.dashboard_url)
+
+        # Only the session and user lookups remain
+        with self.assertNumQueries(2):
+            response = self.client.get(self.dashboard_url)
+        self.assertEqual(response.context['acute_mileage'], 10.0)
+
+        # Writes bump the user's data version
+        log.total_mileage = 12.0
+        log.save()
+        response = self.client.get(self.dashboard_url)
+        self.assertEqual(response.context['acute_mileage'], 12.0)
+
+    def test_week_rollover_starts_new_cache_entry(self):
+        from strava_integration.scoring import get_current_week_start, get_score_context
+
+        now = timezone.now()
+        current = get_current_week_start(now)
+        MileageLog.objects.create(user=self.user, week_start_date=current, total_mileage=10.0)
+
+        self.assertEqual(get_score_context(self.user, now)['acute_mileage'], 10.0)
+        next_week = get_score_context(self.user, now + timedelta(weeks=1))
+        self.assertEqual(next_week['acute_mileage'], 0.0)
+        self.assertEqual(next_week['chronic_mileage'], 2.5)
+
+
+class ScoreApiTests(TestCase):
+    def setUp(self):
+        from strava_integration.scoring import get_current_week_start
+
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(firebase_uid='api_user')
+        self.client.force_login(self.user)
+        self.score_url = reverse('api:score')
+        self.current = get_current_week_start()
+        for i, mileage in enumerate([25.0, 20.0, 22.0, 18.0, 24.0]):
+            MileageLog.objects.create(user=self.user, week_start_date=self.current - timedelta(weeks=i), total_mileage=mileage)
+
+    def test_returns_score_json(self):
+        response = self.client.get(self.score_url)
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['week_start'], self.current.isoformat())
+        self.assertEqual(data['critical_score'], 1.19)
+        self.assertEqual(data['recommended_capacity'], 26.2)
+        self.assertEqual(len(data['history']), 6)
+        self.assertIsNone(data['history'][-1]['acwr'])
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_conditional_get_returns_304_without_loading_scores(self):
+        etag = self.client.get(self.score_url)['ETag']
+
+        # Only the session and user lookups remain
+        with self.assertNumQueries(2):
+            response = self.client.get(self.score_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        MileageLog.objects.create(user=self.user, week_start_date=self.current - timedelta(weeks=5), total_mileage=5.0)
+        response = self.client.get(self.score_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_requires_authentication(self):
+        self.client.logout()
+        response = self.client.get(self.score_url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+    def test_imports_uploaded_activity_files(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from strava_integration.tests import MILE_NORTH, gpx_file
+
+        start = timezone.now().replace(microsecond=0) - timedelta(days=1)
+        gpx = gpx_file(start, [[(51.5, -0.1), (51.5 + 10 * MILE_NORTH, -0.1)]])
+        etag = self.client.get(self.score_url)['ETag']
+        response = self.client.post(reverse('api:import'), {
+            'files': [SimpleUploadedFile('run.gpx', gpx), SimpleUploadedFile('notes.txt', b'hello')],
+        })
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['files'], data['activities']), (1, 1))
+        self.assertEqual(list(data['errors']), ['notes.txt'])
+        self.assertAlmostEqual(self.user.activities.get().distance, 16093.4, delta=1)
+        self.assertNotEqual(self.client.get(self.score_url)['ETag'], etag)
+
+    def test_upload_limits(self):
+        import gzip
+        import io
+        import zipfile
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from strava_integration.tests import MILE_NORTH, gpx_file
+
+        start = timezone.now().replace(microsecond=0) - timedelta(days=1)
+        gpx = gpx_file(start, [[(51.5, -0.1), (51.5 + MILE_NORTH, -0.1)]])
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('a.gpx', gpx)
+            zf.writestr('b.gpx', gpx)
+
+        def upload(name, data):
+            return self.client.post(reverse('api:import'), {'files': [SimpleUploadedFile(name, data)]})
+
+        with self.settings(ACTIVITY_IMPORT_MAX_FILES=1):
+            response = upload('export.zip', archive.getvalue())
+        self.assertEqual(response.status_code, 413)
+        with self.settings(ACTIVITY_IMPORT_MAX_UNPACKED_BYTES=len(gpx)):
+            response = upload('export.zip', archive.getvalue())
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(self.user.activities.exists())
+
+        # A gzipped file's size only shows as it is read
+        with self.settings(ACTIVITY_IMPORT_MAX_UNPACKED_BYTES=len(gpx) - 1):
+            response = upload('run.gpx.gz', gzip.compress(gpx))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()['errors']), ['run.gpx.gz'])
+        self.assertFalse(self.user.activities.exists())
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(firebase_uid='metrics_user')
+        self.client.force_login(self.user)
+
+    def _sample(self, name, **labels):
+        from prometheus_client import REGISTRY
+
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_records_view_latency_and_queries(self):
+        labels = {'view': 'api:score', 'method': 'GET', 'status': '200'}
+        before = self._sample('http_request_duration_seconds_count', **labels)
+        queries_before = self._sample('http_request_db_queries_sum', view='api:score')
+
+        self.client.get(reverse('api:score'))
+
+        self.assertEqual(self._sample('http_request_duration_seconds_count', **labels), before + 1)
+        self.assertGreater(self._sample('http_request_db_queries_sum', view='api:score'), queries_before)
+
+    def test_metrics_endpoint_serves_prometheus_text(self):
+        self.client.get(reverse('api:score'))
+        with self.settings(METRICS_TOKEN='secret'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'http_request_duration_seconds_bucket{', response.content)
+
+    def test_metrics_token(self):
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+
+        # No token configured: closed unless DEBUG
+        with self.settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            with self.settings(DEBUG=True):
+                self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_celery_worker_serves_metrics_recorded_in_pool_processes(self):
+        import os
+        import subprocess
+        import sys
+        import tempfile
+        from django.conf import settings
+        from .loadtest import free_port
+
+        # prometheus_client picks its storage on import, so this needs a fresh interpreter
+        script = (
+            "import multiprocessing, os, urllib.request\n"
+            "import django; django.setup()\n"
+            "from core.celery import mark_metrics_process_dead, start_metrics_server\n"
+            "from core.metrics import STRAVA_SYNCS\n"
+            "start_metrics_server()\n"
+            "child = multiprocessing.get_context('fork').Process(target=lambda: STRAVA_SYNCS.labels('success').inc())\n"
+            "child.start(); child.join()\n"
+            "mark_metrics_process_dead(pid=child.pid)\n"
+            "url = f\"http://127.0.0.1:{os.environ['WORKER_METRICS_PORT']}/metrics\"\n"
+            "print(urllib.request.urlopen(url).read().decode())\n"
+        )
+        port = free_port()
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            env = dict(os.environ, WORKER_METRICS_PORT=str(port), PROMETHEUS_MULTIPROC_DIR=metrics_dir)
+            result = subprocess.run(
+                [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+                capture_output=True, text=True, timeout=60,
+            )
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('strava_syncs_total{outcome="success"} 1.0', result.stdout)
+
+
+class BenchmarkTests(TestCase):
+    def test_run_benchmarks_reports_every_case(self):
+        from dashboard.benchmarks import run_benchmarks
+
+        report = run_benchmarks(users=3, weeks=8, density='sparse', activities=20, repeat=2)
+
+        self.assertEqual(set(report['results']), {'acwr', 'dashboard_cold', 'dashboard_warm', 'initial_fetch'})
+        self.assertEqual(report['results']['acwr']['queries'], 0)
+        self.assertEqual(report['results']['dashboard_warm']['queries'], 0)
+
+    def test_compare_flags_slower_p50_and_more_queries(self):
+        from dashboard.benchmarks import compare
+
+        baseline = {'results': {'acwr': {'p50': 1.0, 'queries': 0}, 'dashboard_cold': {'p50': 2.0, 'queries': 1}}}
+        report = {'results': {'acwr': {'p50': 1.1, 'queries': 0}, 'dashboard_cold': {'p50': 3.0, 'queries': 2}}}
+
+        self.assertEqual(len(compare(report, baseline, tolerance=0.25)), 2)
+        self.assertEqual(compare(report, baseline, tolerance=1.0), ['dashboard_cold: 2 queries vs baseline 1'])
+
+
+class DashboardRefreshTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(firebase_uid='refresh_user', strava_refresh_token='refresh')
+        self.client.force_login(self.user)
+        self.url = reverse('dashboard:index')
+
+    def test_stale_data_queues_one_refresh_for_many_tabs(self):
+        with mock.patch('strava_integration.tasks.update_strava_data_task.apply_async') as apply_async:
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+
+        self.assertEqual(apply_async.call_count, 1)
+        self.assertTrue(first.context['refreshing'])
+        self.assertFalse(second.context['refreshing'])
+        self.assertContains(first, 'Not synced yet')
+
+    def test_fresh_data_is_served_without_refresh(self):
+        User.objects.filter(pk=self.user.pk).update(strava_synced_at=timezone.now() - timedelta(minutes=5))
+        with mock.patch('strava_integration.tasks.update_strava_data_task.apply_async') as apply_async:
+            response = self.client.get(self.url)
+
+        apply_async.assert_not_called()
+        self.assertContains(response, 'Last synced 5')
+
+    def test_finished_sync_records_time_and_allows_next_refresh(self):
+        from strava_integration.services import StravaService
+
+        with mock.patch.object(StravaService, 'sync_recent_activities'):
+            self.client.get(self.url)
+
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.strava_synced_at)
+        with self.settings(STRAVA_STALE_AFTER_SECONDS=0), \
+                mock.patch('strava_integration.tasks.update_strava_data_task.apply_async') as apply_async:
+            self.client.get(self.url)
+        apply_async.assert_called_once_with((self.user.pk,), {'priority': 'interactive'}, countdown=0)
+
+    def test_syncing_banner_only_for_first_import_and_lost_syncs_expire(self):
+        from users.models import StravaSyncStatus
+
+        now = timezone.now()
+        User.objects.filter(pk=self.user.pk).update(
+            strava_sync_status=StravaSyncStatus.SYNCING, strava_sync_started_at=now - timedelta(minutes=1),
+        )
+        with mock.patch('strava_integration.tasks.update_strava_data_task.apply_async') as apply_async:
+            self.assertContains(self.client.get(self.url), 'Syncing your Strava activities')
+
+            # A routine sync runs quietly
+            User.objects.filter(pk=self.user.pk).update(strava_synced_at=now - timedelta(hours=1))
+            self.assertNotContains(self.client.get(self.url), 'Syncing your Strava activities')
+            apply_async.assert_not_called()
+
+            # The worker died mid-sync: the status is stale and a new refresh goes out
+            User.objects.filter(pk=self.user.pk).update(strava_sync_started_at=now - timedelta(hours=1))
+            response = self.client.get(self.url)
+        self.assertTrue(response.context['refreshing'])
+        apply_async.assert_called_once()
+
+
+class AsyncDashboardTests(TestCase):
+    def test_asgi_middleware_chain_stays_async(self):
+        import logging
+        from django.core.handlers.asgi import ASGIHandler
+
+        with self.assertLogs('django.request', 'DEBUG') as logs:
+            logging.getLogger('django.request').debug('Loading middleware')
+            ASGIHandler()
+
+        # Any sync-only middleware would push every async view below it onto a thread
+        self.assertEqual([line for line in logs.output if 'adapted' in line], [])
+
+    async def test_index_under_asgi_records_queries(self):
+        from asgiref.sync import sync_to_async
+        from prometheus_client import REGISTRY
+
+        user = await sync_to_async(User.objects.create_user)(firebase_uid='async_dashboard_user')
+        await sync_to_async(self.async_client.force_login)(user)
+        before = REGISTRY.get_sample_value('http_request_db_queries_sum', {'view': 'dashboard:index'}) or 0
+
+        with mock.patch('strava_integration.tasks.update_strava_data_task.apply_async'):
+            response = await self.async_client.get(reverse('dashboard:index'))
+
+        self.assertContains(response, 'Connect with Strava')
+        self.assertGreater(REGISTRY.get_sample_value('http_request_db_queries_sum', {'view': 'dashboard:index'}), before)
+
+    async def test_index_redirects_anonymous_users_to_login(self):
+        response = await self.async_client.get(reverse('dashboard:index'))
+
+        self.assertRedirects(response, f"{reverse('users:login')}?next=/", fetch_redirect_response=False)
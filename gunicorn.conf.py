@@ -0,0 +1,37 @@
+# Picked up automatically by gunicorn from the working directory.
+import os
+import shutil
+import tempfile
+
+# Sync workers by default. WEB_ASGI=True switches to uvicorn ASGI workers,
+# which serve many more concurrent Strava callbacks but are slower on the
+# dashboard, the busiest page (compare with `manage.py benchmark_servers`).
+if os.getenv('WEB_ASGI', 'False') == 'True':
+    wsgi_app = 'core.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'core.wsgi:application'
+
+# Load Django in the master so workers fork with it already imported
+preload_app = True
+
+# Workers write metrics here and /metrics merges them. Must be set before
+# prometheus_client is imported, and emptied so dead workers from a previous
+# run don't linger.
+_metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'runscore-metrics'),
+)
+shutil.rmtree(_metrics_dir, ignore_errors=True)
+os.makedirs(_metrics_dir)
+
+
+def when_ready(server):
+    from users.firebase_auth import warm_up
+
+    warm_up()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
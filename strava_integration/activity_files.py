@@ -0,0 +1,630 @@
+"""
+Activity import from GPX, TCX and FIT files.
+
+An alternative to the Strava API for getting a user's history in: files can
+be uploaded, or a Strava bulk export (the zip itself or the unpacked
+directory) imported with ``manage.py import_activity_files``. None of it
+costs API quota.
+
+Files are read incrementally: GPX and TCX with ``iterparse``, dropping each
+trackpoint as soon as it has been measured, and FIT one record at a time,
+so a long track is never held in memory as a whole. Each activity becomes a
+Strava-shaped payload and goes through the same upsert and weekly rollup as
+an API sync, so weeks follow the same Monday 3am rule.
+
+Activities in a Strava export (files in its ``activities`` directory, next
+to ``activities.csv``) are named by their Strava id, which is kept so a
+later API sync updates them rather than adding duplicates. Other files
+get a stable negative id from the user and start time, so importing the
+same file twice changes nothing. A negative id marks an activity as coming
+from a file: syncs never delete it as missing from Strava, and it gives way
+to a Strava activity with the same start time, whichever arrives first.
+
+Uploads are parsed inside the web request, so ``import_uploaded_files``
+enforces the ACTIVITY_IMPORT_MAX_* settings. Larger exports go through the
+management command.
+"""
+import gzip
+import hashlib
+import math
+import os
+import re
+import struct
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import partial
+from itertools import islice
+
+# File type names for activity types, lower-cased without spaces or underscores, mapped to Strava's
+SPORT_TYPES = {
+    'run': 'Run', 'running': 'Run', 'trailrunning': 'Run', 'treadmillrunning': 'Run', '9': 'Run',
+    'virtualrun': 'VirtualRun',
+    'ride': 'Ride', 'biking': 'Ride', 'cycling': 'Ride', '1': 'Ride',
+    'walk': 'Walk', 'walking': 'Walk',
+    'hike': 'Hike', 'hiking': 'Hike',
+    'swim': 'Swim', 'swimming': 'Swim',
+}
+
+# Mean Earth radius in meters, for distances between GPX trackpoints
+EARTH_RADIUS = 6371008.8
+
+# FIT timestamps count seconds from here
+FIT_EPOCH = datetime(1989, 12, 31, tzinfo=dt_timezone.utc)
+
+# FIT messages read, by global message number, and the fields read from each by field number
+FIT_SESSION = 18
+FIT_ACTIVITY = 34
+FIT_FIELDS = {
+    FIT_SESSION: {2: 'start_time', 5: 'sport', 6: 'sub_sport', 9: 'total_distance'},
+    FIT_ACTIVITY: {253: 'timestamp', 5: 'local_timestamp'},
+}
+
+# FIT sport and sub-sport enums
+FIT_SPORTS = {1: 'Run', 2: 'Ride', 5: 'Swim', 11: 'Walk', 17: 'Hike'}
+FIT_VIRTUAL_ACTIVITY = 58
+
+# struct formats for the unsigned field sizes we decode
+FIT_UNSIGNED = {1: 'B', 2: 'H', 4: 'I'}
+
+# What a corrupt or truncated file can raise while being parsed
+PARSE_ERRORS = (ValueError, TypeError, OSError, EOFError, ET.ParseError, zipfile.BadZipFile, zlib.error, struct.error)
+
+# Files parsed per process pool task
+BATCH_SIZE = 50
+
+
+def parse_activity_file(name, stream, budget=None):
+    """
+    Parse the activities in one binary ``stream``, picking the format from ``name``.
+
+    ``.gz`` files are decompressed on the fly. A ``_ReadBudget`` caps the
+    bytes read after decompression.
+
+    Returns:
+        list: dicts with 'type', 'start_date' (aware, UTC), 'start_date_local'
+        (naive, or None when the file only has UTC times) and 'distance' in meters
+    """
+    if name.lower().endswith('.gz'):
+        stream = gzip.GzipFile(fileobj=stream)
+        name = name[:-3]
+    parser = PARSERS.get(os.path.splitext(name)[1].lower())
+    if parser is None:
+        raise ValueError(f'Unsupported file type: {name}')
+    if budget is not None:
+        stream = _BudgetedStream(stream, budget)
+    return parser(stream)
+
+
+def parse_gpx(stream):
+    """Parse a GPX file's tracks; distance is measured between trackpoints."""
+    activities = []
+    activity = previous = None
+    for event, name, elem, parent in _walk(stream, discard={'trkpt', 'trk'}):
+        if event == 'start':
+            if name == 'trk':
+                activity = {'type': None, 'start_date': None, 'start_date_local': None, 'distance': 0.0}
+            elif name == 'trkseg':
+                # Don't count the gap between segments, where recording was paused
+                previous = None
+            continue
+
+        if name == 'type' and parent == 'trk':
+            activity['type'] = elem.text
+        elif name == 'trkpt':
+            point = (float(elem.get('lat')), float(elem.get('lon')))
+            if previous:
+                activity['distance'] += _haversine(previous, point)
+            previous = point
+            if activity['start_date'] is None:
+                for child in elem:
+                    if child.tag.rpartition('}')[2] == 'time':
+                        activity['start_date'] = _parse_time(child.text)
+        elif name == 'trk' and activity['start_date']:
+            activity['type'] = _sport_type(activity['type'])
+            activities.append(activity)
+    return activities
+
+
+def parse_tcx(stream):
+    """Parse a TCX file's activities; distance is the sum of their laps'."""
+    activities = []
+    activity = None
+    for event, name, elem, parent in _walk(stream, discard={'Trackpoint', 'Lap', 'Activity'}):
+        if event == 'start':
+            if name == 'Activity':
+                activity = {
+                    'type': elem.get('Sport'), 'start_date': None, 'start_date_local': None, 'distance': 0.0,
+                }
+                # Fallback for laps without a distance: the furthest trackpoint
+                track_distance = 0.0
+            continue
+
+        if name == 'Id' and parent == 'Activity':
+            activity['start_date'] = _parse_time(elem.text)
+        elif name == 'DistanceMeters' and parent == 'Lap':
+            activity['distance'] += float(elem.text)
+        elif name == 'DistanceMeters' and parent == 'Trackpoint':
+            track_distance = max(track_distance, float(elem.text))
+        elif name == 'Lap' and activity['start_date'] is None and elem.get('StartTime'):
+            activity['start_date'] = _parse_time(elem.get('StartTime'))
+        elif name == 'Activity' and activity['start_date']:
+            activity['type'] = _sport_type(activity['type'])
+            activity['distance'] = activity['distance'] or track_distance
+            activities.append(activity)
+    return activities
+
+
+def parse_fit(stream):
+    """
+    Parse a FIT file's sessions, reading one record at a time.
+
+    Only the session and activity messages are decoded; every other record
+    is read past. The activity message's local timestamp gives the local
+    start time.
+    """
+    consumed = 0
+
+    def read(size):
+        nonlocal consumed
+        data = stream.read(size)
+        if len(data) != size:
+            raise ValueError('Truncated FIT file')
+        consumed += size
+        return data
+
+    header_size = read(1)[0]
+    header = read(max(header_size - 1, 11))
+    if header_size < 12 or header[7:11] != b'.FIT':
+        raise ValueError('Not a FIT file')
+    data_size = struct.unpack('<I', header[3:7])[0]
+    consumed = 0
+
+    definitions = {}
+    sessions = []
+    activity = {}
+    while consumed < data_size:
+        record_header = read(1)[0]
+        if record_header & 0x80:
+            # Compressed timestamp header; always a data message
+            local_type = (record_header >> 5) & 0x03
+        elif record_header & 0x40:
+            local_type = record_header & 0x0F
+            definitions[local_type] = _read_fit_definition(read, developer=record_header & 0x20)
+            continue
+        else:
+            local_type = record_header & 0x0F
+
+        try:
+            global_number, size, decoders = definitions[local_type]
+        except KeyError:
+            raise ValueError(f'FIT data message for undefined local type {local_type}')
+        data = read(size)
+        if not decoders:
+            continue
+        values = {}
+        for offset, fmt, invalid, field in decoders:
+            value = struct.unpack_from(fmt, data, offset)[0]
+            if value != invalid:
+                values[field] = value
+        if global_number == FIT_SESSION:
+            sessions.append(values)
+        else:
+            activity.update(values)
+
+    local_offset = None
+    if 'timestamp' in activity and 'local_timestamp' in activity:
+        local_offset = timedelta(seconds=activity['local_timestamp'] - activity['timestamp'])
+
+    activities = []
+    for session in sessions:
+        if 'start_time' not in session:
+            continue
+        start = FIT_EPOCH + timedelta(seconds=session['start_time'])
+        sport = FIT_SPORTS.get(session.get('sport'), 'Workout')
+        if sport == 'Run' and session.get('sub_sport') == FIT_VIRTUAL_ACTIVITY:
+            sport = 'VirtualRun'
+        activities.append({
+            'type': sport,
+            'start_date': start,
+            'start_date_local': (start + local_offset).replace(tzinfo=None) if local_offset is not None else None,
+            # Stored in centimeters
+            'distance': session.get('total_distance', 0) / 100,
+        })
+    return activities
+
+
+PARSERS = {'.gpx': parse_gpx, '.tcx': parse_tcx, '.fit': parse_fit}
+
+
+def is_activity_file(name):
+    """Whether ``name`` looks like a file we can parse."""
+    name = name.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return os.path.splitext(name)[1] in PARSERS
+
+
+def iter_activity_files(paths):
+    """
+    Find the activity files under ``paths``: files, directories (searched
+    recursively) and zip archives such as a Strava bulk export. Anything
+    else is skipped.
+
+    Yields:
+        tuple: (zip archive path or None, file path or archive member name)
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    yield from _path_sources(os.path.join(root, name))
+        else:
+            yield from _path_sources(path)
+
+
+def parse_batch(batch):
+    """
+    Parse a batch of files from one place. Runs in worker processes, so it
+    never touches the database.
+
+    Args:
+        batch: (zip archive path or None, list of file paths or member names)
+
+    Returns:
+        list: (label, activities, error message or None) per file
+    """
+    archive_path, names = batch
+    if archive_path is None:
+        return [
+            _parse_one(name, name, partial(open, mode='rb'), _in_strava_export(name, os.path.isfile))
+            for name in names
+        ]
+    with zipfile.ZipFile(archive_path) as archive:
+        members = set(archive.namelist())
+        return [
+            _parse_one(name, f'{archive_path}:{name}', archive.open, _in_strava_export(name, members.__contains__))
+            for name in names
+        ]
+
+
+def import_activity_files(user, paths, workers=1, tz=None):
+    """
+    Import every activity file under ``paths`` for ``user``.
+
+    With more than one worker, files are parsed across a process pool while
+    this process writes the results to the database in chunks as they arrive.
+
+    Args:
+        user: owner of the activities
+        paths: files, directories and zip archives
+        workers: parsing processes
+        tz: time zone for files that only record UTC times (GPX, TCX); defaults to UTC
+
+    Returns:
+        dict: 'files' and 'activities' imported, 'duplicates' of activities
+        already synced from Strava, 'weeks' re-totalled and 'errors' mapping
+        each file that couldn't be read to the problem
+    """
+    batches = _batches(iter_activity_files(paths), BATCH_SIZE)
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(workers) as pool:
+            results = (result for batch in pool.map(parse_batch, batches) for result in batch)
+            return _store(user, results, tz)
+    return _store(user, (result for batch in batches for result in parse_batch(batch)), tz)
+
+
+class UploadTooLarge(ValueError):
+    """Uploaded files break one of the ACTIVITY_IMPORT_MAX_* limits."""
+
+
+def import_uploaded_files(user, uploads, tz=None):
+    """
+    Import uploaded files for ``user``; zip archives are opened and every
+    activity file inside is imported.
+
+    Returns:
+        dict: as for import_activity_files
+
+    Raises:
+        UploadTooLarge: if the uploads have too many activity files or too
+            many bytes, before or after unzipping. Nothing is imported then.
+            Gzipped files only show their size as they are read, so one
+            that pushes the total over the limit is reported in 'errors'.
+    """
+    from django.conf import settings
+
+    _check_upload_limits(uploads)
+    budget = _ReadBudget(settings.ACTIVITY_IMPORT_MAX_UNPACKED_BYTES)
+    return _store(user, _parse_uploads(uploads, budget), tz)
+
+
+def _check_upload_limits(uploads):
+    """Raise UploadTooLarge if ``uploads`` break a limit, going by zip archives' listed sizes."""
+    from django.conf import settings
+
+    files = packed = unpacked = 0
+    for upload in uploads:
+        packed += upload.size
+        if not upload.name.lower().endswith('.zip'):
+            files += 1
+            unpacked += upload.size
+            continue
+        try:
+            with zipfile.ZipFile(upload) as archive:
+                members = [info for info in archive.infolist() if not info.is_dir() and is_activity_file(info.filename)]
+        except zipfile.BadZipFile:
+            # Reported in 'errors' when the upload is parsed
+            continue
+        files += len(members)
+        # Reading a member stops at its listed size, so this can be trusted
+        unpacked += sum(info.file_size for info in members)
+
+    if files > settings.ACTIVITY_IMPORT_MAX_FILES:
+        raise UploadTooLarge(f'At most {settings.ACTIVITY_IMPORT_MAX_FILES} activity files per upload')
+    if packed > settings.ACTIVITY_IMPORT_MAX_UPLOAD_BYTES:
+        raise UploadTooLarge(f'At most {settings.ACTIVITY_IMPORT_MAX_UPLOAD_BYTES} bytes per upload')
+    if unpacked > settings.ACTIVITY_IMPORT_MAX_UNPACKED_BYTES:
+        raise UploadTooLarge(f'At most {settings.ACTIVITY_IMPORT_MAX_UNPACKED_BYTES} bytes per upload once unzipped')
+
+
+def _parse_uploads(uploads, budget=None):
+    for upload in uploads:
+        if not upload.name.lower().endswith('.zip'):
+            # A single file has no export layout around it, so it never keeps a Strava id
+            yield _parse_one(upload.name, upload.name, lambda name: upload, budget=budget)
+            continue
+        try:
+            archive = zipfile.ZipFile(upload)
+        except zipfile.BadZipFile as e:
+            yield upload.name, [], str(e)
+            continue
+        with archive:
+            members = set(archive.namelist())
+            for info in archive.infolist():
+                if not info.is_dir() and is_activity_file(info.filename):
+                    yield _parse_one(
+                        info.filename, f'{upload.name}:{info.filename}', archive.open,
+                        _in_strava_export(info.filename, members.__contains__), budget,
+                    )
+
+
+def _store(user, results, tz=None, chunk_size=200):
+    """Write parsed files' activities for ``user`` and re-total their weeks."""
+    from .models import Activity
+    from .services import StravaService
+
+    stats = {'files': 0, 'activities': 0, 'duplicates': 0, 'weeks': 0, 'errors': {}}
+
+    def payloads():
+        for label, activities, error in results:
+            if error:
+                stats['errors'][label] = error
+                continue
+            stats['files'] += 1
+            for activity in activities:
+                yield _payload(user, activity, tz)
+
+    def new_to_user(payloads):
+        payloads = iter(payloads)
+        while True:
+            chunk = list(islice(payloads, chunk_size))
+            if not chunk:
+                return
+            # A file name must not be able to claim an activity another user has
+            taken = set(
+                Activity.objects.filter(strava_id__in=[payload['id'] for payload in chunk])
+                .exclude(user=user).values_list('strava_id', flat=True)
+            )
+            # A file without a Strava id may be a run the user already has from Strava
+            on_strava = set(
+                Activity.objects.filter(
+                    user=user, strava_id__gt=0,
+                    start_date__in=[StravaService._parse_start_date(p) for p in chunk if p['id'] < 0],
+                ).values_list('start_date', flat=True)
+            )
+            for payload in chunk:
+                if payload['id'] in taken:
+                    stats['errors'][str(payload['id'])] = 'Activity belongs to another user'
+                elif payload['id'] < 0 and StravaService._parse_start_date(payload) in on_strava:
+                    stats['duplicates'] += 1
+                else:
+                    stats['activities'] += 1
+                    yield payload
+
+    weeks = StravaService().import_activities(user, new_to_user(payloads()))
+    stats['weeks'] = len(weeks)
+    return stats
+
+
+def _payload(user, activity, tz=None):
+    """Turn a parsed activity into a Strava activity payload, keeping the Strava id of an export file."""
+    start = activity['start_date']
+    local = activity['start_date_local']
+    if local is None:
+        local = start.astimezone(tz or dt_timezone.utc).replace(tzinfo=None)
+    return {
+        'id': activity.get('id') or _file_activity_id(user, start),
+        'type': activity['type'],
+        'start_date': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'start_date_local': local.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'distance': round(activity['distance'], 1),
+    }
+
+
+def _strava_id(name):
+    """The Strava id in a bulk export file name like ``activities/1234567.fit.gz``, if there is one."""
+    stem = os.path.basename(name).split('.', 1)[0]
+    return int(stem) if stem.isdigit() and 0 < int(stem) < 2 ** 63 else None
+
+
+def _in_strava_export(name, exists):
+    """
+    Whether ``name`` is in a Strava bulk export's ``activities`` directory,
+    going by whether ``exists`` finds the export's ``activities.csv`` next to it.
+
+    Other exports (Garmin, Coros) name files by numbers of their own, which
+    must not be taken for Strava ids.
+    """
+    folder = os.path.dirname(name)
+    return os.path.basename(folder) == 'activities' and exists(os.path.join(os.path.dirname(folder), 'activities.csv'))
+
+
+def _file_activity_id(user, start):
+    """A stable id for an activity from a file without a Strava id. Negative, so it can't clash with Strava's."""
+    digest = hashlib.sha1(f'{user.pk}:{start.isoformat()}'.encode()).digest()
+    return -(int.from_bytes(digest[:7], 'big') + 1)
+
+
+def _path_sources(path):
+    if path.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and is_activity_file(info.filename):
+                    yield path, info.filename
+    elif is_activity_file(path):
+        yield None, path
+
+
+def _batches(sources, size):
+    """Group consecutive sources from the same place into parse_batch batches of up to ``size`` files."""
+    archive, names = None, []
+    for source_archive, name in sources:
+        if names and (source_archive != archive or len(names) == size):
+            yield archive, names
+            names = []
+        archive = source_archive
+        names.append(name)
+    if names:
+        yield archive, names
+
+
+def _parse_one(name, label, opener, in_export=False, budget=None):
+    try:
+        with opener(name) as stream:
+            activities = parse_activity_file(name, stream, budget)
+    except PARSE_ERRORS as e:
+        return label, [], f'{type(e).__name__}: {e}'
+    if in_export and len(activities) == 1:
+        activities[0]['id'] = _strava_id(name)
+    return label, activities, None
+
+
+def _walk(stream, discard):
+    """
+    Parse XML incrementally, yielding (event, local name, element, parent's local name).
+
+    Elements named in ``discard`` are removed from the tree once their end
+    event has been handled, so memory stays flat however long the file.
+    """
+    stack = []
+    for event, elem in ET.iterparse(_XMLStream(stream), events=('start', 'end')):
+        name = elem.tag.rpartition('}')[2]
+        if event == 'start':
+            yield event, name, elem, stack[-1][0] if stack else None
+            stack.append((name, elem))
+            continue
+        stack.pop()
+        parent_name, parent = stack[-1] if stack else (None, None)
+        yield event, name, elem, parent_name
+        if name in discard and parent is not None:
+            parent.remove(elem)
+
+
+class _XMLStream:
+    """
+    Drops whitespace before the XML declaration, which Strava's TCX exports
+    have and the XML parser rejects.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.started = False
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        while not self.started and data:
+            data = data.lstrip()
+            if data:
+                self.started = True
+            else:
+                data = self.stream.read(size)
+        return data
+
+
+class _ReadBudget:
+    """Bytes the parsers may still read, after decompression, across every file of an upload."""
+
+    def __init__(self, limit):
+        self.left = limit
+
+
+class _BudgetedStream:
+    """Charges what is read from ``stream`` to a ``_ReadBudget``, failing once it runs out."""
+
+    def __init__(self, stream, budget):
+        self.stream = stream
+        self.budget = budget
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.budget.left -= len(data)
+        if self.budget.left < 0:
+            raise ValueError('Upload too large once decompressed')
+        return data
+
+
+def _read_fit_definition(read, developer):
+    """
+    Read a FIT definition message's content.
+
+    Returns:
+        tuple: (global message number, data message size, decoders) where
+        decoders are (offset, struct format, invalid value, field name) for
+        the fields in FIT_FIELDS
+    """
+    content = read(5)
+    endian = '>' if content[1] else '<'
+    global_number = struct.unpack(endian + 'H', content[2:4])[0]
+    fields = read(3 * content[4])
+    wanted = FIT_FIELDS.get(global_number, {})
+
+    size = 0
+    decoders = []
+    for i in range(0, len(fields), 3):
+        number, field_size = fields[i], fields[i + 1]
+        if number in wanted and field_size in FIT_UNSIGNED:
+            invalid = (1 << (8 * field_size)) - 1
+            decoders.append((size, endian + FIT_UNSIGNED[field_size], invalid, wanted[number]))
+        size += field_size
+
+    if developer:
+        developer_fields = read(3 * read(1)[0])
+        size += sum(developer_fields[i + 1] for i in range(0, len(developer_fields), 3))
+    return global_number, size, decoders
+
+
+def _parse_time(text):
+    """Parse an XML timestamp into an aware UTC datetime."""
+    # fromisoformat only takes 3 or 6 fraction digits and no 'Z'
+    text = re.sub(r'\.\d+', '', text.strip()).replace('Z', '+00:00')
+    moment = datetime.fromisoformat(text)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=dt_timezone.utc)
+    return moment.astimezone(dt_timezone.utc)
+
+
+def _sport_type(name):
+    key = re.sub(r'[\s_]', '', (name or '').lower())
+    return SPORT_TYPES.get(key, 'Workout')
+
+
+def _haversine(a, b):
+    """Great-circle distance in meters between two (lat, lon) points."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(h))
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class StravaIntegrationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'strava_integration'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,201 @@
+"""
+Bulk re-sync of every connected user.
+
+Users with a Strava refresh token (optionally one shard of them) are synced
+on a bounded thread pool, since the work is almost all waiting on Strava.
+Calls go through the shared rate-limit governor at background priority, and
+an optional per-run budget caps how many calls the whole run may make.
+Finished and failed users are checkpointed to a JSON file so an interrupted
+run resumes where it stopped.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models.functions import Mod
+
+from .client import StravaClient
+from .ratelimit import BACKGROUND, StravaRateLimitError, get_governor
+
+# Seconds between checkpoint writes; a crash re-syncs at most this much work
+CHECKPOINT_INTERVAL = 5
+
+
+class BudgetExhausted(Exception):
+    """Raised when the run has used its whole API call budget."""
+
+
+class CallBudget:
+    """Governor wrapper that also caps the number of calls made by one run."""
+
+    def __init__(self, governor, limit=None):
+        self.governor = governor
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, priority=BACKGROUND):
+        with self._lock:
+            if self.limit is not None and self.used >= self.limit:
+                raise BudgetExhausted(f"API budget of {self.limit} calls used up")
+            self.used += 1
+        try:
+            self.governor.acquire(priority)
+        except StravaRateLimitError:
+            with self._lock:
+                self.used -= 1
+            raise
+
+    def observe(self, response, priority=BACKGROUND):
+        self.governor.observe(response, priority)
+
+
+class Checkpoint:
+    """Finished and failed user ids, persisted to ``path`` (if given)."""
+
+    def __init__(self, path=None, resume=True):
+        self.path = path
+        self.done = set()
+        self.failed = {}
+        self._lock = threading.Lock()
+        self._saved_at = time.monotonic()
+        if resume and path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.done = set(state.get('done', []))
+            self.failed = {int(user_id): error for user_id, error in state.get('failed', {}).items()}
+
+    def mark_done(self, user_id):
+        with self._lock:
+            self.done.add(user_id)
+            self.failed.pop(user_id, None)
+        self._save_if_due()
+
+    def mark_failed(self, user_id, error):
+        with self._lock:
+            self.failed[user_id] = error
+        self._save_if_due()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            state = {'done': sorted(self.done), 'failed': self.failed}
+            self._saved_at = time.monotonic()
+        # Write then rename so an interrupted save never leaves a torn file
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def _save_if_due(self):
+        if time.monotonic() - self._saved_at >= CHECKPOINT_INTERVAL:
+            self.save()
+
+
+def connected_user_ids(shard=0, num_shards=1):
+    """Ids of users with a Strava refresh token in the given shard, in id order."""
+    if not 0 <= shard < num_shards:
+        raise ValueError(f"shard must be between 0 and {num_shards - 1}")
+
+    User = get_user_model()
+    users = User.objects.exclude(strava_refresh_token__isnull=True).exclude(strava_refresh_token='')
+    if num_shards > 1:
+        users = users.annotate(shard=Mod('pk', num_shards)).filter(shard=shard)
+    return list(users.order_by('pk').values_list('pk', flat=True))
+
+
+def backfill(user_ids, weeks=6, concurrency=4, budget=None, checkpoint=None, max_wait=900):
+    """
+    Re-sync the last ``weeks`` weeks for every user in ``user_ids``.
+
+    Args:
+        user_ids: users to sync
+        weeks: weeks re-fetched per user
+        concurrency: users synced at once
+        budget: most Strava calls this run may make (None for no cap)
+        checkpoint: Checkpoint of a previous run to resume; users it marks
+            done are skipped
+        max_wait: longest rate-limit pause, in seconds, a worker sits out
+            before giving up on a user
+
+    Returns:
+        dict: user counts (users, synced, skipped), failures by user id,
+        calls made, elapsed seconds and whether the budget ran out
+    """
+    from .services import StravaService
+
+    checkpoint = checkpoint or Checkpoint()
+    calls = CallBudget(get_governor(), budget)
+    service = StravaService(priority=BACKGROUND)
+    service.http = StravaClient(governor=calls)
+    User = get_user_model()
+    stop = threading.Event()
+
+    def sync(user_id):
+        try:
+            user = User.objects.get(pk=user_id)
+            while True:
+                try:
+                    service.refresh_recent_weeks(user, weeks=weeks)
+                    return
+                except StravaRateLimitError as e:
+                    if e.retry_after > max_wait or stop.is_set():
+                        raise
+                    # Sit out the window; the governor shares it with everyone else
+                    stop.wait(e.retry_after)
+        finally:
+            # Each worker thread has its own connection
+            connection.close()
+
+    pending = [user_id for user_id in user_ids if user_id not in checkpoint.done]
+    stats = {
+        'users': len(user_ids),
+        'skipped': len(user_ids) - len(pending),
+        'synced': 0,
+        'failures': {},
+        'budget_exhausted': False,
+    }
+    started = time.monotonic()
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    in_flight = {}
+    queue = iter(pending)
+    try:
+        while True:
+            # Keep a bounded number of users queued rather than the whole list
+            while not stop.is_set() and len(in_flight) < concurrency * 2:
+                user_id = next(queue, None)
+                if user_id is None:
+                    break
+                in_flight[executor.submit(sync, user_id)] = user_id
+            if not in_flight:
+                break
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                user_id = in_flight.pop(future)
+                try:
+                    future.result()
+                except BudgetExhausted:
+                    # Not this user's fault; leave them for the next run
+                    stats['budget_exhausted'] = True
+                    stop.set()
+                except Exception as e:
+                    stats['failures'][user_id] = f'{type(e).__name__}: {e}'
+                    checkpoint.mark_failed(user_id, stats['failures'][user_id])
+                else:
+                    stats['synced'] += 1
+                    checkpoint.mark_done(user_id)
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        checkpoint.save()
+
+    stats['seconds'] = time.monotonic() - started
+    stats['calls'] = calls.used
+    return stats
@@ -0,0 +1,115 @@
+"""
+Batch ACWR computation for the whole user base.
+
+MileageLog rows for every user (or one shard of users) are streamed in a
+single ordered query, scored per user with the sliding-window engine and
+bulk-written to WeeklyScore in chunked transactions.
+"""
+import time
+from datetime import timedelta
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models.functions import Mod
+
+from .scoring import CHRONIC_WEEKS, bump_data_versions, iter_weekly_scores
+
+
+def _score_user(user_id, logs):
+    """Build WeeklyScore rows for one user from their (week_start, mileage) logs."""
+    from .models import WeeklyScore
+
+    mileage_by_week = {}
+    for week_start, mileage in logs:
+        mileage_by_week[week_start] = mileage_by_week.get(week_start, 0.0) + mileage
+
+    if not mileage_by_week:
+        return []
+
+    # A week's mileage affects its own score and the next 4 chronic windows;
+    # beyond that every value is zero and no row is needed.
+    first_week = min(mileage_by_week)
+    last_week = max(mileage_by_week) + timedelta(weeks=CHRONIC_WEEKS)
+
+    return [
+        WeeklyScore(
+            user_id=user_id,
+            week_start_date=score['week_start'],
+            acute_mileage=score['acute'],
+            chronic_mileage=score['chronic'],
+            critical_score=score['acwr'],
+            recommended_capacity=score['recommended_capacity'],
+        )
+        for score in iter_weekly_scores(mileage_by_week, first_week, last_week)
+    ]
+
+
+def _write_scores(user_ids, rows, batch_size):
+    """Replace the WeeklyScore rows of ``user_ids`` with ``rows`` in one transaction."""
+    from .models import WeeklyScore
+
+    with transaction.atomic():
+        WeeklyScore.objects.filter(user_id__in=user_ids).delete()
+        WeeklyScore.objects.bulk_create(rows, batch_size=batch_size)
+        bump_data_versions(user_ids)
+
+
+def compute_all_scores(shard=0, num_shards=1, batch_size=2000):
+    """
+    Recompute WeeklyScore for every user in a shard.
+
+    Users are assigned to shards by ``user_id % num_shards``, so several
+    workers can split the user base without overlapping.
+
+    Args:
+        shard: index of the shard to process
+        num_shards: total number of shards
+        batch_size: approximate number of rows written per transaction
+
+    Returns:
+        dict: ``users``, ``weeks`` and ``seconds`` for the run
+    """
+    from .models import MileageLog, WeeklyScore
+
+    if not 0 <= shard < num_shards:
+        raise ValueError(f"shard must be between 0 and {num_shards - 1}")
+
+    started = time.monotonic()
+
+    logs = MileageLog.objects.order_by('user_id', 'week_start_date')
+    if num_shards > 1:
+        logs = logs.annotate(shard=Mod('user_id', num_shards)).filter(shard=shard)
+    rows_iter = logs.values_list('user_id', 'week_start_date', 'total_mileage').iterator(chunk_size=batch_size)
+
+    total_users = 0
+    total_weeks = 0
+    pending_users = []
+    pending_rows = []
+
+    for user_id, user_logs in groupby(rows_iter, key=lambda row: row[0]):
+        rows = _score_user(user_id, ((week, mileage) for _, week, mileage in user_logs))
+        pending_users.append(user_id)
+        pending_rows.extend(rows)
+        total_users += 1
+        total_weeks += len(rows)
+
+        if len(pending_rows) >= batch_size:
+            _write_scores(pending_users, pending_rows, batch_size)
+            pending_users, pending_rows = [], []
+
+    if pending_users:
+        _write_scores(pending_users, pending_rows, batch_size)
+
+    # Users whose logs are all gone have nothing to recompute from
+    orphaned = WeeklyScore.objects.exclude(user_id__in=MileageLog.objects.values('user_id'))
+    if num_shards > 1:
+        orphaned = orphaned.annotate(shard=Mod('user_id', num_shards)).filter(shard=shard)
+    orphaned_users = list(orphaned.values_list('user_id', flat=True).distinct())
+    if orphaned_users:
+        _write_scores(orphaned_users, [], batch_size)
+
+    return {
+        'users': total_users,
+        'weeks': total_weeks,
+        'seconds': time.monotonic() - started,
+    }
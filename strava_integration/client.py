@@ -0,0 +1,136 @@
+"""
+Pooled HTTP client for the Strava API.
+
+One ``requests.Session`` per process keeps TLS connections to Strava alive
+between calls. Every request gets a timeout, and 5xx responses or connection
+errors are retried with jittered exponential backoff. Each attempt is
+cleared with the shared rate-limit governor first.
+
+Only GETs are retried after the request may have reached Strava. A POST
+(the OAuth token exchange) is retried only when the connection could not
+be made: authorization codes are single-use and refresh tokens rotate, so
+replaying an exchange Strava already handled would fail or leave us with a
+refresh token it has invalidated.
+"""
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from core.metrics import STRAVA_REQUEST_SECONDS
+
+from .ratelimit import INTERACTIVE, get_governor
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (3.05, 15)
+
+# Retries after the first attempt for 5xx responses and connection errors
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+RETRY_STATUSES = {500, 502, 503, 504}
+
+# Methods safe to repeat after Strava may have handled them
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+# Connections kept open per host
+POOL_SIZE = 20
+
+
+class StravaClient:
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, pool_size=POOL_SIZE,
+                 governor=None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.governor = governor or get_governor()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _record(self, endpoint, status, seconds):
+        STRAVA_REQUEST_SECONDS.labels(endpoint, status).observe(seconds)
+
+    @staticmethod
+    def _never_sent(error):
+        """Whether a request failed before reaching Strava, so even a POST can be retried."""
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        # requests wraps refused or unresolvable connections in MaxRetryError
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff for the given retry attempt."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, url, endpoint=None, priority=INTERACTIVE, **kwargs):
+        """
+        Send a request, retrying 5xx responses and connection errors.
+
+        Non-idempotent methods are only retried when the connection failed.
+
+        Args:
+            method: HTTP method
+            url: full request URL
+            endpoint: label used for latency metrics (defaults to the URL)
+            priority: rate-limit priority, INTERACTIVE or BACKGROUND
+            **kwargs: passed to ``requests.Session.request``
+
+        Returns:
+            requests.Response: the last response received. Raising for
+            status is left to the caller.
+
+        Raises:
+            StravaRateLimitError: if the shared quota is used up or Strava
+                answers 429
+        """
+        endpoint = endpoint or url
+        kwargs.setdefault('timeout', self.timeout)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            self.governor.acquire(priority)
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(endpoint, 'error', time.monotonic() - started)
+                if attempt >= self.max_retries or not (idempotent or self._never_sent(e)):
+                    raise
+            else:
+                self._record(endpoint, response.status_code, time.monotonic() - started)
+                self.governor.observe(response, priority)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries or not idempotent:
+                    return response
+
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide Strava client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = StravaClient()
+    return _client
@@ -0,0 +1,285 @@
+"""
+Local stand-in for the Strava API.
+
+Serves ``/oauth/authorize``, ``/oauth/token``, ``/api/v3/athlete/activities``
+and ``/api/v3/activities/<id>`` for deterministic synthetic athletes, with Strava-style pagination and
+X-RateLimit headers. Latency, 5xx responses and 429s can be injected at a
+configured rate or queued one by one, so sync throughput, retries and
+rate-limit handling can be exercised without touching the real API.
+
+Start it with ``python manage.py fake_strava`` and point STRAVA_API_URL and
+STRAVA_OAUTH_URL at it, or run ``FakeStravaServer`` in-process from tests.
+"""
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from .ratelimit import LONG_WINDOW, SHORT_WINDOW
+from .services import METERS_PER_MILE
+
+# Share of synthetic activities per type; only runs count towards mileage
+ACTIVITY_TYPES = (('Run', 0.75), ('Ride', 0.15), ('VirtualRun', 0.05), ('Walk', 0.05))
+
+TOKEN_LIFETIME = 6 * 60 * 60
+MAX_PER_PAGE = 200
+
+
+class FakeStrava:
+    """Athletes, tokens, quota counters and fault injection behind the fake server."""
+
+    def __init__(self, seed=0, history_weeks=104, activities_per_week=5, latency=0.0,
+                 error_rate=0.0, rate_limit_rate=0.0, short_limit=200, long_limit=2000, now=None):
+        self.seed = seed
+        self.history_weeks = history_weeks
+        self.activities_per_week = activities_per_week
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.short_limit = short_limit
+        self.long_limit = long_limit
+        self.now = now or datetime.now(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+        self.requests = 0
+
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._activities = {}
+        self._injected = []
+        self._usage = {}
+        self._next_athlete = 1
+
+    def activities(self, athlete_id):
+        """Return an athlete's full history, oldest first. The same seed always yields the same history."""
+        if athlete_id not in self._activities:
+            rng = random.Random(f'{self.seed}:{athlete_id}')
+            span = timedelta(weeks=self.history_weeks).total_seconds()
+            types, weights = zip(*ACTIVITY_TYPES)
+            starts = sorted(
+                self.now - timedelta(seconds=rng.uniform(0, span))
+                for _ in range(self.history_weeks * self.activities_per_week)
+            )
+            self._activities[athlete_id] = [
+                self._payload(athlete_id * 10_000_000 + i, rng.choices(types, weights)[0], rng.uniform(2, 14), start)
+                for i, start in enumerate(starts)
+            ]
+        return self._activities[athlete_id]
+
+    def inject(self, status, count=1):
+        """Answer the next ``count`` requests with ``status`` (e.g. 429 or 503)."""
+        with self._lock:
+            self._injected.extend([status] * count)
+
+    def handle(self, method, path, query, form, headers):
+        """
+        Answer one request.
+
+        Returns:
+            tuple: (status, JSON body, extra headers)
+        """
+        if method == 'GET' and path == '/oauth/authorize':
+            # A browser page on Strava, not an API call
+            return self._authorize(query)
+
+        if self.latency:
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+
+        with self._lock:
+            self.requests += 1
+            usage = self._count_call()
+            fault = self._injected.pop(0) if self._injected else None
+            if fault is None and self._rng.random() < self.rate_limit_rate:
+                fault = 429
+            if fault is None and self._rng.random() < self.error_rate:
+                fault = 503
+
+        rate_headers = {
+            'X-RateLimit-Limit': f'{self.short_limit},{self.long_limit}',
+            'X-RateLimit-Usage': f'{usage[0]},{usage[1]}',
+        }
+        if fault is None and (usage[0] > self.short_limit or usage[1] > self.long_limit):
+            fault = 429
+        if fault == 429:
+            return 429, {'message': 'Rate Limit Exceeded'}, rate_headers
+        if fault:
+            return fault, {'message': 'Injected error'}, rate_headers
+
+        if method == 'POST' and path == '/oauth/token':
+            return self._token(form) + (rate_headers,)
+        if method == 'GET' and path == '/api/v3/athlete/activities':
+            return self._list_activities(query, headers) + (rate_headers,)
+        if method == 'GET' and path.startswith('/api/v3/activities/'):
+            return self._get_activity(path.rsplit('/', 1)[1], headers) + (rate_headers,)
+        return 404, {'message': 'Record Not Found'}, {}
+
+    def _count_call(self):
+        """Count a call in the current 15-minute and daily windows and return both totals."""
+        now = time.time()
+        totals = []
+        for length in (SHORT_WINDOW, LONG_WINDOW):
+            key = (length, int(now // length))
+            self._usage[key] = self._usage.get(key, 0) + 1
+            totals.append(self._usage[key])
+        return totals
+
+    def _authorize(self, query):
+        # Every authorization connects a new athlete
+        with self._lock:
+            athlete_id = self._next_athlete
+            self._next_athlete += 1
+        location = f"{query['redirect_uri']}?{urlencode({'code': athlete_id, 'scope': query.get('scope', '')})}"
+        return 302, {}, {'Location': location}
+
+    def _token(self, form):
+        if form.get('grant_type') == 'refresh_token':
+            athlete_id = self._athlete_from_token(form.get('refresh_token'), 'fake-refresh-')
+            if athlete_id is None:
+                return 400, {'message': 'Bad Request', 'errors': [{'field': 'refresh_token', 'code': 'invalid'}]}
+        else:
+            code = form.get('code') or ''
+            # Numeric codes come from /oauth/authorize; anything else maps to a stable athlete
+            athlete_id = int(code) if code.isdigit() else zlib.crc32(code.encode()) % 1_000_000 + 1
+
+        expires_at = int(time.time()) + TOKEN_LIFETIME
+        return 200, {
+            'token_type': 'Bearer',
+            'access_token': f'fake-access-{athlete_id}-{expires_at}',
+            'refresh_token': f'fake-refresh-{athlete_id}',
+            'expires_at': expires_at,
+            'expires_in': TOKEN_LIFETIME,
+            'athlete': {'id': athlete_id},
+        }
+
+    def _list_activities(self, query, headers):
+        token = headers.get('Authorization', '').replace('Bearer ', '', 1)
+        athlete_id = self._athlete_from_token(token, 'fake-access-')
+        if athlete_id is None:
+            return 401, {'message': 'Authorization Error'}
+
+        after = int(query.get('after', 0))
+        before = int(query['before']) if 'before' in query else None
+        page = max(1, int(query.get('page', 1)))
+        per_page = min(MAX_PER_PAGE, int(query.get('per_page', 30)))
+
+        matching = [
+            activity for activity in self.activities(athlete_id)
+            if activity['_ts'] > after and (before is None or activity['_ts'] < before)
+        ]
+        # Like Strava: oldest first when paging forward from `after`, newest first otherwise
+        if 'after' not in query:
+            matching.reverse()
+        chunk = matching[(page - 1) * per_page:page * per_page]
+        return 200, [{k: v for k, v in activity.items() if k != '_ts'} for activity in chunk]
+
+    def _get_activity(self, activity_id, headers):
+        token = headers.get('Authorization', '').replace('Bearer ', '', 1)
+        athlete_id = self._athlete_from_token(token, 'fake-access-')
+        if athlete_id is None:
+            return 401, {'message': 'Authorization Error'}
+        for activity in self.activities(athlete_id):
+            if str(activity['id']) == activity_id:
+                return 200, {k: v for k, v in activity.items() if k != '_ts'}
+        return 404, {'message': 'Record Not Found'}
+
+    @staticmethod
+    def _athlete_from_token(token, prefix):
+        if not token or not token.startswith(prefix):
+            return None
+        try:
+            return int(token[len(prefix):].split('-')[0])
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _payload(activity_id, activity_type, miles, start):
+        start_text = start.strftime('%Y-%m-%dT%H:%M:%SZ')
+        return {
+            'id': activity_id,
+            'name': f'{activity_type} {activity_id}',
+            'type': activity_type,
+            'sport_type': activity_type,
+            'distance': round(miles * METERS_PER_MILE, 1),
+            'moving_time': int(miles * 540),
+            'start_date': start_text,
+            'start_date_local': start_text,
+            '_ts': int(start.timestamp()),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    api = None
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def do_POST(self):
+        self._respond('POST')
+
+    def _respond(self, method):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        form = {}
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            form = {key: values[-1] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+
+        status, body, headers = self.api.handle(method, url.path, query, form, self.headers)
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeStravaServer:
+    """HTTP server for a ``FakeStrava``; ``port=0`` picks a free port."""
+
+    def __init__(self, api=None, host='127.0.0.1', port=0):
+        self.api = api or FakeStrava()
+        handler = type('FakeStravaHandler', (_Handler,), {'api': self.api})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def api_url(self):
+        return f'{self.url}/api/v3'
+
+    @property
+    def oauth_url(self):
+        return f'{self.url}/oauth'
+
+    def start(self):
+        """Serve from a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        if self._thread:
+            self.httpd.shutdown()
+            self._thread.join()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,41 @@
+"""
+Short-lived distributed locks on top of Django's cache.
+
+``cache.add`` is atomic on Redis, so the lock holds across every worker in
+production. With the local-memory cache it only guards the current process.
+"""
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+
+@contextmanager
+def cache_lock(key, timeout=30, wait=0.0, poll_interval=0.1):
+    """
+    Try to take the lock ``key`` for at most ``timeout`` seconds.
+
+    Args:
+        key: cache key identifying the lock
+        timeout: seconds after which the lock expires even if never released
+        wait: seconds to keep retrying before giving up
+        poll_interval: seconds between retries
+
+    Yields:
+        bool: True if the lock was acquired. The body runs either way so the
+        caller can decide what to do when another worker holds it.
+    """
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    acquired = cache.add(key, token, timeout)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        acquired = cache.add(key, token, timeout)
+
+    try:
+        yield acquired
+    finally:
+        # Only release a lock we still own; it may have expired and been retaken
+        if acquired and cache.get(key) == token:
+            cache.delete(key)
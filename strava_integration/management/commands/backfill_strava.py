@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from strava_integration.backfill import Checkpoint, backfill, connected_user_ids
+
+
+class Command(BaseCommand):
+    help = 'Re-sync recent weeks from Strava for every connected user, in parallel and resumably.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weeks', type=int, default=6, help='Weeks re-fetched per user')
+        parser.add_argument('--concurrency', type=int, default=4, help='Users synced at once')
+        parser.add_argument('--budget', type=int, default=None, help='Most Strava calls this run may make')
+        parser.add_argument('--checkpoint', default='strava_backfill.json',
+                            help='Progress file; an existing one is resumed')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+        parser.add_argument('--shard', type=int, default=0, help='Shard index to process (user_id %% num-shards)')
+        parser.add_argument('--num-shards', type=int, default=1, help='Total number of shards')
+
+    def handle(self, *args, **options):
+        try:
+            user_ids = connected_user_ids(shard=options['shard'], num_shards=options['num_shards'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        checkpoint = Checkpoint(options['checkpoint'], resume=not options['restart'])
+        stats = backfill(
+            user_ids,
+            weeks=options['weeks'],
+            concurrency=options['concurrency'],
+            budget=options['budget'],
+            checkpoint=checkpoint,
+        )
+
+        rate = stats['synced'] / stats['seconds'] * 60 if stats['seconds'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced {stats['synced']} of {stats['users']} users ({stats['skipped']} already done) "
+            f"with {stats['calls']} API calls in {stats['seconds']:.1f}s ({rate:.1f} users/min)"
+        ))
+        if stats['budget_exhausted']:
+            self.stdout.write(self.style.WARNING('API budget used up; run again to continue from the checkpoint'))
+        if stats['failures']:
+            self.stdout.write(self.style.ERROR(f"{len(stats['failures'])} users failed:"))
+            for user_id, error in stats['failures'].items():
+                self.stdout.write(f"  user {user_id}: {error}")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from strava_integration.batch import compute_all_scores
+
+
+class Command(BaseCommand):
+    help = 'Recompute WeeklyScore (acute, chronic, ACWR, capacity) for every user-week.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard', type=int, default=0, help='Shard index to process (user_id %% num-shards)')
+        parser.add_argument('--num-shards', type=int, default=1, help='Total number of shards')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows written per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            stats = compute_all_scores(
+                shard=options['shard'],
+                num_shards=options['num_shards'],
+                batch_size=options['batch_size'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {stats['weeks']} weeks for {stats['users']} users in {stats['seconds']:.1f}s"
+        ))
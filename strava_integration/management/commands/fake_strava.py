@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from strava_integration.fake_server import FakeStrava, FakeStravaServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the Strava API with synthetic athletes and optional fault injection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--seed', type=int, default=0, help='Seed for synthetic histories and faults')
+        parser.add_argument('--weeks', type=int, default=104, help='Weeks of history per athlete')
+        parser.add_argument('--per-week', type=int, default=5, help='Activities per athlete per week')
+        parser.add_argument('--latency', type=float, default=0.0, help='Mean added latency per call, in seconds')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of calls answered with 503')
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Share of calls answered with 429')
+        parser.add_argument('--limit-15min', type=int, default=200, help='Calls allowed per 15 minutes')
+        parser.add_argument('--limit-daily', type=int, default=2000, help='Calls allowed per day')
+
+    def handle(self, *args, **options):
+        api = FakeStrava(
+            seed=options['seed'],
+            history_weeks=options['weeks'],
+            activities_per_week=options['per_week'],
+            latency=options['latency'],
+            error_rate=options['error_rate'],
+            rate_limit_rate=options['rate_limit_rate'],
+            short_limit=options['limit_15min'],
+            long_limit=options['limit_daily'],
+        )
+        server = FakeStravaServer(api, host=options['host'], port=options['port'])
+
+        self.stdout.write(self.style.SUCCESS(f'Fake Strava listening on {server.url}'))
+        self.stdout.write(f'  STRAVA_API_URL={server.api_url}')
+        self.stdout.write(f'  STRAVA_OAUTH_URL={server.oauth_url}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
@@ -0,0 +1,42 @@
+import os
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from strava_integration.activity_files import import_activity_files
+
+
+class Command(BaseCommand):
+    help = (
+        'Import GPX, TCX and FIT files (optionally gzipped) for a user, from files, directories '
+        'or zip archives such as a Strava bulk export. Uses no Strava API quota.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Activity files, directories or zip archives')
+        parser.add_argument('--user', type=int, required=True, help='User id to import for')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Parsing processes')
+        parser.add_argument('--timezone', help='Time zone for GPX and TCX files, which only record UTC (default UTC)')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(pk=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with id {options['user']}")
+
+        tz = None
+        if options['timezone']:
+            try:
+                tz = ZoneInfo(options['timezone'])
+            except (ZoneInfoNotFoundError, ValueError):
+                raise CommandError(f"Unknown time zone {options['timezone']}")
+
+        stats = import_activity_files(user, options['paths'], workers=max(options['workers'] or 1, 1), tz=tz)
+        for label, error in stats['errors'].items():
+            self.stdout.write(self.style.WARNING(f"{label}: {error}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['activities']} activities from {stats['files']} files, "
+            f"{stats['weeks']} weeks updated, {len(stats['errors'])} skipped"
+        ))
@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from strava_integration.backfill import connected_user_ids
+from strava_integration.ratelimit import BACKGROUND, StravaRateLimitError
+from strava_integration.services import StravaService
+from strava_integration.tasks import import_full_history_task
+
+
+class Command(BaseCommand):
+    help = (
+        "Import users' entire Strava history, walking backward in time windows. "
+        'Progress is checkpointed per user, so an interrupted import resumes where it stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='User id to import (repeatable); defaults to every connected user')
+        parser.add_argument('--inline', action='store_true', help='Import here instead of queueing Celery tasks')
+        parser.add_argument('--restart', action='store_true', help='Start over even if an import finished')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or connected_user_ids()
+
+        if not options['inline']:
+            for user_id in user_ids:
+                import_full_history_task.delay(user_id, restart=options['restart'])
+            self.stdout.write(self.style.SUCCESS(f"Queued full-history imports for {len(user_ids)} users"))
+            return
+
+        service = StravaService(priority=BACKGROUND)
+        User = get_user_model()
+        for user in User.objects.filter(pk__in=user_ids).order_by('pk'):
+            try:
+                state = service.import_full_history(user, restart=options['restart'])
+            except StravaRateLimitError as e:
+                self.stdout.write(self.style.WARNING(
+                    f"Rate limited on user {user.pk}; run again in {e.retry_after}s to resume from the checkpoint"
+                ))
+                return
+            if state:
+                self.stdout.write(
+                    f"User {user.pk}: {state.activities_seen} activities in {state.windows_done} windows, "
+                    f"back to {state.cursor:%Y-%m-%d}"
+                )
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('strava_integration', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeeklyScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start_date', models.DateField()),
+                ('acute_mileage', models.FloatField(default=0.0)),
+                ('chronic_mileage', models.FloatField(default=0.0)),
+                ('critical_score', models.FloatField(blank=True, null=True)),
+                ('recommended_capacity', models.FloatField(default=0.0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_scores', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-week_start_date'],
+                'unique_together': {('user', 'week_start_date')},
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from django.db import migrations
+
+# Frozen copies of the scoring rules at the time of this migration, so later
+# changes to strava_integration.scoring don't change what it writes
+CHRONIC_WEEKS = 4
+CAPACITY_MULTIPLIER = 1.25
+
+
+def populate_weekly_scores(apps, schema_editor):
+    """Score existing MileageLog history so the dashboard can read WeeklyScore."""
+    MileageLog = apps.get_model('strava_integration', 'MileageLog')
+    WeeklyScore = apps.get_model('strava_integration', 'WeeklyScore')
+
+    mileage_by_user = {}
+    for user_id, week_start, mileage in MileageLog.objects.values_list('user_id', 'week_start_date', 'total_mileage'):
+        mileage_by_user.setdefault(user_id, {})[week_start] = mileage
+
+    rows = []
+    for user_id, mileage_by_week in mileage_by_user.items():
+        # Score every week whose acute or chronic window holds logged mileage
+        week_start = min(mileage_by_week)
+        last_week = max(mileage_by_week) + timedelta(weeks=CHRONIC_WEEKS)
+        window = [0.0] * CHRONIC_WEEKS
+        while week_start <= last_week:
+            acute = mileage_by_week.get(week_start, 0.0)
+            chronic = sum(window) / float(CHRONIC_WEEKS)
+            rows.append(WeeklyScore(
+                user_id=user_id,
+                week_start_date=week_start,
+                acute_mileage=acute,
+                chronic_mileage=chronic,
+                critical_score=acute / chronic if chronic > 0 else None,
+                recommended_capacity=chronic * CAPACITY_MULTIPLIER,
+            ))
+            window.pop(0)
+            window.append(acute)
+            week_start += timedelta(weeks=1)
+    WeeklyScore.objects.bulk_create(rows, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('strava_integration', '0002_weeklyscore'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_weekly_scores, migrations.RunPython.noop),
+    ]
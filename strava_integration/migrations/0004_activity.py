@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('strava_integration', '0003_populate_weeklyscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Activity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('strava_id', models.BigIntegerField(unique=True)),
+                ('activity_type', models.CharField(max_length=32)),
+                ('start_date', models.DateTimeField()),
+                ('week_start_date', models.DateField()),
+                ('distance', models.FloatField(default=0.0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activities', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-start_date'],
+                'indexes': [models.Index(fields=['user', 'week_start_date'], name='strava_inte_user_id_17ae7e_idx'), models.Index(fields=['user', 'start_date'], name='strava_inte_user_id_d41f1d_idx')],
+            },
+        ),
+    ]
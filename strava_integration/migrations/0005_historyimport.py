@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('strava_integration', '0004_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('cursor', models.DateTimeField()),
+                ('windows_done', models.PositiveIntegerField(default=0)),
+                ('activities_seen', models.PositiveIntegerField(default=0)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='history_import', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -1,14 +1,114 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 
+
+class MileageLogManager(models.Manager):
+    def bulk_upsert(self, rows, batch_size=1000):
+        """
+        Insert or update many weekly totals in one transaction.
+
+        Each chunk is a single INSERT ... ON CONFLICT (user, week_start_date)
+        DO UPDATE statement. ``bulk_create`` skips the save signals, so the
+        affected WeeklyScore rows are refreshed here instead.
+
+        Args:
+            rows: iterable of (user_id, week_start_date, total_mileage), for
+                one or many users
+            batch_size: rows per statement
+
+        Returns:
+            int: number of rows written
+        """
+        from .scoring import refresh_weekly_scores
+
+        weeks_by_user = {}
+        logs = []
+        for user_id, week_start, total_mileage in rows:
+            weeks_by_user.setdefault(user_id, set()).add(week_start)
+            logs.append(self.model(user_id=user_id, week_start_date=week_start, total_mileage=total_mileage))
+        if not logs:
+            return 0
+
+        with transaction.atomic():
+            self.bulk_create(
+                logs,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['user', 'week_start_date'],
+                update_fields=['total_mileage'],
+            )
+            for user_id, weeks in weeks_by_user.items():
+                refresh_weekly_scores(user_id, weeks)
+        return len(logs)
+
+
 class MileageLog(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='mileage_logs')
     week_start_date = models.DateField()
     total_mileage = models.FloatField(default=0.0)
 
+    objects = MileageLogManager()
+
     class Meta:
         ordering = ['-week_start_date']
         unique_together = ('user', 'week_start_date')
 
     def __str__(self):
         return f"{self.user.phone_number} - {self.week_start_date}: {self.total_mileage} miles"
+
+
+class WeeklyScore(models.Model):
+    """Precomputed acute/chronic/ACWR values for one user-week."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='weekly_scores')
+    week_start_date = models.DateField()
+    acute_mileage = models.FloatField(default=0.0)
+    chronic_mileage = models.FloatField(default=0.0)
+    critical_score = models.FloatField(blank=True, null=True)  # None when there is no chronic baseline
+    recommended_capacity = models.FloatField(default=0.0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-week_start_date']
+        unique_together = ('user', 'week_start_date')
+
+    def __str__(self):
+        return f"{self.user.phone_number} - {self.week_start_date}: {self.critical_score}"
+
+
+class Activity(models.Model):
+    """A single Strava activity. Weekly MileageLog totals are rolled up from these."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='activities')
+    strava_id = models.BigIntegerField(unique=True)
+    activity_type = models.CharField(max_length=32)
+    start_date = models.DateTimeField()
+    week_start_date = models.DateField()  # From start_date_local with the Monday 3am rule
+    distance = models.FloatField(default=0.0)  # Meters
+
+    class Meta:
+        ordering = ['-start_date']
+        indexes = [
+            models.Index(fields=['user', 'week_start_date']),
+            models.Index(fields=['user', 'start_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.phone_number} - {self.activity_type} {self.strava_id}: {self.distance}m"
+
+
+class HistoryImport(models.Model):
+    """
+    Checkpoint of a user's full-history import.
+
+    The import walks backward from ``started_at`` one window at a time;
+    everything from ``cursor`` up to ``started_at`` has been imported.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='history_import')
+    started_at = models.DateTimeField()
+    cursor = models.DateTimeField()
+    windows_done = models.PositiveIntegerField(default=0)
+    activities_seen = models.PositiveIntegerField(default=0)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        state = 'complete' if self.completed_at else f'back to {self.cursor:%Y-%m-%d}'
+        return f"{self.user.phone_number} history import: {state}"
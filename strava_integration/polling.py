@@ -0,0 +1,102 @@
+"""
+Adaptive background polling of connected users.
+
+Celery beat runs ``schedule_polls`` every STRAVA_POLL_TICK_SECONDS. Each user
+is polled every ``poll_interval`` seconds at a fixed offset derived from a
+hash of their id, so polls are spread evenly over the day instead of
+bunching up at the top of each hour. Users who run often are polled more
+often than dormant ones. Active and regular users are polled twice as often
+in the last two days of the week, when their week's score is about to
+settle; dormant users stay at the dormant interval.
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, FilteredRelation, Max, Q
+
+from .scoring import WEEK_START_OFFSET, get_current_week_start
+from .services import RUN_TYPES
+
+ACTIVE_INTERVAL = 2 * 60 * 60
+REGULAR_INTERVAL = 6 * 60 * 60
+DORMANT_INTERVAL = 24 * 60 * 60
+
+# At least this many runs in the last RECENT_DAYS makes a user active
+ACTIVE_RUNS = 4
+RECENT_DAYS = 14
+
+# No run for this long makes a user dormant
+DORMANT_DAYS = 28
+
+# Poll twice as often this close to the end of the week
+WEEK_END_WINDOW = timedelta(days=2)
+
+
+def poll_offset(user_id, interval):
+    """Stable offset of ``user_id`` within ``interval`` seconds."""
+    digest = hashlib.sha1(str(user_id).encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % interval
+
+
+def poll_interval(last_run, recent_runs, now):
+    """
+    Seconds between polls for a user.
+
+    Args:
+        last_run: start of the user's most recent run, or None
+        recent_runs: runs started in the last RECENT_DAYS days
+        now: current aware datetime
+    """
+    if recent_runs >= ACTIVE_RUNS:
+        interval = ACTIVE_INTERVAL
+    elif last_run is None or now - last_run > timedelta(days=DORMANT_DAYS):
+        # Nothing to gain from polling faster near week end either
+        return DORMANT_INTERVAL
+    else:
+        interval = REGULAR_INTERVAL
+
+    week_start = get_current_week_start(now)
+    week_end = datetime.combine(week_start + timedelta(weeks=1), datetime.min.time(), tzinfo=dt_timezone.utc)
+    if week_end + WEEK_START_OFFSET - now <= WEEK_END_WINDOW:
+        interval //= 2
+    return interval
+
+
+def due_polls(now, tick):
+    """
+    Find the users whose poll falls in the tick starting at ``now``.
+
+    Users refreshed by any other path (webhook, dashboard) within the last
+    half interval are skipped.
+
+    Returns:
+        list: (user_id, seconds from ``now`` until the poll) pairs
+    """
+    User = get_user_model()
+    recent = now - timedelta(days=RECENT_DAYS)
+    users = (
+        User.objects.exclude(strava_refresh_token__isnull=True).exclude(strava_refresh_token='')
+        # Runs older than DORMANT_DAYS don't change the interval, so only join the recent ones
+        .annotate(recent_activities=FilteredRelation('activities', condition=Q(
+            activities__activity_type__in=RUN_TYPES,
+            activities__start_date__gte=now - timedelta(days=DORMANT_DAYS),
+        )))
+        .annotate(
+            last_run=Max('recent_activities__start_date'),
+            recent_runs=Count('recent_activities', filter=Q(recent_activities__start_date__gte=recent)),
+        )
+        .values_list('pk', 'strava_synced_at', 'last_run', 'recent_runs')
+    )
+
+    timestamp = int(now.timestamp())
+    due = []
+    for user_id, synced_at, last_run, recent_runs in users:
+        interval = poll_interval(last_run, recent_runs, now)
+        countdown = (poll_offset(user_id, interval) - timestamp) % interval
+        if countdown >= tick:
+            continue
+        if synced_at and (now - synced_at).total_seconds() < interval / 2:
+            continue
+        due.append((user_id, countdown))
+    return due
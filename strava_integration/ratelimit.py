@@ -0,0 +1,146 @@
+"""
+Cluster-wide Strava rate-limit governor.
+
+Strava enforces app-wide quotas per 15-minute window (reset at :00, :15, :30
+and :45) and per day (reset at midnight UTC). Every worker counts its calls
+in the shared cache (Redis in production, process memory locally) before
+talking to Strava. The counters are corrected from the X-RateLimit-Usage
+headers, and a 429 pauses all calls until the window resets.
+
+Background polling may only use part of each window so interactive dashboard
+refreshes always have quota left.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.metrics import STRAVA_RATE_LIMIT_HITS
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+SHORT_WINDOW = 15 * 60
+LONG_WINDOW = 24 * 60 * 60
+
+
+class StravaRateLimitError(Exception):
+    """Raised when a Strava call would exceed the shared quota."""
+
+    def __init__(self, retry_after):
+        self.retry_after = max(1, int(retry_after))
+        super().__init__(f"Strava rate limit reached, retry in {self.retry_after}s")
+
+
+class RateLimitGovernor:
+    def __init__(self, short_limit=None, long_limit=None, background_share=None):
+        self.short_limit = short_limit or getattr(settings, 'STRAVA_RATE_LIMIT_15MIN', 200)
+        self.long_limit = long_limit or getattr(settings, 'STRAVA_RATE_LIMIT_DAILY', 2000)
+        self.background_share = background_share or getattr(settings, 'STRAVA_RATE_LIMIT_BACKGROUND_SHARE', 0.8)
+
+    def acquire(self, priority=INTERACTIVE, now=None):
+        """
+        Reserve one Strava call, raising StravaRateLimitError if none is left.
+
+        Args:
+            priority: INTERACTIVE or BACKGROUND
+            now: current unix time (for tests)
+        """
+        now = now or time.time()
+
+        blocked_until = cache.get('strava:ratelimit:blocked_until')
+        if blocked_until and blocked_until > now:
+            STRAVA_RATE_LIMIT_HITS.labels(priority, 'blocked').inc()
+            raise StravaRateLimitError(blocked_until - now)
+
+        short_limit, long_limit = self._limits()
+        share = 1.0 if priority == INTERACTIVE else self.background_share
+
+        short_key, short_reset = self._window(SHORT_WINDOW, now)
+        long_key, long_reset = self._window(LONG_WINDOW, now)
+
+        short_used = self._incr(short_key, SHORT_WINDOW)
+        long_used = self._incr(long_key, LONG_WINDOW)
+        if short_used > short_limit * share or long_used > long_limit * share:
+            # Give the reservation back; this call is not going out
+            self._decr(short_key)
+            self._decr(long_key)
+            STRAVA_RATE_LIMIT_HITS.labels(priority, 'quota').inc()
+            retry_after = long_reset if long_used > long_limit * share else short_reset
+            raise StravaRateLimitError(retry_after - now)
+
+    def observe(self, response, priority=INTERACTIVE, now=None):
+        """Update the shared counters from a Strava response's rate-limit headers."""
+        now = now or time.time()
+
+        limits = self._parse_pair(response.headers.get('X-RateLimit-Limit'))
+        usage = self._parse_pair(response.headers.get('X-RateLimit-Usage'))
+
+        if limits:
+            cache.set('strava:ratelimit:limits', limits, LONG_WINDOW)
+
+        short_key, short_reset = self._window(SHORT_WINDOW, now)
+        long_key, long_reset = self._window(LONG_WINDOW, now)
+        if usage:
+            # Strava's count includes calls from every worker; never count lower
+            for key, used, window in ((short_key, usage[0], SHORT_WINDOW), (long_key, usage[1], LONG_WINDOW)):
+                if used > (cache.get(key) or 0):
+                    cache.set(key, used, window)
+
+        if response.status_code == 429:
+            long_limit = (limits or self._limits())[1]
+            reset = long_reset if usage and usage[1] >= long_limit else short_reset
+            cache.set('strava:ratelimit:blocked_until', reset, int(reset - now) + 1)
+            STRAVA_RATE_LIMIT_HITS.labels(priority, '429').inc()
+            raise StravaRateLimitError(reset - now)
+
+    def _limits(self):
+        limits = cache.get('strava:ratelimit:limits')
+        if limits:
+            return min(limits[0], self.short_limit), min(limits[1], self.long_limit)
+        return self.short_limit, self.long_limit
+
+    @staticmethod
+    def _window(length, now):
+        """Return (cache key, reset time) for the window containing ``now``."""
+        index = int(now // length)
+        return f'strava:ratelimit:{length}:{index}', (index + 1) * length
+
+    @staticmethod
+    def _incr(key, timeout):
+        cache.add(key, 0, timeout)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # Expired between add and incr
+            cache.set(key, 1, timeout)
+            return 1
+
+    @staticmethod
+    def _decr(key):
+        try:
+            cache.decr(key)
+        except ValueError:
+            pass
+
+    @staticmethod
+    def _parse_pair(header):
+        """Parse a "15min,daily" header value into a tuple of ints."""
+        if not header:
+            return None
+        try:
+            short, long = (int(value) for value in header.split(',')[:2])
+        except ValueError:
+            return None
+        return short, long
+
+
+_governor = None
+
+
+def get_governor():
+    """Return the process-wide governor."""
+    global _governor
+    if _governor is None:
+        _governor = RateLimitGovernor()
+    return _governor
@@ -0,0 +1,269 @@
+"""
+ACWR score engine.
+
+All Acute/Chronic Workload Ratio calculations live here so the dashboard and
+the API compute scores the same way. Weeks are scored with a sliding-window
+sum and the results are kept in WeeklyScore, which is refreshed whenever a
+MileageLog row changes, so reads never recompute four-week averages.
+
+Formatted score contexts are cached per user under a data version that is
+bumped whenever the user's scores change. The current week is part of the
+cache key, so the Monday 3am rollover starts a fresh entry automatically.
+"""
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+# Chronic Mileage is the average of the 4 complete weeks before Week X
+CHRONIC_WEEKS = 4
+
+# Recommended Max Mileage (Week X+1) = 1.25 x Chronic Mileage
+CAPACITY_MULTIPLIER = 1.25
+
+# Weeks start on Monday at 3am rather than midnight
+WEEK_START_OFFSET = timedelta(hours=3)
+
+# Current week + 5 past weeks are shown on the dashboard
+HISTORY_WEEKS = 6
+
+# Cached score contexts are keyed by data version, so they never go stale;
+# this only bounds how long unused entries linger.
+SCORE_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+
+def get_week_start(dt):
+    """
+    Return the Monday that starts the week containing ``dt``.
+
+    We subtract 3 hours before taking the date, so Mon 2am still belongs to
+    the previous week and Mon 4am belongs to the current one.
+    """
+    day = (dt - WEEK_START_OFFSET).date()
+    return day - timedelta(days=day.weekday())
+
+
+def get_current_week_start(now=None):
+    """Return the start of the current week using the Monday 3am rule."""
+    return get_week_start(now or timezone.now())
+
+
+def iter_weekly_scores(mileage_by_week, first_week, last_week):
+    """
+    Yield scores for every week from ``first_week`` to ``last_week``, oldest first.
+
+    Args:
+        mileage_by_week: dict mapping week_start_date -> total mileage
+        first_week: date of the oldest week to score
+        last_week: date of the most recent week to score
+
+    Yields:
+        dict: ``week_start``, ``acute``, ``chronic``, ``acwr`` and
+        ``recommended_capacity``. ``acwr`` is None when there is no chronic
+        baseline.
+    """
+    # Chronic window for the first scored week (the 4 weeks before it)
+    window = [
+        mileage_by_week.get(first_week - timedelta(weeks=CHRONIC_WEEKS - i), 0.0)
+        for i in range(CHRONIC_WEEKS)
+    ]
+
+    week_start = first_week
+    while week_start <= last_week:
+        acute = mileage_by_week.get(week_start, 0.0)
+        # Re-summing the 4-week window avoids float drift from add/subtract
+        chronic = sum(window) / float(CHRONIC_WEEKS)
+        yield {
+            'week_start': week_start,
+            'acute': acute,
+            'chronic': chronic,
+            'acwr': acute / chronic if chronic > 0 else None,
+            'recommended_capacity': chronic * CAPACITY_MULTIPLIER,
+        }
+        # Slide the chronic window forward by one week
+        window.pop(0)
+        window.append(acute)
+        week_start += timedelta(weeks=1)
+
+
+def compute_weekly_scores(mileage_by_week, current_week_start, weeks=HISTORY_WEEKS):
+    """
+    Compute acute, chronic and ACWR for ``weeks`` weeks ending at the current week.
+
+    Returns:
+        list: One score dict per week (see ``iter_weekly_scores``), most recent first.
+    """
+    first_week = current_week_start - timedelta(weeks=weeks - 1)
+    scores = list(iter_weekly_scores(mileage_by_week, first_week, current_week_start))
+    scores.reverse()
+    return scores
+
+
+def get_weekly_scores(user, current_week_start=None, weeks=HISTORY_WEEKS):
+    """
+    Read a user's precomputed scores for the last ``weeks`` weeks.
+
+    This is a single indexed range scan on WeeklyScore. Weeks without a row
+    have no mileage in their acute or chronic window and score as zero.
+    """
+    from .models import WeeklyScore
+
+    if current_week_start is None:
+        current_week_start = get_current_week_start()
+    first_week = current_week_start - timedelta(weeks=weeks - 1)
+
+    rows = {
+        row.week_start_date: row
+        for row in WeeklyScore.objects.filter(
+            user=user,
+            week_start_date__gte=first_week,
+            week_start_date__lte=current_week_start,
+        )
+    }
+
+    scores = []
+    for i in range(weeks):
+        week_start = current_week_start - timedelta(weeks=i)
+        row = rows.get(week_start)
+        scores.append({
+            'week_start': week_start,
+            'acute': row.acute_mileage if row else 0.0,
+            'chronic': row.chronic_mileage if row else 0.0,
+            'acwr': row.critical_score if row else None,
+            'recommended_capacity': row.recommended_capacity if row else 0.0,
+        })
+    return scores
+
+
+def refresh_weekly_scores(user_id, week_starts):
+    """
+    Recompute WeeklyScore rows affected by mileage changes in ``week_starts``.
+
+    A week's mileage is the acute load of that week and part of the chronic
+    load of the 4 weeks after it, so each changed week touches 5 scores.
+    Once the user has no MileageLog rows left, all their scores are deleted.
+    """
+    from .models import MileageLog, WeeklyScore
+
+    affected = set()
+    for week_start in week_starts:
+        for i in range(CHRONIC_WEEKS + 1):
+            affected.add(week_start + timedelta(weeks=i))
+    if not affected:
+        return
+
+    first_week = min(affected)
+    last_week = max(affected)
+    mileage_by_week = dict(
+        MileageLog.objects.filter(
+            user_id=user_id,
+            week_start_date__gte=first_week - timedelta(weeks=CHRONIC_WEEKS),
+            week_start_date__lte=last_week,
+        ).values_list('week_start_date', 'total_mileage')
+    )
+    if not mileage_by_week and not MileageLog.objects.filter(user_id=user_id).exists():
+        WeeklyScore.objects.filter(user_id=user_id).delete()
+        bump_data_versions([user_id])
+        return
+
+    rows = [
+        WeeklyScore(
+            user_id=user_id,
+            week_start_date=score['week_start'],
+            acute_mileage=score['acute'],
+            chronic_mileage=score['chronic'],
+            critical_score=score['acwr'],
+            recommended_capacity=score['recommended_capacity'],
+        )
+        for score in iter_weekly_scores(mileage_by_week, first_week, last_week)
+        if score['week_start'] in affected
+    ]
+    WeeklyScore.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['user', 'week_start_date'],
+        update_fields=['acute_mileage', 'chronic_mileage', 'critical_score', 'recommended_capacity', 'updated_at'],
+    )
+    bump_data_versions([user_id])
+
+
+def _version_key(user_id):
+    return f'score:version:{user_id}'
+
+
+def get_data_version(user_id):
+    """Return the current version of a user's score data."""
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Start from the clock so a version lost to eviction is never reused
+        cache.add(_version_key(user_id), time.time_ns(), None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def bump_data_versions(user_ids):
+    """
+    Invalidate cached scores for ``user_ids``.
+
+    The version is bumped now and again once the surrounding transaction
+    commits, so a request that read the old rows mid-transaction cannot
+    leave them cached under the new version.
+    """
+    def bump():
+        for user_id in user_ids:
+            try:
+                cache.incr(_version_key(user_id))
+            except ValueError:
+                cache.set(_version_key(user_id), time.time_ns(), None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def build_score_context(scores, current_week_start):
+    """Format weekly scores (most recent first) for display."""
+    current = scores[0]
+
+    # Calculate Date Range for Current Week
+    week_end_date = current_week_start + timedelta(days=6)
+    current_week_range = f"{current_week_start.strftime('%b %d')} - {week_end_date.strftime('%b %d')}"
+
+    historical_data = []
+    for i, week in enumerate(scores):
+        if i == 0:
+            week_label = "Current Week"
+        else:
+            week_end = week['week_start'] + timedelta(days=6)
+            week_label = f"{week['week_start'].strftime('%m/%d')} - {week_end.strftime('%m/%d')}"
+
+        historical_data.append({
+            'week_start': week['week_start'],
+            'week_label': week_label,
+            'acute': round(week['acute'], 1),
+            'chronic': round(week['chronic'], 1),
+            'acwr': round(week['acwr'], 2) if week['acwr'] is not None else "N/A"
+        })
+
+    return {
+        'acute_mileage': round(current['acute'], 1),
+        'chronic_mileage': round(current['chronic'], 1),
+        'critical_score': round(current['acwr'] or 0.0, 2),
+        'recommended_capacity': round(current['recommended_capacity'], 1),
+        'current_week_range': current_week_range,
+        'historical_data': historical_data,
+    }
+
+
+def get_score_context(user, now=None):
+    """Return the dashboard/API score context for a user, from cache when possible."""
+    current_week_start = get_current_week_start(now)
+    key = f'score:context:{user.pk}:{get_data_version(user.pk)}:{current_week_start.isoformat()}'
+
+    context = cache.get(key)
+    if context is None:
+        scores = get_weekly_scores(user, current_week_start)
+        context = build_score_context(scores, current_week_start)
+        cache.set(key, context, SCORE_CACHE_TIMEOUT)
+    return context
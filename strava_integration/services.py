@@ -1,10 +1,26 @@
 import os
+import time
 from django.conf import settings
-import requests
+from django.core.cache import cache
 from urllib.parse import urlencode
 
+from .client import get_client
+from .locks import cache_lock
+from .ratelimit import INTERACTIVE
+
+# Refresh access tokens this many seconds before Strava expires them
+TOKEN_EXPIRY_MARGIN = 300
+
+# Weeks of history fetched per step of a full-history import
+HISTORY_WINDOW_WEEKS = 26
+
+# Only these activity types count towards mileage
+RUN_TYPES = ['Run', 'VirtualRun']
+
+METERS_PER_MILE = 1609.34
+
 class StravaService:
-    def __init__(self):
+    def __init__(self, priority=INTERACTIVE):
         self.client_id = os.getenv('STRAVA_CLIENT_ID')
         self.client_secret = os.getenv('STRAVA_CLIENT_SECRET')
         domain = os.getenv('RAILWAY_PUBLIC_DOMAIN')
@@ -12,6 +28,11 @@ class StravaService:
             self.redirect_uri = f'https://{domain}/strava/callback/'
         else:
             self.redirect_uri = 'http://localhost:8000/strava/callback/'
+        self.api_url = settings.STRAVA_API_URL.rstrip('/')
+        self.oauth_url = settings.STRAVA_OAUTH_URL.rstrip('/')
+        self.http = get_client()
+        # Rate-limit priority for every call this service makes
+        self.priority = priority
 
     def get_authorization_url(self):
         params = {
@@ -21,17 +42,17 @@ class StravaService:
             'scope': 'activity:read_all',
             'approval_prompt': 'force'
         }
-        return f"https://www.strava.com/oauth/authorize?{urlencode(params)}"
+        return f"{self.oauth_url}/authorize?{urlencode(params)}"
 
     def exchange_token(self, code):
-        url = "https://www.strava.com/oauth/token"
+        url = f"{self.oauth_url}/token"
         payload = {
             'client_id': self.client_id,
             'client_secret': self.client_secret,
             'code': code,
             'grant_type': 'authorization_code'
         }
-        response = requests.post(url, data=payload)
+        response = self.http.post(url, endpoint='oauth/token', priority=self.priority, data=payload)
         response.raise_for_status()
         return response.json()
 
@@ -40,82 +61,541 @@ class StravaService:
         print(f"Fetching real Strava data for user {user.phone_number}")
         
         from django.utils import timezone
-        from datetime import timedelta
-        from .models import MileageLog
+        from datetime import datetime, timedelta, timezone as dt_timezone
         
         # Get access token
         if not user.strava_refresh_token:
             print("No refresh token available")
             return
             
-        access_token = self._refresh_access_token(user.strava_refresh_token)
+        access_token = self.get_access_token(user)
         
         # Calculate date range (6 weeks ago to now)
         today = timezone.now().date()
         six_weeks_ago = today - timedelta(weeks=6)
+        after = datetime.combine(six_weeks_ago, datetime.min.time(), tzinfo=dt_timezone.utc)
+        
+        affected_weeks, newest_start = self._sync_window(user, access_token, after)
+        
+        # Incremental syncs continue from the newest activity we stored
+        self._advance_cursor(user, newest_start or after)
+            
+        print(f"Saved {len(affected_weeks)} weeks of data")
+
+    def sync_recent_activities(self, user):
+        """
+        Store activities started after ``user.last_sync_timestamp`` and update their weeks.
+
+        Activities are keyed by their Strava id, so a repeated or concurrent
+        sync updates rows instead of counting an activity twice, and only
+        the weeks those activities fall in are re-totalled.
+        """
+        from django.db import transaction
+        
+        if not user.strava_refresh_token:
+            print("No refresh token available")
+            return
+        
+        # Nothing stored yet, seed the history instead
+        if not user.last_sync_timestamp or not user.activities.exists():
+            return self.fetch_initial_data(user)
+        
+        access_token = self.get_access_token(user)
+        activities = self.iter_activities(access_token, after=user.last_sync_timestamp, prefetch=True)
+        affected_weeks, newest_start = self._store_activities(user, activities)
+        
+        with transaction.atomic():
+            self._rollup_weeks(user, affected_weeks)
+            if newest_start:
+                self._advance_cursor(user, newest_start)
+        
+        print(f"Updated {len(affected_weeks)} weeks from new activities")
+
+    def refresh_recent_weeks(self, user, weeks=5):
+        """
+        Re-fetch the last ``weeks`` weeks from Strava and reconcile stored activities.
+        
+        Catches edits a delta after the sync cursor cannot see. The default
+        covers the current week and its chronic window.
+        """
+        from datetime import datetime, timedelta, timezone as dt_timezone
+        from .scoring import get_current_week_start
         
-        # Fetch activities from Strava
-        url = "https://www.strava.com/api/v3/athlete/activities"
+        if not user.strava_refresh_token:
+            print("No refresh token available")
+            return
+        
+        first_week = get_current_week_start() - timedelta(weeks=weeks - 1)
+        # start_date_local can be up to a day ahead of UTC, so fetch a day early
+        after = datetime.combine(first_week - timedelta(days=1), datetime.min.time(), tzinfo=dt_timezone.utc)
+        
+        access_token = self.get_access_token(user)
+        affected_weeks, newest_start = self._sync_window(user, access_token, after)
+        if newest_start:
+            self._advance_cursor(user, newest_start)
+        
+        print(f"Reconciled {len(affected_weeks)} of the last {weeks} weeks")
+
+    def sync_activities_by_id(self, user, activity_ids):
+        """
+        Fetch activities by Strava id (e.g. from webhook create events) and store them.
+        
+        Unlike a delta after the sync cursor, this also catches backdated
+        uploads such as a watch synced days later. Activities deleted
+        before they could be fetched are skipped. The cursor is left alone,
+        so a later delta still picks up anything else it hasn't seen.
+        """
+        from django.db import transaction
+        
+        if not user.strava_refresh_token:
+            print("No refresh token available")
+            return
+        
+        access_token = self.get_access_token(user)
         headers = {'Authorization': f'Bearer {access_token}'}
-        params = {
-            'after': int(six_weeks_ago.strftime('%s')),
-            'per_page': 200
-        }
         
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        activities = response.json()
+        def fetch():
+            for activity_id in activity_ids:
+                response = self.http.get(f"{self.api_url}/activities/{activity_id}", endpoint='activities', priority=self.priority, headers=headers)
+                if response.status_code == 404:
+                    continue
+                response.raise_for_status()
+                yield response.json()
         
-        # Process activities and aggregate by week
-        weekly_mileage = {}
-        current_week_start = today - timedelta(days=today.weekday())
+        affected_weeks, _ = self._store_activities(user, fetch())
+        with transaction.atomic():
+            self._rollup_weeks(user, affected_weeks)
         
-        for activity in activities:
-            # Only process running activities
-            if activity.get('type') not in ['Run', 'VirtualRun']:
-                continue
-                
-            # Parse activity date and determine week
-            # Parse activity date and determine week
-            from datetime import datetime
-            # start_date_local is the local time where the run happened. 
-            # We treat it as naive or reference time for the 3am logic.
-            activity_dt = datetime.fromisoformat(activity['start_date_local'].replace('Z', ''))
+        print(f"Updated {len(affected_weeks)} weeks from {len(activity_ids)} new activities")
+
+    def import_full_history(self, user, window_weeks=HISTORY_WINDOW_WEEKS, restart=False):
+        """
+        Import the user's entire Strava history, newest window first.
+        
+        The import walks backward in ``window_weeks`` windows. Each window is
+        streamed into Activity rows in chunks and its weeks are re-totalled
+        in one transaction, then it is checkpointed in HistoryImport. A crash
+        or rate limit therefore resumes from the last completed window, and
+        a finished import is not run again unless ``restart`` is set.
+        
+        After an empty window, a one-activity probe jumps straight to the
+        next older activity, or ends the import if there is none, so gaps of
+        years cost one call.
+        
+        Returns:
+            HistoryImport: the user's import state, or None without a refresh token
+        """
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import HistoryImport
+        
+        if not user.strava_refresh_token:
+            print("No refresh token available")
+            return None
+        
+        now = timezone.now()
+        state, created = HistoryImport.objects.get_or_create(user=user, defaults={'started_at': now, 'cursor': now})
+        if restart and not created:
+            state.started_at = state.cursor = now
+            state.windows_done = state.activities_seen = 0
+            state.completed_at = None
+            state.save()
+        if state.completed_at:
+            return state
+        
+        window = timedelta(weeks=window_weeks)
+        while state.completed_at is None:
+            before = state.cursor
+            after = before - window
+            # Fetched per window; a cached token makes this free until it expires
+            access_token = self.get_access_token(user)
             
-            # Adjust for "week starts Monday 3am" rule
-            # Subtracting 3 hours means anything before 3am falls into the previous day (and potentially previous week)
-            adjusted_dt = activity_dt - timedelta(hours=3)
+            seen_ids = set()
+            affected_weeks, newest_start = self._sync_window(user, access_token, after, before, seen_ids)
+            if newest_start:
+                self._advance_cursor(user, newest_start)
             
-            activity_date = adjusted_dt.date()
-            week_start = activity_date - timedelta(days=activity_date.weekday())
+            if seen_ids:
+                state.cursor = after
+            else:
+                older = next(self.iter_activities(access_token, before=after, per_page=1), None)
+                if older is None:
+                    state.completed_at = timezone.now()
+                else:
+                    # `before` is exclusive, so end the next window just after this activity
+                    state.cursor = self._parse_start_date(older) + timedelta(seconds=1)
+            state.windows_done += 1
+            state.activities_seen += len(seen_ids)
+            state.save()
+            print(f"Imported {len(seen_ids)} activities from {after:%Y-%m-%d} to {before:%Y-%m-%d}, {len(affected_weeks)} weeks updated")
+        
+        return state
+
+    def import_activities(self, user, activities):
+        """Store Strava-shaped activity payloads from outside the API (e.g. files) and re-total their weeks."""
+        from django.db import transaction
+
+        affected_weeks, _ = self._store_activities(user, activities)
+        with transaction.atomic():
+            self._rollup_weeks(user, affected_weeks)
+        return affected_weeks
+
+    def remove_activities(self, user, strava_ids):
+        """Delete activities (e.g. deleted on Strava) and re-total the weeks they were in."""
+        from django.db import transaction
+        from .models import Activity
+        
+        with transaction.atomic():
+            removed = Activity.objects.filter(user=user, strava_id__in=strava_ids)
+            affected_weeks = set(removed.filter(activity_type__in=RUN_TYPES).values_list('week_start_date', flat=True))
+            removed.delete()
+            self._rollup_weeks(user, affected_weeks)
+        return affected_weeks
+
+    def change_activity_types(self, user, types_by_id):
+        """Apply activity type edits (e.g. Run -> Ride) and re-total the weeks involved."""
+        from django.db import transaction
+        from .models import Activity
+        
+        affected_weeks = set()
+        with transaction.atomic():
+            for activity in Activity.objects.select_for_update().filter(user=user, strava_id__in=types_by_id):
+                new_type = types_by_id[activity.strava_id]
+                if new_type == activity.activity_type:
+                    continue
+                if activity.activity_type in RUN_TYPES or new_type in RUN_TYPES:
+                    affected_weeks.add(activity.week_start_date)
+                activity.activity_type = new_type
+                activity.save(update_fields=['activity_type'])
+            self._rollup_weeks(user, affected_weeks)
+        return affected_weeks
+
+    def is_deauthorized(self, user):
+        """Confirm with Strava that ``user`` revoked access: a token refresh is refused."""
+        import requests
+        
+        cache.delete(self._access_token_key(user))
+        try:
+            self.get_access_token(user)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code in (400, 401):
+                return True
+            raise
+        return False
+
+    def revoke(self, user):
+        """Forget a user's Strava tokens after they deauthorize the app."""
+        cache.delete(self._access_token_key(user))
+        user.strava_refresh_token = None
+        user.save(update_fields=['strava_refresh_token'])
+
+    def iter_activities(self, access_token, after=None, before=None, per_page=200, prefetch=False):
+        """
+        Yield the athlete's activities one at a time, walking every page.
+        
+        Args:
+            access_token: Strava access token
+            after: only activities that started after this aware datetime
+            before: only activities that started before this aware datetime
+            per_page: page size requested from Strava (max 200)
+            prefetch: request the next page in a background thread while the
+                current one is being consumed
+                
+        At most two pages are held in memory, however long the history is.
+        """
+        url = f"{self.api_url}/athlete/activities"
+        headers = {'Authorization': f'Bearer {access_token}'}
+        params = {'per_page': per_page}
+        if after:
+            params['after'] = int(after.timestamp())
+        if before:
+            params['before'] = int(before.timestamp())
+        
+        def fetch_page(page):
+            response = self.http.get(url, endpoint='athlete/activities', priority=self.priority, headers=headers, params=dict(params, page=page))
+            response.raise_for_status()
+            return response.json()
+        
+        if not prefetch:
+            page = 1
+            while True:
+                activities = fetch_page(page)
+                yield from activities
+                # A short page is the last one
+                if len(activities) < per_page:
+                    return
+                page += 1
+        
+        from concurrent.futures import ThreadPoolExecutor
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            page = 1
+            future = executor.submit(fetch_page, page)
+            while future is not None:
+                activities = future.result()
+                future = None
+                if len(activities) == per_page:
+                    page += 1
+                    future = executor.submit(fetch_page, page)
+                yield from activities
+
+    def _sync_window(self, user, access_token, after, before=None, seen_ids=None):
+        """
+        Make the stored activities between ``after`` and ``before`` match Strava.
+        
+        ``seen_ids``, if given, collects the Strava id of every activity in the window.
+        
+        Returns:
+            tuple: (set of weeks re-totalled, start time of the newest activity seen)
+        """
+        from django.db import transaction
+        from .models import Activity
+        
+        seen_ids = set() if seen_ids is None else seen_ids
+        activities = self.iter_activities(access_token, after=after, before=before, prefetch=True)
+        affected_weeks, newest_start = self._store_activities(user, activities, seen_ids)
+        
+        with transaction.atomic():
+            # Anything stored for this window that Strava no longer returns was deleted.
+            # Activities imported from files (negative ids) were never on Strava, so they stay.
+            stale = Activity.objects.filter(user=user, start_date__gt=after, strava_id__gt=0).exclude(strava_id__in=seen_ids)
+            if before:
+                stale = stale.filter(start_date__lt=before)
+            affected_weeks |= set(stale.filter(activity_type__in=RUN_TYPES).values_list('week_start_date', flat=True))
+            stale.delete()
+            self._rollup_weeks(user, affected_weeks)
+        
+        return affected_weeks, newest_start
+
+    def _store_activities(self, user, activities, seen_ids=None, chunk_size=200):
+        """
+        Upsert a stream of Strava activities in chunks.
+        
+        Args:
+            user: owner of the activities
+            activities: iterable of Strava activity payloads
+            seen_ids: optional set collecting every Strava id stored
+            chunk_size: activities written per query
             
-            # Convert meters to miles
-            distance_miles = activity['distance'] / 1609.34
+        Returns:
+            tuple: (set of weeks whose totals need re-computing, start time of
+            the newest activity seen). Activities taken over from another
+            user are re-totalled for that user here.
+        """
+        from itertools import islice
+        from django.contrib.auth import get_user_model
+        from django.db import transaction
+        from django.db.models import Q
+        from .models import Activity
+        
+        affected_weeks = set()
+        # Weeks of other users that activities in the current chunk are taken from
+        moved_from = {}
+        newest_start = None
+        activities = iter(activities)
+        
+        while True:
+            chunk = [self._activity_from_payload(user, payload) for payload in islice(activities, chunk_size)]
+            if not chunk:
+                break
             
-            # Aggregate by week
-            if week_start not in weekly_mileage:
-                weekly_mileage[week_start] = 0.0
-            weekly_mileage[week_start] += distance_miles
-        
-        # Save to database
-        for week_start, mileage in weekly_mileage.items():
-            MileageLog.objects.update_or_create(
-                user=user,
-                week_start_date=week_start,
-                defaults={'total_mileage': round(mileage, 1)}
-            )
+            # Same query: the same runs imported from files (negative ids), which their Strava copies replace
+            strava_starts = {a.start_date for a in chunk if a.strava_id > 0}
+            existing = {}
+            file_copies = []
+            for activity in Activity.objects.filter(
+                Q(strava_id__in=[a.strava_id for a in chunk])
+                | Q(user=user, strava_id__lt=0, start_date__in=strava_starts)
+            ):
+                if activity.strava_id < 0 and activity.start_date in strava_starts:
+                    file_copies.append(activity)
+                    if activity.activity_type in RUN_TYPES:
+                        affected_weeks.add(activity.week_start_date)
+                else:
+                    existing[activity.strava_id] = activity
+            if file_copies:
+                Activity.objects.filter(pk__in=[copy.pk for copy in file_copies]).delete()
+            for activity in chunk:
+                if newest_start is None or activity.start_date > newest_start:
+                    newest_start = activity.start_date
+                if seen_ids is not None:
+                    seen_ids.add(activity.strava_id)
+                
+                # A run counts towards its week; an edited one may also leave its old week
+                if activity.activity_type in RUN_TYPES:
+                    affected_weeks.add(activity.week_start_date)
+                old = existing.get(activity.strava_id)
+                if old and old.activity_type in RUN_TYPES and old.user_id != activity.user_id:
+                    # Moving to this user (e.g. the athlete was re-linked) takes it out of the old owner's week
+                    moved_from.setdefault(old.user_id, set()).add(old.week_start_date)
+                elif old and old.activity_type in RUN_TYPES and (
+                    old.week_start_date != activity.week_start_date
+                    or old.distance != activity.distance
+                    or old.activity_type != activity.activity_type
+                ):
+                    affected_weeks.add(old.week_start_date)
             
-        print(f"Saved {len(weekly_mileage)} weeks of data")
+            Activity.objects.bulk_create(
+                chunk,
+                update_conflicts=True,
+                unique_fields=['strava_id'],
+                update_fields=['user', 'activity_type', 'start_date', 'week_start_date', 'distance'],
+            )
+            if moved_from:
+                with transaction.atomic():
+                    for old_user_id, week_starts in moved_from.items():
+                        self._rollup_weeks(get_user_model()(pk=old_user_id), week_starts)
+                moved_from.clear()
         
+        return affected_weeks, newest_start
+
+    def _rollup_weeks(self, user, week_starts):
+        """Re-total MileageLog for ``week_starts`` from the stored run activities."""
+        from django.db.models import Sum
+        from .models import Activity, MileageLog
+        
+        if not week_starts:
+            return
+        
+        meters_by_week = dict(
+            Activity.objects.filter(user=user, week_start_date__in=week_starts, activity_type__in=RUN_TYPES)
+            .values_list('week_start_date')
+            .annotate(total=Sum('distance'))
+        )
+        existing = dict(
+            MileageLog.objects.select_for_update()
+            .filter(user=user, week_start_date__in=week_starts)
+            .values_list('week_start_date', 'total_mileage')
+        )
+        
+        rows = []
+        for week_start in week_starts:
+            # Convert meters to miles
+            total = round(meters_by_week.get(week_start, 0.0) / METERS_PER_MILE, 1)
+            if week_start in existing:
+                changed = existing[week_start] != total
+            else:
+                # No need to create a row for an empty week
+                changed = total != 0
+            if changed:
+                rows.append((user.pk, week_start, total))
+        MileageLog.objects.bulk_upsert(rows)
+
+    def _advance_cursor(self, user, newest_start):
+        """Move ``user.last_sync_timestamp`` forward (never backward) to ``newest_start``."""
+        from django.db import transaction
+        from django.contrib.auth import get_user_model
+        
+        with transaction.atomic():
+            locked_user = get_user_model().objects.select_for_update().get(pk=user.pk)
+            if locked_user.last_sync_timestamp is None or newest_start > locked_user.last_sync_timestamp:
+                locked_user.last_sync_timestamp = newest_start
+                locked_user.save(update_fields=['last_sync_timestamp'])
+        user.last_sync_timestamp = locked_user.last_sync_timestamp
+
+    def _activity_from_payload(self, user, activity):
+        """Build an (unsaved) Activity from a Strava activity payload."""
+        from datetime import datetime
+        from .models import Activity
+        from .scoring import get_week_start
+        
+        # start_date_local is the local time where the run happened. 
+        # We treat it as naive or reference time for the 3am logic.
+        activity_dt = datetime.fromisoformat(activity['start_date_local'].replace('Z', ''))
+        
+        return Activity(
+            user=user,
+            strava_id=activity['id'],
+            activity_type=activity.get('type') or '',
+            start_date=self._parse_start_date(activity),
+            # Adjust for "week starts Monday 3am" rule
+            week_start_date=get_week_start(activity_dt),
+            distance=activity.get('distance') or 0.0,
+        )
+
+    @staticmethod
+    def _parse_start_date(activity):
+        """Parse an activity's UTC ``start_date`` into an aware datetime."""
+        from datetime import datetime
+        
+        start_date = activity.get('start_date')
+        if not start_date:
+            return None
+        return datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+        
+    def store_tokens(self, user, tokens):
+        """
+        Persist the refresh token and cache the access token from a Strava token response.
+        
+        Strava may rotate the refresh token on every refresh, so the one it
+        returns always replaces the stored one.
+        """
+        from django.contrib.auth import get_user_model
+        
+        update_fields = []
+        refresh_token = tokens.get('refresh_token')
+        if refresh_token and refresh_token != user.strava_refresh_token:
+            user.strava_refresh_token = refresh_token
+            update_fields.append('strava_refresh_token')
+        
+        # Only the token exchange includes the athlete; webhooks are keyed by it
+        athlete_id = (tokens.get('athlete') or {}).get('id')
+        if athlete_id and athlete_id != user.strava_athlete_id:
+            # The latest account to connect a Strava athlete owns it
+            get_user_model().objects.filter(strava_athlete_id=athlete_id).exclude(pk=user.pk).update(strava_athlete_id=None)
+            user.strava_athlete_id = athlete_id
+            update_fields.append('strava_athlete_id')
+        
+        if update_fields:
+            user.save(update_fields=update_fields)
+        
+        access_token = tokens.get('access_token')
+        expires_at = tokens.get('expires_at')
+        if access_token and expires_at:
+            ttl = int(expires_at - time.time() - TOKEN_EXPIRY_MARGIN)
+            if ttl > 0:
+                cache.set(self._access_token_key(user), access_token, ttl)
+
+    def get_access_token(self, user):
+        """
+        Return a valid access token for ``user``, refreshing it only when needed.
+        
+        Tokens are cached until shortly before they expire. A per-user lock
+        makes sure concurrent workers do a single refresh; the others wait
+        for it and reuse the new token.
+        """
+        key = self._access_token_key(user)
+        access_token = cache.get(key)
+        if access_token:
+            return access_token
+        
+        with cache_lock(f'strava:token_refresh:{user.pk}', timeout=30, wait=10) as acquired:
+            # Another worker may have refreshed while we waited for the lock
+            access_token = cache.get(key)
+            if access_token:
+                return access_token
+            if not acquired:
+                print(f"Timed out waiting for token refresh for user {user.pk}, refreshing anyway")
+            
+            # Use the latest stored refresh token in case it was rotated
+            user.refresh_from_db(fields=['strava_refresh_token'])
+            tokens = self._refresh_access_token(user.strava_refresh_token)
+            self.store_tokens(user, tokens)
+            return tokens['access_token']
+
+    @staticmethod
+    def _access_token_key(user):
+        return f'strava:access_token:{user.pk}'
+
     def _refresh_access_token(self, refresh_token):
-        """Get a new access token using the refresh token."""
-        url = "https://www.strava.com/oauth/token"
+        """Exchange the refresh token for a new access token response."""
+        url = f"{self.oauth_url}/token"
         payload = {
             'client_id': self.client_id,
             'client_secret': self.client_secret,
             'refresh_token': refresh_token,
             'grant_type': 'refresh_token'
         }
-        response = requests.post(url, data=payload)
+        response = self.http.post(url, endpoint='oauth/token', priority=self.priority, data=payload)
         response.raise_for_status()
-        return response.json()['access_token']
+        return response.json()
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import MileageLog
+from .scoring import refresh_weekly_scores
+
+
+@receiver(post_save, sender=MileageLog)
+def mileage_log_saved(sender, instance, **kwargs):
+    """Keep WeeklyScore in sync with every MileageLog write."""
+    refresh_weekly_scores(instance.user_id, [instance.week_start_date])
+
+
+@receiver(post_delete, sender=MileageLog)
+def mileage_log_deleted(sender, instance, origin=None, **kwargs):
+    # Deleting a user cascades to their logs and scores; nothing to refresh
+    origin_model = getattr(origin, 'model', type(origin))
+    if origin is not None and origin_model is not MileageLog:
+        return
+    refresh_weekly_scores(instance.user_id, [instance.week_start_date])
@@ -0,0 +1,188 @@
+from celery import shared_task
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+
+from core.metrics import STRAVA_SYNCS
+from users.models import StravaSyncStatus
+from .ratelimit import BACKGROUND, INTERACTIVE, StravaRateLimitError
+from .services import StravaService
+
+# Longest a queued or running sync blocks another one, in case its task is lost
+SYNC_INFLIGHT_TIMEOUT = 10 * 60
+
+
+def _run_sync(user_id, sync, priority):
+    """Run ``sync(service, user)`` and track its progress in ``strava_sync_status``."""
+    User = get_user_model()
+    user = User.objects.filter(pk=user_id).first()
+    if not user or not user.strava_refresh_token:
+        return
+
+    User.objects.filter(pk=user_id).update(
+        strava_sync_status=StravaSyncStatus.SYNCING, strava_sync_started_at=timezone.now(),
+    )
+    try:
+        sync(StravaService(priority=priority), user)
+    except StravaRateLimitError:
+        # Keep serving stored mileage until the quota resets
+        User.objects.filter(pk=user_id).update(strava_sync_status=StravaSyncStatus.DELAYED)
+        STRAVA_SYNCS.labels('delayed').inc()
+        raise
+    except Exception:
+        User.objects.filter(pk=user_id).update(strava_sync_status=StravaSyncStatus.FAILED)
+        STRAVA_SYNCS.labels('failed').inc()
+        raise
+    User.objects.filter(pk=user_id).update(strava_sync_status=StravaSyncStatus.IDLE, strava_synced_at=timezone.now())
+    STRAVA_SYNCS.labels('success').inc()
+
+
+@shared_task(bind=True, max_retries=5)
+def initial_historical_fetch(self, user_id):
+    """Seed the last 6 weeks of mileage after a user connects Strava."""
+    try:
+        _run_sync(user_id, lambda service, user: service.fetch_initial_data(user), INTERACTIVE)
+    except StravaRateLimitError as e:
+        # The user has no data at all yet, so try again once the window resets
+        raise self.retry(exc=e, countdown=e.retry_after)
+
+
+@shared_task(bind=True, max_retries=None)
+def import_full_history_task(self, user_id, restart=False):
+    """Import a user's whole Strava history in the background, resuming from its checkpoint."""
+    user = get_user_model().objects.filter(pk=user_id).first()
+    if not user or not user.strava_refresh_token:
+        return
+    try:
+        StravaService(priority=BACKGROUND).import_full_history(user, restart=restart)
+    except StravaRateLimitError as e:
+        # Every retry makes progress from the checkpoint, so there is no retry cap.
+        # Retry without `restart`, or the import would start over each time.
+        raise self.retry(args=(user_id,), kwargs={}, exc=e, countdown=e.retry_after)
+
+
+@shared_task
+def update_strava_data_task(user_id, priority=INTERACTIVE):
+    """Merge activities recorded since the user's last sync."""
+    try:
+        _run_sync(user_id, lambda service, user: service.sync_recent_activities(user), priority)
+    except StravaRateLimitError as e:
+        # Stored data is served meanwhile; the next refresh or poll catches up
+        print(f"Strava sync for user {user_id} delayed by rate limit: {e}")
+    finally:
+        cache.delete(_inflight_key(user_id))
+
+
+def _inflight_key(user_id):
+    return f'strava:sync:inflight:{user_id}'
+
+
+def sync_in_progress(user, now=None):
+    """
+    Whether a sync for ``user`` is running. A status left at SYNCING for
+    longer than SYNC_INFLIGHT_TIMEOUT belongs to a lost task and doesn't count.
+    """
+    if user.strava_sync_status != StravaSyncStatus.SYNCING or not user.strava_sync_started_at:
+        return False
+    now = now or timezone.now()
+    return (now - user.strava_sync_started_at).total_seconds() < SYNC_INFLIGHT_TIMEOUT
+
+
+def refresh_if_stale(user, now=None):
+    """
+    Queue a background sync if the user's data is older than STRAVA_STALE_AFTER_SECONDS.
+
+    Only one sync per user is queued or running at a time, however many
+    tabs, devices or polls ask: the in-flight flag lives in the shared cache
+    (Redis in production, process memory locally) and is cleared when the
+    task ends.
+
+    Returns:
+        bool: True if a refresh was queued by this call
+    """
+    now = now or timezone.now()
+    if not user.strava_refresh_token or sync_in_progress(user, now):
+        return False
+
+    if user.strava_synced_at and (now - user.strava_synced_at).total_seconds() < settings.STRAVA_STALE_AFTER_SECONDS:
+        return False
+
+    return queue_sync(user.pk)
+
+
+def queue_sync(user_id, priority=INTERACTIVE, countdown=0):
+    """
+    Queue ``update_strava_data_task`` unless a sync for the user is already queued or running.
+
+    Returns:
+        bool: True if this call queued it
+    """
+    key = _inflight_key(user_id)
+    if not cache.add(key, True, countdown + SYNC_INFLIGHT_TIMEOUT):
+        return False
+    try:
+        update_strava_data_task.apply_async((user_id,), {'priority': priority}, countdown=countdown)
+    except Exception:
+        cache.delete(key)
+        raise
+    return True
+
+
+@shared_task
+def schedule_polls():
+    """Queue background syncs for the users whose poll falls in this beat tick."""
+    from .polling import due_polls
+
+    due = due_polls(timezone.now(), settings.STRAVA_POLL_TICK_SECONDS)
+    queued = sum(queue_sync(user_id, BACKGROUND, countdown) for user_id, countdown in due)
+    print(f"Queued {queued} of {len(due)} due Strava polls")
+
+
+@shared_task
+def process_webhook_events(athlete_id, deauthorized=False):
+    """Apply one athlete's coalesced webhook events, fetching only what changed."""
+    from . import webhooks
+
+    User = get_user_model()
+    user = User.objects.filter(strava_athlete_id=athlete_id).first()
+    if deauthorized:
+        # Only forget the tokens once Strava itself refuses them
+        if user and user.strava_refresh_token and StravaService(priority=BACKGROUND).is_deauthorized(user):
+            StravaService().revoke(user)
+        return
+
+    events = webhooks.pop_events(athlete_id)
+    if not user or not events:
+        return
+
+    # Deletes and type changes need no Strava call at all
+    deleted = [activity_id for activity_id, event in events.items() if event['aspect_type'] == webhooks.DELETE]
+    if deleted:
+        StravaService().remove_activities(user, deleted)
+
+    updates = {
+        activity_id: event['updates'] for activity_id, event in events.items()
+        if event['aspect_type'] == webhooks.UPDATE
+    }
+    new_types = {activity_id: u['type'] for activity_id, u in updates.items() if 'type' in u}
+    if new_types:
+        StravaService().change_activity_types(user, new_types)
+    # Title and privacy edits don't change mileage; anything else gets re-fetched
+    needs_refresh = any(set(u) - {'type', 'title', 'private'} for u in updates.values())
+
+    # New activities are fetched by id: a backdated upload starts before the sync cursor
+    created = [activity_id for activity_id, event in events.items() if event['aspect_type'] == webhooks.CREATE]
+    if not needs_refresh and not created:
+        return
+
+    def sync(service, user):
+        if needs_refresh:
+            service.refresh_recent_weeks(user)
+        if created:
+            service.sync_activities_by_id(user, created)
+
+    try:
+        _run_sync(user.pk, sync, BACKGROUND)
+    except StravaRateLimitError as e:
+        webhooks.requeue_events(athlete_id, events, e.retry_after)
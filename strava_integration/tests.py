@@ -1,6 +1,20 @@
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.test import TransactionTestCase, override_settings
+import json
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+import time
+from django.core.cache import cache
+from users.models import StravaSyncStatus
+from .models import Activity, MileageLog, WeeklyScore
+from .client import StravaClient
+from .ratelimit import BACKGROUND, INTERACTIVE, RateLimitGovernor, StravaRateLimitError
+from .services import StravaService
+import requests
+from prometheus_client import REGISTRY
 
 User = get_user_model()
 
@@ -23,3 +37,1019 @@ class StravaIntegrationTests(TestCase):
         
         self.user.refresh_from_db()
         self.assertEqual(self.user.strava_refresh_token, 'fake_refresh_token')
+
+
+class BatchScoreTests(TestCase):
+    def setUp(self):
+        from strava_integration.scoring import get_current_week_start
+
+        self.current_week_start = get_current_week_start()
+        self.users = [
+            User.objects.create_user(firebase_uid=f'batch_user_{i}', phone_number=f'+1555000000{i}')
+            for i in range(3)
+        ]
+        for user in self.users:
+            for i, mileage in enumerate([25.0, 20.0, 22.0, 18.0, 24.0]):
+                MileageLog.objects.create(
+                    user=user,
+                    week_start_date=self.current_week_start - timedelta(weeks=i),
+                    total_mileage=mileage,
+                )
+
+    def test_compute_all_scores(self):
+        from strava_integration.batch import compute_all_scores
+
+        stats = compute_all_scores(batch_size=4)
+
+        self.assertEqual(stats['users'], 3)
+        self.assertEqual(stats['weeks'], 27)
+        score = WeeklyScore.objects.get(user=self.users[0], week_start_date=self.current_week_start)
+        self.assertEqual(score.acute_mileage, 25.0)
+        self.assertEqual(score.chronic_mileage, 21.0)
+        self.assertAlmostEqual(score.critical_score, 25.0 / 21.0)
+        self.assertEqual(score.recommended_capacity, 26.25)
+        oldest = WeeklyScore.objects.get(user=self.users[0], week_start_date=self.current_week_start - timedelta(weeks=4))
+        self.assertIsNone(oldest.critical_score)
+
+    def test_compute_scores_by_shard(self):
+        from strava_integration.batch import compute_all_scores
+
+        covered = set()
+        for shard in range(2):
+            compute_all_scores(shard=shard, num_shards=2)
+            covered |= set(WeeklyScore.objects.values_list('user_id', flat=True))
+
+        self.assertEqual(covered, {user.id for user in self.users})
+        with self.assertRaises(ValueError):
+            compute_all_scores(shard=2, num_shards=2)
+
+    def test_users_without_logs_lose_their_scores(self):
+        from strava_integration.batch import compute_all_scores
+
+        # Scores left over from logs removed without going through the signals
+        user = User.objects.create_user(firebase_uid='batch_user_no_logs')
+        WeeklyScore.objects.create(user=user, week_start_date=self.current_week_start, acute_mileage=10.0)
+        for shard in range(2):
+            compute_all_scores(shard=shard, num_shards=2)
+
+        self.assertFalse(WeeklyScore.objects.filter(user=user).exists())
+        self.assertTrue(WeeklyScore.objects.filter(user=self.users[0]).exists())
+
+
+class WeeklyScoreMaintenanceTests(TestCase):
+    def setUp(self):
+        from strava_integration.scoring import get_current_week_start
+
+        self.current_week_start = get_current_week_start()
+        self.user = User.objects.create_user(firebase_uid='score_user', phone_number='+15555550100')
+
+    def test_mileage_write_updates_affected_weeks(self):
+        week = self.current_week_start - timedelta(weeks=2)
+        log = MileageLog.objects.create(user=self.user, week_start_date=week, total_mileage=20.0)
+
+        scores = WeeklyScore.objects.filter(user=self.user)
+        self.assertEqual(scores.count(), 5)
+        self.assertEqual(scores.get(week_start_date=week).acute_mileage, 20.0)
+        self.assertEqual(scores.get(week_start_date=self.current_week_start).chronic_mileage, 5.0)
+
+        log.total_mileage = 40.0
+        log.save()
+        self.assertEqual(scores.get(week_start_date=self.current_week_start).chronic_mileage, 10.0)
+
+        other = MileageLog.objects.create(user=self.user, week_start_date=self.current_week_start, total_mileage=5.0)
+        log.delete()
+        self.assertEqual(scores.get(week_start_date=self.current_week_start).chronic_mileage, 0.0)
+
+        # Nothing left to score from
+        other.delete()
+        self.assertFalse(scores.exists())
+
+    def test_deleting_user_removes_scores(self):
+        MileageLog.objects.create(user=self.user, week_start_date=self.current_week_start, total_mileage=20.0)
+        self.user.delete()
+        self.assertFalse(WeeklyScore.objects.exists())
+
+
+def make_activity(start, miles, activity_type='Run'):
+    """Build a Strava activity payload starting at the aware UTC datetime ``start``."""
+    return {
+        'id': int(start.timestamp()),
+        'type': activity_type,
+        'distance': miles * 1609.34,
+        'start_date': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'start_date_local': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+    }
+
+
+class IncrementalSyncTests(TestCase):
+    def setUp(self):
+        from strava_integration.scoring import get_current_week_start
+
+        self.user = User.objects.create_user(
+            firebase_uid='sync_user',
+            phone_number='+15555550101',
+            strava_refresh_token='refresh',
+        )
+        week_start = get_current_week_start()
+        self.week_start = week_start
+        self.monday = datetime(week_start.year, week_start.month, week_start.day, 12, tzinfo=dt_timezone.utc)
+
+    def _sync(self, activities):
+        service = StravaService()
+        with mock.patch.object(service, 'get_access_token', return_value='access'), \
+                mock.patch.object(service, 'iter_activities', side_effect=lambda *a, **kw: iter(activities)) as fetch:
+            service.sync_recent_activities(self.user)
+        return fetch
+
+    def test_merges_only_activities_after_cursor(self):
+        already_counted = make_activity(self.monday, 5.0)
+        self._sync([already_counted])
+        self.assertEqual(MileageLog.objects.get(user=self.user).total_mileage, 5.0)
+
+        new_run = make_activity(self.monday + timedelta(hours=2), 3.0)
+        new_ride = make_activity(self.monday + timedelta(hours=3), 20.0, activity_type='Ride')
+        fetch = self._sync([already_counted, new_run, new_ride])
+
+        self.assertEqual(fetch.call_args[1]['after'], self.monday)
+        self.assertEqual(MileageLog.objects.get(user=self.user).total_mileage, 8.0)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_sync_timestamp, self.monday + timedelta(hours=3))
+
+        # Replaying the same response must not double count
+        self._sync([new_run, new_ride])
+        self.assertEqual(MileageLog.objects.get(user=self.user).total_mileage, 8.0)
+        self.assertEqual(Activity.objects.filter(user=self.user).count(), 3)
+
+    def test_edited_activity_moves_between_weeks(self):
+        run = make_activity(self.monday, 5.0)
+        self._sync([run, make_activity(self.monday + timedelta(hours=1), 2.0)])
+
+        moved = dict(run, start_date_local=(self.monday - timedelta(weeks=1)).strftime('%Y-%m-%dT%H:%M:%SZ'))
+        self._sync([moved])
+
+        totals = dict(MileageLog.objects.filter(user=self.user).values_list('week_start_date', 'total_mileage'))
+        self.assertEqual(totals[self.week_start], 2.0)
+        self.assertEqual(totals[self.week_start - timedelta(weeks=1)], 5.0)
+
+    def test_activity_moving_to_another_user_leaves_old_owners_week(self):
+        run = make_activity(self.monday, 5.0)
+        self._sync([run, make_activity(self.monday + timedelta(hours=1), 2.0)])
+
+        # The athlete re-linked to a new account
+        new_owner = User.objects.create_user(firebase_uid='relinked_user')
+        with mock.patch('builtins.print'):
+            StravaService().import_activities(new_owner, [run])
+
+        self.assertEqual(MileageLog.objects.get(user=self.user).total_mileage, 2.0)
+        self.assertEqual(MileageLog.objects.get(user=new_owner).total_mileage, 5.0)
+
+    def test_first_sync_seeds_history(self):
+        fetch = self._sync([make_activity(self.monday, 4.0)])
+
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(MileageLog.objects.get(user=self.user).total_mileage, 4.0)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_sync_timestamp, self.monday)
+
+
+class ActivityPaginationTests(TestCase):
+    def _page_responses(self, total, per_page):
+        activities = [{'id': i} for i in range(total)]
+        pages = [activities[i:i + per_page] for i in range(0, total, per_page)]
+        if total % per_page == 0:
+            pages.append([])
+        responses = []
+        for page in pages:
+            response = mock.Mock()
+            response.json.return_value = page
+            responses.append(response)
+        return responses
+
+    def test_walks_every_page(self):
+        for prefetch in (False, True):
+            service = StravaService()
+            with mock.patch.object(service.http, 'get', side_effect=self._page_responses(5, 2)) as get:
+                activities = list(service.iter_activities('access', per_page=2, prefetch=prefetch))
+
+            self.assertEqual([a['id'] for a in activities], [0, 1, 2, 3, 4])
+            self.assertEqual([c[1]['params']['page'] for c in get.call_args_list], [1, 2, 3])
+
+    def test_exact_multiple_requests_trailing_empty_page(self):
+        service = StravaService()
+        with mock.patch.object(service.http, 'get', side_effect=self._page_responses(4, 2)) as get:
+            activities = list(service.iter_activities('access', per_page=2))
+
+        self.assertEqual(len(activities), 4)
+        self.assertEqual(get.call_count, 3)
+
+
+class AccessTokenCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            firebase_uid='token_user',
+            phone_number='+15555550102',
+            strava_refresh_token='refresh_1',
+        )
+        self.service = StravaService()
+
+    def test_reuses_token_until_expiry(self):
+        tokens = {'access_token': 'access_1', 'refresh_token': 'refresh_2', 'expires_at': time.time() + 6 * 3600}
+        with mock.patch.object(self.service, '_refresh_access_token', return_value=tokens) as refresh:
+            self.assertEqual(self.service.get_access_token(self.user), 'access_1')
+            self.assertEqual(self.service.get_access_token(self.user), 'access_1')
+
+        refresh.assert_called_once_with('refresh_1')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.strava_refresh_token, 'refresh_2')
+
+    def test_refreshes_token_close_to_expiry(self):
+        tokens = {'access_token': 'access_1', 'refresh_token': 'refresh_1', 'expires_at': time.time() + 60}
+        with mock.patch.object(self.service, '_refresh_access_token', return_value=tokens) as refresh:
+            self.service.get_access_token(self.user)
+            self.service.get_access_token(self.user)
+
+        self.assertEqual(refresh.call_count, 2)
+
+
+class StravaClientTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _response(self, status_code):
+        response = mock.Mock()
+        response.status_code = status_code
+        response.headers = {}
+        return response
+
+    def test_retries_server_errors_with_backoff(self):
+        client = StravaClient(max_retries=2)
+        labels = {'endpoint': 'athlete', 'status': '503'}
+        before = REGISTRY.get_sample_value('strava_request_duration_seconds_count', labels) or 0
+        responses = [self._response(503), self._response(502), self._response(200)]
+        with mock.patch.object(client.session, 'request', side_effect=responses) as request, \
+                mock.patch('strava_integration.client.time.sleep') as sleep:
+            response = client.get('https://www.strava.com/api/v3/athlete', endpoint='athlete')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(request.call_args[1]['timeout'], client.timeout)
+        self.assertEqual(REGISTRY.get_sample_value('strava_request_duration_seconds_count', labels), before + 1)
+
+    def test_gives_up_after_max_retries(self):
+        client = StravaClient(max_retries=1)
+        with mock.patch.object(client.session, 'request', side_effect=requests.ConnectionError), \
+                mock.patch('strava_integration.client.time.sleep'):
+            with self.assertRaises(requests.ConnectionError):
+                client.get('https://www.strava.com/api/v3/athlete')
+
+    def test_does_not_retry_client_errors(self):
+        client = StravaClient()
+        with mock.patch.object(client.session, 'request', return_value=self._response(404)) as request:
+            self.assertEqual(client.get('https://www.strava.com/api/v3/athlete').status_code, 404)
+        self.assertEqual(request.call_count, 1)
+
+
+    def test_token_posts_are_only_retried_when_never_sent(self):
+        from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+        client = StravaClient(max_retries=2)
+        url = 'https://www.strava.com/oauth/token'
+        with mock.patch('strava_integration.client.time.sleep'):
+            # Strava may already have used the code or rotated the refresh token
+            for outcome in (requests.ReadTimeout(), self._response(503)):
+                with mock.patch.object(client.session, 'request', side_effect=[outcome, self._response(200)]) as request:
+                    try:
+                        client.post(url)
+                    except requests.ReadTimeout:
+                        pass
+                self.assertEqual(request.call_count, 1)
+
+            refused = requests.ConnectionError(MaxRetryError(None, url, NewConnectionError(None, 'refused')))
+            with mock.patch.object(client.session, 'request', side_effect=[refused, self._response(200)]) as request:
+                self.assertEqual(client.post(url).status_code, 200)
+            self.assertEqual(request.call_count, 2)
+
+class OnboardingTaskTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(firebase_uid='onboarding_user', phone_number='+15555550103')
+        self.client.force_login(self.user)
+
+    def test_callback_queues_initial_fetch(self):
+        tokens = {'access_token': 'access', 'refresh_token': 'refresh', 'expires_at': time.time() + 6 * 3600}
+        with mock.patch.object(StravaService, 'exchange_token', return_value=tokens), \
+                mock.patch('strava_integration.views.initial_historical_fetch.delay') as delay:
+            response = self.client.get(reverse('strava:callback'), {'code': 'auth_code'})
+
+        self.assertRedirects(response, reverse('dashboard:index'), fetch_redirect_response=False)
+        delay.assert_called_once_with(self.user.pk)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.strava_refresh_token, 'refresh')
+        self.assertEqual(self.user.strava_sync_status, StravaSyncStatus.SYNCING)
+
+        response = self.client.get(reverse('dashboard:index'))
+        self.assertContains(response, 'Syncing your Strava activities')
+
+    def test_task_runs_eagerly_and_clears_status(self):
+        from .tasks import initial_historical_fetch
+
+        self.user.strava_refresh_token = 'refresh'
+        self.user.save()
+        with mock.patch.object(StravaService, 'fetch_initial_data') as fetch:
+            initial_historical_fetch.delay(self.user.pk)
+
+        fetch.assert_called_once()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.strava_sync_status, StravaSyncStatus.IDLE)
+
+    def test_failed_task_marks_status(self):
+        from .tasks import update_strava_data_task
+
+        self.user.strava_refresh_token = 'refresh'
+        self.user.save()
+        with mock.patch.object(StravaService, 'sync_recent_activities', side_effect=requests.HTTPError):
+            update_strava_data_task.delay(self.user.pk)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.strava_sync_status, StravaSyncStatus.FAILED)
+
+
+class RateLimitGovernorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = 1_700_000_000 - (1_700_000_000 % 900)  # start of a 15-minute window
+        self.governor = RateLimitGovernor(short_limit=10, long_limit=100, background_share=0.5)
+
+    def _response(self, status_code=200, usage=None, limit=None):
+        response = mock.Mock()
+        response.status_code = status_code
+        response.headers = {}
+        if usage:
+            response.headers['X-RateLimit-Usage'] = usage
+        if limit:
+            response.headers['X-RateLimit-Limit'] = limit
+        return response
+
+    def test_background_calls_leave_room_for_interactive(self):
+        for _ in range(5):
+            self.governor.acquire(BACKGROUND, now=self.now)
+        with self.assertRaises(StravaRateLimitError) as ctx:
+            self.governor.acquire(BACKGROUND, now=self.now)
+        self.assertEqual(ctx.exception.retry_after, 900)
+
+        for _ in range(5):
+            self.governor.acquire(INTERACTIVE, now=self.now)
+        with self.assertRaises(StravaRateLimitError):
+            self.governor.acquire(INTERACTIVE, now=self.now)
+
+        # A new window starts with a fresh budget
+        self.governor.acquire(BACKGROUND, now=self.now + 900)
+
+    def test_usage_headers_update_shared_counters(self):
+        self.governor.observe(self._response(usage='9,50', limit='10,100'), now=self.now)
+        self.governor.acquire(INTERACTIVE, now=self.now)
+        with self.assertRaises(StravaRateLimitError):
+            self.governor.acquire(INTERACTIVE, now=self.now)
+
+    def test_429_blocks_every_caller_until_reset(self):
+        hits = REGISTRY.get_sample_value('strava_rate_limit_hits_total', {'priority': INTERACTIVE, 'source': '429'}) or 0
+        with self.assertRaises(StravaRateLimitError):
+            self.governor.observe(self._response(429, usage='10,50'), now=self.now + 60)
+        with self.assertRaises(StravaRateLimitError) as ctx:
+            self.governor.acquire(INTERACTIVE, now=self.now + 120)
+        self.assertEqual(ctx.exception.retry_after, 780)
+        self.assertEqual(
+            REGISTRY.get_sample_value('strava_rate_limit_hits_total', {'priority': INTERACTIVE, 'source': '429'}),
+            hits + 1,
+        )
+
+    def test_rate_limited_sync_marks_user_delayed(self):
+        from .tasks import update_strava_data_task
+
+        user = User.objects.create_user(firebase_uid='limited_user', strava_refresh_token='refresh')
+        delayed = REGISTRY.get_sample_value('strava_syncs_total', {'outcome': 'delayed'}) or 0
+        with mock.patch.object(StravaService, 'sync_recent_activities', side_effect=StravaRateLimitError(60)):
+            update_strava_data_task.delay(user.pk)
+
+        user.refresh_from_db()
+        self.assertEqual(user.strava_sync_status, StravaSyncStatus.DELAYED)
+        self.assertEqual(REGISTRY.get_sample_value('strava_syncs_total', {'outcome': 'delayed'}), delayed + 1)
+
+
+@override_settings(STRAVA_WEBHOOK_VERIFY_TOKEN='verify-me', STRAVA_WEBHOOK_SUBSCRIPTION_ID='42')
+class WebhookTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.webhook_url = reverse('strava:webhook')
+        self.user = User.objects.create_user(
+            firebase_uid='webhook_user',
+            strava_refresh_token='refresh',
+            strava_athlete_id=1234,
+        )
+
+    def _post(self, aspect_type, object_id, object_type='activity', updates=None, subscription_id=42):
+        event = {
+            'subscription_id': subscription_id,
+            'object_type': object_type,
+            'object_id': object_id,
+            'aspect_type': aspect_type,
+            'owner_id': 1234,
+            'updates': updates or {},
+        }
+        return self.client.post(self.webhook_url, json.dumps(event), content_type='application/json')
+
+    def test_subscription_challenge(self):
+        response = self.client.get(self.webhook_url, {'hub.mode': 'subscribe', 'hub.challenge': 'abc', 'hub.verify_token': 'verify-me'})
+        self.assertEqual(response.json(), {'hub.challenge': 'abc'})
+
+        response = self.client.get(self.webhook_url, {'hub.challenge': 'abc', 'hub.verify_token': 'wrong'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_rejects_bodies_that_are_not_events(self):
+        event = {'subscription_id': 42, 'object_type': 'activity', 'object_id': 1, 'aspect_type': 'create'}
+        with mock.patch('strava_integration.tasks.process_webhook_events.apply_async') as apply_async:
+            for body in ('[]', '"x"', '1', 'null', json.dumps(event), json.dumps(dict(event, owner_id=1234, updates='x'))):
+                with self.subTest(body=body):
+                    response = self.client.post(self.webhook_url, body, content_type='application/json')
+                    self.assertEqual(response.status_code, 400)
+
+        apply_async.assert_not_called()
+
+    def test_events_are_coalesced_per_athlete(self):
+        from . import webhooks
+
+        with mock.patch('strava_integration.tasks.process_webhook_events.apply_async') as apply_async:
+            self.assertEqual(self._post('create', 1).status_code, 200)
+            self._post('update', 1, updates={'title': 'Morning Run'})
+            self._post('create', 2)
+            self._post('delete', 2)
+            self._post('update', 3, updates={'type': 'Ride'})
+            self._post('update', 3, updates={'title': 'Commute'})
+
+        apply_async.assert_called_once_with((1234,), countdown=30)
+        self.assertEqual(webhooks.pop_events(1234), {
+            1: {'aspect_type': 'create', 'updates': {}},
+            2: {'aspect_type': 'delete', 'updates': {}},
+            3: {'aspect_type': 'update', 'updates': {'type': 'Ride', 'title': 'Commute'}},
+        })
+
+    def test_creates_are_fetched_by_id(self):
+        from .fake_server import FakeStrava, FakeStravaServer
+        from .tasks import process_webhook_events
+
+        api = FakeStrava(seed=4, history_weeks=8, activities_per_week=2)
+        # A run uploaded late: it started weeks before the sync cursor
+        backdated = next(a for a in api.activities(1234) if a['type'] == 'Run')
+        self.user.last_sync_timestamp = api.now
+        self.user.save()
+        cache.set(StravaService._access_token_key(self.user), 'fake-access-1234', 60)
+
+        with mock.patch('strava_integration.tasks.process_webhook_events.apply_async'):
+            self._post('create', backdated['id'])
+            self._post('create', 999999999)
+        with FakeStravaServer(api) as server, override_settings(STRAVA_API_URL=server.api_url), \
+                mock.patch.object(StravaService, 'sync_recent_activities') as delta, \
+                mock.patch('builtins.print'):
+            process_webhook_events(1234)
+
+        delta.assert_not_called()
+        self.assertEqual(list(Activity.objects.filter(user=self.user).values_list('strava_id', flat=True)), [backdated['id']])
+        self.assertEqual(MileageLog.objects.get(user=self.user).total_mileage, round(backdated['distance'] / 1609.34, 1))
+
+    def test_deletes_and_type_changes_need_no_fetch(self):
+        from .scoring import get_current_week_start
+        from .tasks import process_webhook_events
+
+        week_start = get_current_week_start()
+        monday = datetime(week_start.year, week_start.month, week_start.day, 12, tzinfo=dt_timezone.utc)
+        service = StravaService()
+        with mock.patch.object(StravaService, 'get_access_token', return_value='access'), \
+                mock.patch.object(StravaService, 'iter_activities', return_value=iter([
+                    dict(make_activity(monday, 4.0), id=1),
+                    dict(make_activity(monday, 6.0), id=2),
+                    dict(make_activity(monday, 3.0), id=3),
+                ])):
+            service.fetch_initial_data(self.user)
+        self.assertEqual(MileageLog.objects.get(user=self.user).total_mileage, 13.0)
+
+        with mock.patch('strava_integration.tasks.process_webhook_events.apply_async'):
+            self._post('delete', 2)
+            self._post('update', 3, updates={'type': 'Ride'})
+            self._post('update', 1, updates={'title': 'Easy run'})
+        with mock.patch.object(StravaService, 'iter_activities') as fetch:
+            process_webhook_events(1234)
+
+        fetch.assert_not_called()
+        self.assertEqual(MileageLog.objects.get(user=self.user).total_mileage, 4.0)
+
+    def test_deauthorization_revokes_tokens(self):
+        refused = requests.Response()
+        refused.status_code = 400
+        with mock.patch.object(StravaService, '_refresh_access_token',
+                               side_effect=requests.HTTPError(response=refused)):
+            self._post('update', 1234, object_type='athlete', updates={'authorized': 'false'})
+
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.strava_refresh_token)
+
+    def test_unconfirmed_or_foreign_deauthorization_keeps_tokens(self):
+        tokens = {'access_token': 'access', 'refresh_token': 'rotated', 'expires_at': int(time.time()) + 3600}
+        deauthorize = {'object_type': 'athlete', 'updates': {'authorized': 'false'}}
+        with mock.patch('strava_integration.tasks.process_webhook_events.apply_async') as apply_async:
+            self._post('update', 1234, subscription_id=7, **deauthorize)
+            self._post('create', 1, subscription_id=None)
+        apply_async.assert_not_called()
+
+        # Strava still accepts the refresh token, so the event was not from Strava
+        with mock.patch.object(StravaService, '_refresh_access_token', return_value=tokens) as refresh:
+            self._post('update', 1234, **deauthorize)
+        refresh.assert_called_once()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.strava_refresh_token, 'rotated')
+
+
+class MileageBulkUpsertTests(TestCase):
+    def setUp(self):
+        from strava_integration.scoring import get_current_week_start
+
+        self.week_start = get_current_week_start()
+        self.users = [User.objects.create_user(firebase_uid=f'bulk_user_{i}') for i in range(2)]
+
+    def test_upserts_many_users_in_one_statement(self):
+        MileageLog.objects.create(user=self.users[0], week_start_date=self.week_start, total_mileage=1.0)
+        rows = [
+            (user.pk, self.week_start - timedelta(weeks=i), 10.0 + i)
+            for user in self.users for i in range(3)
+        ]
+
+        # Savepoint + release, one upsert, then a read and a write per user for WeeklyScore
+        with self.assertNumQueries(3 + 2 * len(self.users)):
+            written = MileageLog.objects.bulk_upsert(rows)
+
+        self.assertEqual(written, 6)
+        self.assertEqual(MileageLog.objects.count(), 6)
+        self.assertEqual(MileageLog.objects.get(user=self.users[0], week_start_date=self.week_start).total_mileage, 10.0)
+        score = WeeklyScore.objects.get(user=self.users[1], week_start_date=self.week_start)
+        self.assertEqual(score.chronic_mileage, (11.0 + 12.0) / 4)
+
+
+class FakeStravaServerTests(TestCase):
+    def setUp(self):
+        from .fake_server import FakeStrava, FakeStravaServer
+
+        cache.clear()
+        self.api = FakeStrava(seed=1, history_weeks=8, activities_per_week=4)
+        self.server = FakeStravaServer(self.api).start()
+        self.addCleanup(self.server.stop)
+        settings = override_settings(STRAVA_API_URL=self.server.api_url, STRAVA_OAUTH_URL=self.server.oauth_url)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.service = StravaService()
+        self.service.http = StravaClient(backoff_base=0.001)
+
+    def test_exchanges_token_and_pages_through_history(self):
+        tokens = self.service.exchange_token('42')
+        self.assertEqual(tokens['athlete']['id'], 42)
+
+        after = self.api.now - timedelta(weeks=4)
+        activities = list(self.service.iter_activities(tokens['access_token'], after=after, per_page=5))
+
+        expected = [a['id'] for a in self.api.activities(42) if a['_ts'] > int(after.timestamp())]
+        self.assertEqual([a['id'] for a in activities], expected)
+        self.assertEqual(self.api.requests, 1 + len(expected) // 5 + 1)
+
+    def test_retries_injected_server_errors(self):
+        tokens = self.service.exchange_token('7')
+        self.api.inject(503, count=2)
+        labels = {'endpoint': 'athlete/activities', 'status': '503'}
+        before = REGISTRY.get_sample_value('strava_request_duration_seconds_count', labels) or 0
+
+        activities = list(self.service.iter_activities(tokens['access_token']))
+
+        self.assertEqual(len(activities), 32)
+        self.assertEqual(REGISTRY.get_sample_value('strava_request_duration_seconds_count', labels), before + 2)
+
+    def test_429_pauses_calls(self):
+        tokens = self.service.exchange_token('7')
+        self.api.inject(429)
+
+        with self.assertRaises(StravaRateLimitError):
+            list(self.service.iter_activities(tokens['access_token']))
+        requests_made = self.api.requests
+        with self.assertRaises(StravaRateLimitError):
+            list(self.service.iter_activities(tokens['access_token']))
+        self.assertEqual(self.api.requests, requests_made)
+
+    def test_initial_fetch_over_http(self):
+        user = User.objects.create_user(firebase_uid='fake_strava_user')
+        self.service.store_tokens(user, self.service.exchange_token('9'))
+
+        with mock.patch('builtins.print'):
+            self.service.fetch_initial_data(user)
+
+        self.assertEqual(user.strava_athlete_id, 9)
+        self.assertTrue(MileageLog.objects.filter(user=user).exists())
+
+
+class BackfillTests(TransactionTestCase):
+    def setUp(self):
+        import tempfile
+
+        from .fake_server import FakeStrava, FakeStravaServer
+
+        cache.clear()
+        self.server = FakeStravaServer(FakeStrava(seed=2, history_weeks=8, activities_per_week=3)).start()
+        self.addCleanup(self.server.stop)
+        settings = override_settings(STRAVA_API_URL=self.server.api_url, STRAVA_OAUTH_URL=self.server.oauth_url)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        printing = mock.patch('builtins.print')
+        printing.start()
+        self.addCleanup(printing.stop)
+
+        self.checkpoint_path = os.path.join(tempfile.mkdtemp(), 'backfill.json')
+        self.users = [
+            User.objects.create_user(firebase_uid=f'backfill_{i}', strava_refresh_token=f'fake-refresh-{i + 1}')
+            for i in range(3)
+        ]
+        User.objects.create_user(firebase_uid='not_connected')
+
+    def test_syncs_connected_users_and_resumes_from_checkpoint(self):
+        from .backfill import Checkpoint, backfill, connected_user_ids
+
+        user_ids = connected_user_ids()
+        self.assertEqual(user_ids, [user.pk for user in self.users])
+
+        # One worker: the in-memory SQLite test database can't take concurrent writers
+        stats = backfill(user_ids, concurrency=1, checkpoint=Checkpoint(self.checkpoint_path))
+        self.assertEqual(stats['failures'], {})
+        self.assertEqual(stats['synced'], 3)
+        self.assertEqual(set(MileageLog.objects.values_list('user_id', flat=True)), set(user_ids))
+
+        stats = backfill(user_ids, concurrency=1, checkpoint=Checkpoint(self.checkpoint_path))
+        self.assertEqual((stats['skipped'], stats['synced'], stats['calls']), (3, 0, 0))
+
+    def test_budget_and_failures(self):
+        from .backfill import Checkpoint, backfill
+
+        User.objects.filter(pk=self.users[0].pk).update(strava_refresh_token='revoked')
+        user_ids = [user.pk for user in self.users]
+
+        # Each user needs a token refresh and one activities page
+        stats = backfill(user_ids, concurrency=1, budget=3, checkpoint=Checkpoint(self.checkpoint_path))
+        self.assertTrue(stats['budget_exhausted'])
+        self.assertEqual(stats['calls'], 3)
+        self.assertEqual(list(stats['failures']), [self.users[0].pk])
+        self.assertEqual(stats['synced'], 1)
+
+        stats = backfill(user_ids, concurrency=1, checkpoint=Checkpoint(self.checkpoint_path))
+        self.assertEqual((stats['skipped'], stats['synced']), (1, 1))
+        self.assertEqual(list(stats['failures']), [self.users[0].pk])
+
+
+class HistoryImportTests(TestCase):
+    def setUp(self):
+        from .fake_server import FakeStrava, FakeStravaServer
+
+        cache.clear()
+        self.api = FakeStrava(seed=3, history_weeks=104, activities_per_week=2)
+        # Leave a gap between 30 and 90 weeks ago
+        gap = (self.api.now - timedelta(weeks=90)).timestamp(), (self.api.now - timedelta(weeks=30)).timestamp()
+        self.api._activities[5] = [a for a in self.api.activities(5) if not gap[0] < a['_ts'] < gap[1]]
+        self.server = FakeStravaServer(self.api).start()
+        self.addCleanup(self.server.stop)
+        settings = override_settings(STRAVA_API_URL=self.server.api_url, STRAVA_OAUTH_URL=self.server.oauth_url)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        printing = mock.patch('builtins.print')
+        printing.start()
+        self.addCleanup(printing.stop)
+
+        self.user = User.objects.create_user(firebase_uid='history_user', strava_refresh_token='fake-refresh-5')
+        self.service = StravaService(priority=BACKGROUND)
+
+    def test_imports_whole_history_and_jumps_gaps(self):
+        from .services import METERS_PER_MILE, RUN_TYPES
+
+        state = self.service.import_full_history(self.user, window_weeks=26)
+
+        self.assertIsNotNone(state.completed_at)
+        # Two windows of recent runs, an empty one whose probe jumps the gap, the oldest runs, a last empty one
+        self.assertEqual(state.windows_done, 5)
+        history = self.api.activities(5)
+        self.assertEqual(state.activities_seen, len(history))
+        self.assertEqual(Activity.objects.filter(user=self.user).count(), len(history))
+        run_miles = sum(a['distance'] for a in history if a['type'] in RUN_TYPES) / METERS_PER_MILE
+        logged = sum(MileageLog.objects.filter(user=self.user).values_list('total_mileage', flat=True))
+        self.assertAlmostEqual(logged, run_miles, delta=0.05 * 104)
+
+        requests_made = self.api.requests
+        self.service.import_full_history(self.user)
+        self.assertEqual(self.api.requests, requests_made)
+
+    def test_rate_limit_resumes_from_last_completed_window(self):
+        original = StravaService._sync_window
+        windows = []
+
+        def sync_window(service, user, access_token, after, before=None, seen_ids=None):
+            if len(windows) == 1 and not hasattr(sync_window, 'limited'):
+                sync_window.limited = True
+                raise StravaRateLimitError(60)
+            windows.append(before)
+            return original(service, user, access_token, after, before, seen_ids)
+
+        with mock.patch.object(StravaService, '_sync_window', autospec=True, side_effect=sync_window):
+            with self.assertRaises(StravaRateLimitError):
+                self.service.import_full_history(self.user, window_weeks=26)
+            self.assertEqual(self.user.history_import.windows_done, 1)
+
+            state = self.service.import_full_history(self.user, window_weeks=26)
+
+        self.assertIsNotNone(state.completed_at)
+        self.assertEqual(len(windows), len(set(windows)))
+        self.assertEqual(Activity.objects.filter(user=self.user).count(), len(self.api.activities(5)))
+
+
+# One mile north, in degrees of latitude
+MILE_NORTH = 1609.34 / (6371008.8 * 3.141592653589793 / 180)
+
+
+def gpx_file(start, segments, activity_type='running'):
+    """Build a GPX track of ``segments``, each a list of (lat, lon), starting at the aware UTC ``start``."""
+    segs = ''.join(
+        '<trkseg>' + ''.join(
+            f'<trkpt lat="{lat}" lon="{lon}"><ele>10</ele>'
+            + (f'<time>{start:%Y-%m-%dT%H:%M:%S}.000Z</time>' if i == j == 0 else '') + '</trkpt>'
+            for j, (lat, lon) in enumerate(points)
+        ) + '</trkseg>'
+        for i, points in enumerate(segments)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1">'
+        f'<metadata><time>{start:%Y-%m-%dT%H:%M:%SZ}</time></metadata>'
+        f'<trk><name>Morning Run</name><type>{activity_type}</type>{segs}</trk></gpx>'
+    ).encode()
+
+
+def tcx_file(start, laps, sport='Running'):
+    """Build a TCX activity with one lap per distance in ``laps``, with Strava's leading whitespace."""
+    ns = 'http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2'
+    body = ''.join(
+        f'<Lap StartTime="{start:%Y-%m-%dT%H:%M:%SZ}"><TotalTimeSeconds>600</TotalTimeSeconds>'
+        f'<DistanceMeters>{meters}</DistanceMeters><Track>'
+        f'<Trackpoint><Time>{start:%Y-%m-%dT%H:%M:%SZ}</Time><DistanceMeters>{meters}</DistanceMeters></Trackpoint>'
+        '</Track></Lap>'
+        for meters in laps
+    )
+    return (
+        f'          <?xml version="1.0" encoding="UTF-8"?>\n<TrainingCenterDatabase xmlns="{ns}"><Activities>'
+        f'<Activity Sport="{sport}"><Id>{start:%Y-%m-%dT%H:%M:%SZ}</Id>{body}</Activity>'
+        '</Activities></TrainingCenterDatabase>'
+    ).encode()
+
+
+def fit_file(start, meters, sport=1, local_offset=None, endian='<'):
+    """
+    Build a minimal FIT activity: records with a developer field (one behind a
+    compressed timestamp header), a session and, given ``local_offset``
+    seconds, an activity message.
+    """
+    import struct
+
+    ts = int((start - datetime(1989, 12, 31, tzinfo=dt_timezone.utc)).total_seconds())
+
+    def definition(local_type, global_number, fields, developer=()):
+        header = 0x40 | local_type | (0x20 if developer else 0)
+        content = struct.pack(endian + 'BBHB', 0, endian == '>', global_number, len(fields))
+        content += b''.join(bytes(field) for field in fields)
+        if developer:
+            content += bytes([len(developer)]) + b''.join(bytes(field) for field in developer)
+        return bytes([header]) + content
+
+    records = definition(0, 20, [(253, 4, 0x86), (5, 4, 0x86)], developer=[(0, 2, 0)])
+    records += b'\x00' + struct.pack(endian + 'II', ts, 0) + b'\x01\x02'
+    records += bytes([0x80 | 5]) + struct.pack(endian + 'II', ts + 5, 1000) + b'\x01\x02'
+    records += definition(1, 18, [(253, 4, 0x86), (2, 4, 0x86), (5, 1, 0), (6, 1, 0), (9, 4, 0x86)])
+    records += b'\x01' + struct.pack(endian + 'IIBBI', ts + 3600, ts, sport, 0, round(meters * 100))
+    if local_offset is not None:
+        records += definition(2, 34, [(253, 4, 0x86), (5, 4, 0x86)])
+        records += b'\x02' + struct.pack(endian + 'II', ts + 3600, ts + 3600 + local_offset)
+    return struct.pack('<BBHI4s', 12, 0x10, 2132, len(records), b'.FIT') + records + b'\x00\x00'
+
+
+class ActivityFileImportTests(TestCase):
+    # A Monday; runs before 3am local time count towards the week before
+    monday = datetime(2026, 10, 12, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        import tempfile
+
+        printing = mock.patch('builtins.print')
+        printing.start()
+        self.addCleanup(printing.stop)
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.workdir = workdir.name
+        self.user = User.objects.create_user(firebase_uid='file_user')
+
+    def export_files(self):
+        import gzip
+
+        start, north = (51.5, -0.1), 51.5 + MILE_NORTH
+        return {
+            # 01:30 UTC is 02:30 in London: last week. Two miles, not counting the jump between segments
+            'activities/101.gpx': gpx_file(self.monday + timedelta(hours=1, minutes=30), [
+                [start, (north, -0.1)], [(52.0, -0.1), (52.0 + MILE_NORTH, -0.1)],
+            ]),
+            'activities/102.tcx.gz': gzip.compress(tcx_file(self.monday + timedelta(hours=8), [3000, 1828.02])),
+            'activities/103.fit.gz': gzip.compress(fit_file(self.monday + timedelta(hours=9), 32186.8, sport=2)),
+            # 00:30 UTC is 02:30 locally, by the file's own offset: last week
+            'activities/104.fit': fit_file(self.monday + timedelta(minutes=30), 8046.7, local_offset=7200, endian='>'),
+            'activities/105.gpx': b'<gpx><trk><trkseg><trkpt lat="51.5"',
+            'activities.csv': b'Activity ID,Activity Date\n',
+        }
+
+    def write_export(self, files=None):
+        import zipfile
+
+        path = os.path.join(self.workdir, 'export.zip')
+        with zipfile.ZipFile(path, 'w') as archive:
+            for name, data in (files or self.export_files()).items():
+                archive.writestr(name, data)
+        return path
+
+    def assert_weeks(self):
+        from datetime import date
+
+        self.assertEqual(
+            dict(MileageLog.objects.filter(user=self.user).values_list('week_start_date', 'total_mileage')),
+            {date(2026, 10, 5): 7.0, date(2026, 10, 12): 3.0},
+        )
+
+    def test_imports_strava_export_zip_across_processes(self):
+        from zoneinfo import ZoneInfo
+        from .activity_files import import_activity_files
+
+        stats = import_activity_files(self.user, [self.write_export()], workers=2, tz=ZoneInfo('Europe/London'))
+
+        self.assertEqual((stats['files'], stats['activities']), (4, 4))
+        self.assertEqual(list(stats['errors']), [f'{self.workdir}/export.zip:activities/105.gpx'])
+        self.assertEqual(
+            dict(Activity.objects.filter(user=self.user).values_list('strava_id', 'activity_type')),
+            {101: 'Run', 102: 'Run', 103: 'Ride', 104: 'Run'},
+        )
+        self.assert_weeks()
+
+    def test_reimport_is_idempotent_and_keeps_other_users_activities(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .activity_files import import_activity_files
+
+        for name, data in self.export_files().items():
+            path = os.path.join(self.workdir, 'export', name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+        other = User.objects.create_user(firebase_uid='other_file_user')
+        Activity.objects.create(
+            user=other, strava_id=103, activity_type='Run', start_date=self.monday, week_start_date=self.monday.date(),
+            distance=1000,
+        )
+
+        for _ in range(2):
+            call_command('import_activity_files', os.path.join(self.workdir, 'export'), user=self.user.pk,
+                         workers=1, timezone='Europe/London', stdout=StringIO())
+
+        self.assertEqual(Activity.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(Activity.objects.get(strava_id=103).user, other)
+        self.assert_weeks()
+
+        # A file outside an export gets a stable id of its own
+        loose = os.path.join(self.workdir, 'evening run.gpx')
+        with open(loose, 'wb') as f:
+            f.write(gpx_file(self.monday + timedelta(hours=18), [[(51.5, -0.1), (51.5 + MILE_NORTH, -0.1)]]))
+        for _ in range(2):
+            stats = import_activity_files(self.user, [loose])
+        self.assertEqual(stats['activities'], 1)
+        activity = Activity.objects.get(user=self.user, strava_id__lt=0)
+        self.assertAlmostEqual(activity.distance, 1609.3, delta=0.5)
+
+    def test_numbered_files_outside_a_strava_export_get_file_ids(self):
+        from .activity_files import import_activity_files
+
+        # Garmin and Coros exports number their files too, without Strava's activities.csv
+        files = self.export_files()
+        del files['activities.csv']
+        loose = os.path.join(self.workdir, '106.gpx')
+        with open(loose, 'wb') as f:
+            f.write(gpx_file(self.monday + timedelta(hours=18), [[(51.5, -0.1), (51.5 + MILE_NORTH, -0.1)]]))
+
+        stats = import_activity_files(self.user, [self.write_export(files), loose])
+
+        self.assertEqual(stats['activities'], 5)
+        self.assertFalse(Activity.objects.filter(strava_id__gt=0).exists())
+
+    def test_strava_sync_keeps_file_activities_and_replaces_their_copies(self):
+        from .activity_files import import_activity_files
+
+        evening, morning = self.monday + timedelta(hours=18), self.monday + timedelta(hours=6)
+        mile = [[(51.5, -0.1), (51.5 + MILE_NORTH, -0.1)]]
+        paths = []
+        for name, start in (('evening.gpx', evening), ('morning.gpx', morning)):
+            paths.append(os.path.join(self.workdir, name))
+            with open(paths[-1], 'wb') as f:
+                f.write(gpx_file(start, mile))
+        import_activity_files(self.user, paths)
+        self.assertEqual(MileageLog.objects.get(user=self.user).total_mileage, 2.0)
+
+        # Strava has the evening run only; the morning one was never uploaded there
+        service = StravaService()
+        with mock.patch.object(StravaService, 'iter_activities', return_value=iter([
+            dict(make_activity(evening, 1.0), id=555),
+        ])):
+            service._sync_window(self.user, 'access', self.monday - timedelta(days=1))
+
+        self.assertEqual(
+            sorted(Activity.objects.filter(user=self.user).values_list('strava_id', 'start_date')),
+            sorted([(555, evening), (Activity.objects.get(start_date=morning).strava_id, morning)]),
+        )
+        self.assertLess(Activity.objects.get(start_date=morning).strava_id, 0)
+        self.assertEqual(MileageLog.objects.get(user=self.user).total_mileage, 2.0)
+
+        stats = import_activity_files(self.user, paths)
+        self.assertEqual((stats['activities'], stats['duplicates']), (1, 1))
+        self.assertEqual(Activity.objects.filter(user=self.user).count(), 2)
+
+
+class PollingTests(TestCase):
+    # A Wednesday, well before the end of the week
+    now = datetime(2026, 10, 14, 12, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        cache.clear()
+        self.users = [
+            User.objects.create_user(firebase_uid=f'poll_user_{i}', strava_refresh_token='refresh')
+            for i in range(12)
+        ]
+        User.objects.create_user(firebase_uid='not_connected')
+
+    def test_interval_follows_activity_and_week_end(self):
+        from .polling import ACTIVE_INTERVAL, DORMANT_INTERVAL, REGULAR_INTERVAL, poll_interval
+
+        yesterday = self.now - timedelta(days=1)
+        self.assertEqual(poll_interval(yesterday, 5, self.now), ACTIVE_INTERVAL)
+        self.assertEqual(poll_interval(yesterday, 1, self.now), REGULAR_INTERVAL)
+        self.assertEqual(poll_interval(self.now - timedelta(days=60), 0, self.now), DORMANT_INTERVAL)
+        self.assertEqual(poll_interval(None, 0, self.now), DORMANT_INTERVAL)
+
+        saturday = self.now + timedelta(days=3)
+        self.assertEqual(poll_interval(saturday - timedelta(days=1), 1, saturday), REGULAR_INTERVAL // 2)
+
+    def test_each_dormant_user_is_polled_once_a_day(self):
+        from .polling import due_polls
+
+        tick = 300
+        polled = []
+        for i in range(24 * 60 * 60 // tick):
+            polled += [user_id for user_id, countdown in due_polls(self.now + timedelta(seconds=i * tick), tick)]
+
+        self.assertEqual(sorted(polled), sorted(user.pk for user in self.users))
+
+    def test_active_users_polled_more_often_and_recent_syncs_skipped(self):
+        from .polling import ACTIVE_INTERVAL, due_polls
+
+        runner, synced = self.users[:2]
+        for day in range(5):
+            start = self.now - timedelta(days=day + 1)
+            Activity.objects.create(
+                user=runner, strava_id=day + 1, activity_type='Run', start_date=start,
+                week_start_date=start.date(), distance=5000,
+            )
+        User.objects.filter(pk=synced.pk).update(strava_synced_at=self.now - timedelta(minutes=10))
+
+        polled = []
+        for i in range(ACTIVE_INTERVAL * 2 // 300):
+            polled += [user_id for user_id, countdown in due_polls(self.now + timedelta(seconds=i * 300), 300)]
+
+        self.assertEqual(polled.count(runner.pk), 2)
+        # A dormant user's poll may land in this window, but not within 12h of their last sync
+        self.assertNotIn(synced.pk, polled)
+
+    def test_schedule_polls_queues_background_syncs_once(self):
+        from .ratelimit import BACKGROUND
+        from .tasks import schedule_polls, update_strava_data_task
+
+        with self.settings(STRAVA_POLL_TICK_SECONDS=24 * 60 * 60), \
+                mock.patch.object(update_strava_data_task, 'apply_async') as apply_async, \
+                mock.patch('builtins.print'):
+            schedule_polls()
+            schedule_polls()
+
+        self.assertEqual(apply_async.call_count, len(self.users))
+        self.assertEqual(apply_async.call_args[0][1], {'priority': BACKGROUND})
@@ -6,4 +6,5 @@ app_name = 'strava'
 urlpatterns = [
     path('connect/', views.connect, name='connect'),
     path('callback/', views.callback, name='callback'),
+    path('webhook/', views.webhook, name='webhook'),
 ]
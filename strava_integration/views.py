@@ -1,7 +1,15 @@
 from django.shortcuts import redirect, render
+from django.utils import timezone
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+import json
+from users.models import StravaSyncStatus
 from .services import StravaService
+from .tasks import initial_historical_fetch
+from .webhooks import EVENT_FIELDS, queue_event
 
 @login_required
 def connect(request):
@@ -16,12 +24,42 @@ def callback(request):
         service = StravaService()
         tokens = service.exchange_token(code)
         
-        # Save tokens to user profile
-        request.user.strava_refresh_token = tokens.get('refresh_token')
-        request.user.save()
+        # Save tokens to user profile; the access token is cached for the initial fetch
+        service.store_tokens(request.user, tokens)
         
-        # Trigger initial data fetch (mocked for now)
-        service.fetch_initial_data(request.user)
+        # Fetch history in the background; the dashboard shows a syncing state until it finishes
+        request.user.strava_sync_status = StravaSyncStatus.SYNCING
+        request.user.strava_sync_started_at = timezone.now()
+        request.user.save(update_fields=['strava_sync_status', 'strava_sync_started_at'])
+        initial_historical_fetch.delay(request.user.pk)
         
         return redirect('dashboard:index')
     return redirect('dashboard:index')
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def webhook(request):
+    """
+    Strava webhook endpoint.
+    GET answers the subscription challenge, POST receives activity events.
+    Events are only queued here; Strava expects a reply within 2 seconds.
+    Events whose subscription_id isn't ours are acknowledged and dropped;
+    bodies that aren't Strava events get a 400.
+    """
+    if request.method == 'GET':
+        verify_token = settings.STRAVA_WEBHOOK_VERIFY_TOKEN
+        if not verify_token or request.GET.get('hub.verify_token') != verify_token:
+            return HttpResponseForbidden()
+        return JsonResponse({'hub.challenge': request.GET.get('hub.challenge')})
+    
+    try:
+        event = json.loads(request.body)
+    except ValueError:
+        return HttpResponse(status=400)
+    if (not isinstance(event, dict) or any(field not in event for field in EVENT_FIELDS)
+            or not isinstance(event.get('updates') or {}, dict)):
+        return HttpResponse(status=400)
+    
+    queue_event(event)
+    return HttpResponse(status=200)
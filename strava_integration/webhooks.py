@@ -0,0 +1,125 @@
+"""
+Strava webhook event coalescing.
+
+Strava posts one event per activity create, update or delete. Events are
+collected per athlete in the shared cache, and a single task per athlete
+runs after a short delay to handle the whole burst: deletes and type edits
+are applied to stored activities directly, and new activities are fetched
+by id, so uploads backdated before the sync cursor are not missed.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .locks import cache_lock
+
+CREATE = 'create'
+UPDATE = 'update'
+DELETE = 'delete'
+
+# Fields every Strava event carries
+EVENT_FIELDS = ('object_type', 'object_id', 'owner_id', 'aspect_type')
+
+
+def _pending_key(athlete_id):
+    return f'strava:webhook:pending:{athlete_id}'
+
+
+def _scheduled_key(athlete_id):
+    return f'strava:webhook:scheduled:{athlete_id}'
+
+
+def _merge(previous, event):
+    """
+    Collapse two events for the same activity into the one that matters.
+
+    Events are stored as ``{'aspect_type': ..., 'updates': {...}}``.
+    """
+    if previous is None:
+        return event
+    if DELETE in (event['aspect_type'], previous['aspect_type']):
+        return {'aspect_type': DELETE, 'updates': {}}
+    if previous['aspect_type'] == CREATE:
+        # Created and edited within the window is still just a new activity
+        return previous
+    return {'aspect_type': event['aspect_type'], 'updates': {**previous['updates'], **event['updates']}}
+
+
+def queue_event(event):
+    """
+    Record a webhook event and make sure its athlete has a task scheduled.
+
+    Returns:
+        bool: True if the event was queued, False if it was ignored.
+    """
+    from .tasks import process_webhook_events
+
+    # The endpoint is public; only trust events for our own subscription
+    subscription_id = settings.STRAVA_WEBHOOK_SUBSCRIPTION_ID
+    if not subscription_id or str(event.get('subscription_id')) != str(subscription_id):
+        return False
+
+    athlete_id = event.get('owner_id')
+    if not athlete_id:
+        return False
+
+    if event.get('object_type') == 'athlete':
+        # Deauthorization has no activity to fetch, handle it right away
+        if (event.get('updates') or {}).get('authorized') == 'false':
+            process_webhook_events.delay(athlete_id, deauthorized=True)
+            return True
+        return False
+
+    if event.get('object_type') != 'activity' or event.get('aspect_type') not in (CREATE, UPDATE, DELETE):
+        return False
+
+    interval = getattr(settings, 'STRAVA_WEBHOOK_COALESCE_SECONDS', 30)
+    key = _pending_key(athlete_id)
+    with cache_lock(f'{key}:lock', timeout=5, wait=5):
+        pending = cache.get(key) or {}
+        activity_id = event.get('object_id')
+        pending[activity_id] = _merge(pending.get(activity_id), {
+            'aspect_type': event['aspect_type'],
+            'updates': event.get('updates') or {},
+        })
+        # Outlive the scheduled task comfortably in case the worker is slow
+        cache.set(key, pending, interval + 600)
+
+    _schedule(athlete_id, interval)
+    return True
+
+
+def _schedule(athlete_id, countdown):
+    """Schedule the athlete's task unless one is already waiting."""
+    from .tasks import process_webhook_events
+
+    if cache.add(_scheduled_key(athlete_id), True, countdown + 300):
+        process_webhook_events.apply_async((athlete_id,), countdown=countdown)
+
+
+def pop_events(athlete_id):
+    """
+    Take every pending event for an athlete.
+
+    The scheduled flag is cleared first so events arriving from now on
+    schedule a new task instead of being lost.
+
+    Returns:
+        dict: activity id -> ``{'aspect_type': ..., 'updates': {...}}``
+    """
+    cache.delete(_scheduled_key(athlete_id))
+    key = _pending_key(athlete_id)
+    with cache_lock(f'{key}:lock', timeout=5, wait=5):
+        pending = cache.get(key) or {}
+        cache.delete(key)
+    return pending
+
+
+def requeue_events(athlete_id, events, countdown):
+    """Put events back (e.g. after a rate limit) and retry them after ``countdown`` seconds."""
+    key = _pending_key(athlete_id)
+    with cache_lock(f'{key}:lock', timeout=5, wait=5):
+        pending = cache.get(key) or {}
+        for activity_id, event in events.items():
+            pending[activity_id] = _merge(pending.get(activity_id), event)
+        cache.set(key, pending, countdown + 600)
+    _schedule(athlete_id, countdown)
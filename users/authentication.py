@@ -0,0 +1,207 @@
+"""
+Stateless Firebase ID token authentication for the REST API.
+
+Tokens are verified locally against Google's signing certificates, which are
+fetched once and cached until the Cache-Control max-age Google sends; if a
+refresh fails, the keys already fetched stay in use. Decoded
+claims are kept until the token expires and Firebase UIDs are mapped to users
+through a short-lived in-process cache, so an authenticated API call needs no
+session lookup and no network round trip.
+"""
+import copy
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+import requests
+from cryptography.x509 import load_pem_x509_certificate
+from django.contrib.auth import get_user_model
+from rest_framework import authentication, exceptions
+
+from core.metrics import FIREBASE_REQUEST_SECONDS, timed
+
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+
+# Used when Google's response has no max-age
+DEFAULT_KEYS_MAX_AGE = 3600
+
+# An unknown key id triggers a refetch at most this often
+MIN_KEYS_REFRESH_INTERVAL = 60
+
+CLAIMS_CACHE_SIZE = 10000
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 60
+
+# Allowed clock difference when checking exp/iat
+CLOCK_SKEW = 10
+
+
+class SigningKeys:
+    """Google's token signing keys, refreshed when they expire."""
+
+    def __init__(self, url=GOOGLE_CERTS_URL):
+        self.url = url
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._expires_at = 0
+        self._fetched_at = 0
+
+    def get(self, kid):
+        """
+        Return the public key for ``kid``, or None if Google doesn't list it.
+
+        Raises:
+            ValueError: if no keys could be fetched at all
+        """
+        now = time.time()
+        if now >= self._expires_at or (kid not in self._keys and now - self._fetched_at > MIN_KEYS_REFRESH_INTERVAL):
+            with self._lock:
+                # Another thread may have refreshed while we waited
+                if time.time() >= self._expires_at or kid not in self._keys:
+                    self._refresh()
+        if not self._keys:
+            raise ValueError("Signing keys unavailable")
+        return self._keys.get(kid)
+
+    def _refresh(self):
+        self._fetched_at = time.time()
+        try:
+            certs, max_age = self._fetch()
+            keys = {
+                kid: load_pem_x509_certificate(pem.encode()).public_key()
+                for kid, pem in certs.items()
+            }
+        except (requests.RequestException, ValueError, AttributeError) as e:
+            # Keep the keys we have and try again shortly, rather than on every request
+            print(f"Could not refresh Firebase signing keys: {e}")
+            self._expires_at = self._fetched_at + MIN_KEYS_REFRESH_INTERVAL
+            return
+        self._keys = keys
+        self._expires_at = self._fetched_at + max_age
+
+    def _fetch(self):
+        """Return ({kid: PEM certificate}, max_age seconds)."""
+        with timed(FIREBASE_REQUEST_SECONDS, operation='fetch_signing_keys'):
+            response = requests.get(self.url, timeout=5)
+            response.raise_for_status()
+        match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+        return response.json(), int(match.group(1)) if match else DEFAULT_KEYS_MAX_AGE
+
+
+class _ExpiringCache:
+    """Small thread-safe LRU cache whose entries carry their own expiry time."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._items[key] = (value, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+signing_keys = SigningKeys()
+claims_cache = _ExpiringCache(CLAIMS_CACHE_SIZE)
+user_cache = _ExpiringCache(USER_CACHE_SIZE)
+
+
+def verify_id_token(id_token, project_id=None):
+    """
+    Verify a Firebase ID token locally and return its claims.
+
+    Raises:
+        ValueError: If the token is invalid or expired
+    """
+    project_id = project_id or os.getenv('FIREBASE_PROJECT_ID')
+    token_hash = hashlib.sha256(id_token.encode()).hexdigest()
+    claims = claims_cache.get(token_hash)
+    if claims is not None:
+        return claims
+
+    try:
+        kid = jwt.get_unverified_header(id_token).get('kid')
+        key = signing_keys.get(kid)
+        if key is None:
+            raise ValueError("Unknown signing key")
+        claims = jwt.decode(
+            id_token,
+            key,
+            algorithms=['RS256'],
+            audience=project_id,
+            issuer=f'https://securetoken.google.com/{project_id}',
+            leeway=CLOCK_SKEW,
+            options={'require': ['exp', 'iat', 'sub']},
+        )
+    except jwt.PyJWTError as e:
+        raise ValueError(f"Invalid token: {e}")
+
+    if not claims['sub']:
+        raise ValueError("Invalid token: empty subject")
+    # Match the shape returned by firebase_admin.auth.verify_id_token
+    claims['uid'] = claims['sub']
+
+    claims_cache.set(token_hash, claims, claims['exp'])
+    return claims
+
+
+class FirebaseAuthentication(authentication.BaseAuthentication):
+    """Authenticate API requests with ``Authorization: Bearer <Firebase ID token>``."""
+
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        header = request.headers.get('Authorization', '').split()
+        if not header or header[0] != self.keyword:
+            return None
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed('Invalid Authorization header')
+
+        try:
+            claims = verify_id_token(header[1])
+        except ValueError as e:
+            raise exceptions.AuthenticationFailed(str(e))
+
+        user = self._get_user(claims)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted')
+        return user, claims
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+    @staticmethod
+    def _get_user(claims):
+        uid = claims['uid']
+        user = user_cache.get(uid)
+        if user is None:
+            from .firebase_auth import get_or_create_user_from_firebase
+
+            User = get_user_model()
+            user = User.objects.filter(firebase_uid=uid).first() or get_or_create_user_from_firebase(claims)
+            user_cache.set(uid, user, time.time() + USER_CACHE_TTL)
+        # Concurrent requests for the same user must not share one instance
+        return copy.copy(user)
@@ -1,6 +1,6 @@
 import os
-import firebase_admin
-from firebase_admin import credentials, auth
+import threading
+
 from django.conf import settings
 try:
     from dotenv import load_dotenv
@@ -8,19 +8,36 @@ try:
 except ImportError:
     pass
 
+_init_lock = threading.Lock()
+_initialized = False
+
+
 # Initialize Firebase Admin SDK
 def initialize_firebase():
-    """Initialize Firebase Admin SDK with service account credentials."""
+    """
+    Initialize Firebase Admin SDK with service account credentials.
+
+    Safe to call from any thread; only the first call does any work. The SDK
+    itself is imported here so loading this module stays cheap for processes
+    that never verify a token (migrate, celery, tests).
+    """
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        _initialize_app()
+        _initialized = True
+
+
+def _initialize_app():
+    import firebase_admin
+    from firebase_admin import credentials
+
     if not firebase_admin._apps:
         # Option 1: Load from JSON string in environment variable (Best for Railway/Heroku)
         firebase_creds_json = os.getenv('FIREBASE_CREDENTIALS_JSON')
-        
-        # DEBUG LOGGING
-        if firebase_creds_json:
-            print(f"DEBUG: Found FIREBASE_CREDENTIALS_JSON. Length: {len(firebase_creds_json)}")
-            print(f"DEBUG: First 20 chars: {firebase_creds_json[:20]}")
-        else:
-            print("DEBUG: FIREBASE_CREDENTIALS_JSON not found in environment.")
 
         if firebase_creds_json:
             import json
@@ -39,7 +56,6 @@ def initialize_firebase():
 
         # Option 2: Load from file path
         cred_filename = os.getenv('FIREBASE_ADMIN_CREDENTIALS')
-        print(f"DEBUG: FIREBASE_ADMIN_CREDENTIALS env var: {cred_filename}")
         
         # If not in env, try to find the Firebase JSON file in the project root
         if not cred_filename:
@@ -68,7 +84,21 @@ def initialize_firebase():
         cred = credentials.Certificate(cred_path)
         firebase_admin.initialize_app(cred)
 
-initialize_firebase()
+
+def warm_up():
+    """
+    Do Firebase setup ahead of the first request.
+
+    Called from the gunicorn master before workers fork (see gunicorn.conf.py)
+    so workers start with the SDK imported and Google's signing keys cached.
+    """
+    initialize_firebase()
+    try:
+        from .authentication import signing_keys
+        signing_keys.get(None)
+    except Exception as e:
+        # Not fatal, keys are fetched again on first use
+        print(f"Firebase signing key prefetch failed: {e}")
 
 def verify_firebase_token(id_token):
     """
@@ -83,10 +113,14 @@ def verify_firebase_token(id_token):
     Raises:
         ValueError: If token is invalid
     """
+    from firebase_admin import auth
+
+    from core.metrics import FIREBASE_REQUEST_SECONDS, timed
+
+    initialize_firebase()
     try:
-        print(f"Verifying token: {id_token[:20]}...")
-        decoded_token = auth.verify_id_token(id_token)
-        print(f"Token verified for UID: {decoded_token.get('uid')}")
+        with timed(FIREBASE_REQUEST_SECONDS, operation='verify_id_token'):
+            decoded_token = auth.verify_id_token(id_token)
         return decoded_token
     except Exception as e:
         print(f"Token verification failed: {e}")
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_firebase_uid_alter_user_phone_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='strava_sync_status',
+            field=models.CharField(choices=[('idle', 'Idle'), ('syncing', 'Syncing'), ('failed', 'Failed')], default='idle', max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_strava_sync_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='strava_sync_status',
+            field=models.CharField(choices=[('idle', 'Idle'), ('syncing', 'Syncing'), ('delayed', 'Delayed'), ('failed', 'Failed')], default='idle', max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_alter_user_strava_sync_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='strava_athlete_id',
+            field=models.BigIntegerField(blank=True, null=True, unique=True),
+        ),
+    ]
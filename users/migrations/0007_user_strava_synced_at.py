@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_user_strava_athlete_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='strava_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
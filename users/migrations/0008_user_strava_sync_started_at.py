@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_user_strava_synced_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='strava_sync_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
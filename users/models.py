@@ -17,6 +17,12 @@ class UserManager(BaseUserManager):
         extra_fields.setdefault('is_superuser', True)
         return self.create_user(firebase_uid, password, **extra_fields)
 
+class StravaSyncStatus(models.TextChoices):
+    IDLE = 'idle', 'Idle'
+    SYNCING = 'syncing', 'Syncing'
+    DELAYED = 'delayed', 'Delayed'  # Strava rate limit reached, serving stored data
+    FAILED = 'failed', 'Failed'
+
 class User(AbstractBaseUser, PermissionsMixin):
     firebase_uid = models.CharField(max_length=128, unique=True)
     phone_number = models.CharField(max_length=15, blank=True)
@@ -28,7 +34,13 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     # Strava Integration Fields
     strava_refresh_token = models.CharField(max_length=255, blank=True, null=True)
+    strava_athlete_id = models.BigIntegerField(blank=True, null=True, unique=True)
     last_sync_timestamp = models.DateTimeField(blank=True, null=True)
+    # When the last Strava sync finished; the dashboard refreshes data older than STRAVA_STALE_AFTER_SECONDS
+    strava_synced_at = models.DateTimeField(blank=True, null=True)
+    strava_sync_status = models.CharField(max_length=16, choices=StravaSyncStatus.choices, default=StravaSyncStatus.IDLE)
+    # When the status last became SYNCING, so a sync whose task was lost can be told apart from a running one
+    strava_sync_started_at = models.DateTimeField(blank=True, null=True)
 
     objects = UserManager()
 
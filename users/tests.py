@@ -1,7 +1,20 @@
+import datetime
+import threading
+import time
+from unittest import mock
+
+import jwt
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from users import authentication, firebase_auth
+
 User = get_user_model()
 
 class UserAuthTests(TestCase):
@@ -32,3 +45,135 @@ class UserAuthTests(TestCase):
     def test_dashboard_requires_login(self):
         response = self.client.get(self.dashboard_url)
         self.assertRedirects(response, f'{self.login_url}?next={self.dashboard_url}')
+
+
+class FirebaseAuthenticationTests(TestCase):
+    project_id = 'test-project'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'test')])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name)
+            .public_key(cls.private_key.public_key())
+            .serial_number(1)
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(cls.private_key, hashes.SHA256())
+        )
+        cls.certs = {'key-1': cert.public_bytes(serialization.Encoding.PEM).decode()}
+
+    def setUp(self):
+        self.auth = authentication
+        authentication.signing_keys = authentication.SigningKeys()
+        authentication.claims_cache.clear()
+        authentication.user_cache.clear()
+
+        self.fetch = mock.patch.object(authentication.SigningKeys, '_fetch', return_value=(self.certs, 3600)).start()
+        mock.patch.dict('os.environ', {'FIREBASE_PROJECT_ID': self.project_id}).start()
+        self.addCleanup(mock.patch.stopall)
+
+        self.user = User.objects.create_user(firebase_uid='uid-1', phone_number='+15555550100', password='pw')
+
+    def _token(self, kid='key-1', **claims):
+        now = int(time.time())
+        payload = {
+            'iss': f'https://securetoken.google.com/{self.project_id}',
+            'aud': self.project_id,
+            'sub': 'uid-1',
+            'iat': now,
+            'exp': now + 3600,
+            **claims,
+        }
+        return jwt.encode(payload, self.private_key, algorithm='RS256', headers={'kid': kid})
+
+    def _get(self, token):
+        return self.client.get(reverse('api:score'), HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_valid_token_authenticates_without_session(self):
+        response = self._get(self._token())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('sessionid', response.cookies)
+
+    def test_keys_and_claims_are_cached(self):
+        token = self._token()
+        self._get(token)
+        with self.assertNumQueries(0):
+            claims = self.auth.verify_id_token(token)
+            user = self.auth.FirebaseAuthentication._get_user(claims)
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_rejects_bad_tokens(self):
+        for token in (
+            self._token(aud='other-project'),
+            self._token(exp=int(time.time()) - 3600),
+            self._token(kid='unknown'),
+            self._token()[:-4] + 'abcd',
+        ):
+            with self.subTest(token=token[-10:]):
+                self.assertEqual(self._get(token).status_code, 401)
+
+    def test_unknown_kid_refetch_is_throttled(self):
+        self._get(self._token())
+        self._get(self._token(kid='unknown'))
+        self._get(self._token(kid='unknown', iat=int(time.time()) - 1))
+
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_key_fetch_failures_keep_previous_keys(self):
+        token = self._token()
+        self.fetch.side_effect = requests.ConnectionError('unreachable')
+        with mock.patch('builtins.print'):
+            self.assertEqual(self._get(token).status_code, 401)
+
+            self.fetch.side_effect = None
+            self.auth.signing_keys = self.auth.SigningKeys()
+            self.assertEqual(self._get(token).status_code, 200)
+
+            # Expired keys whose refresh fails stay in use
+            self.fetch.side_effect = requests.HTTPError('503 Server Error')
+            self.auth.signing_keys._expires_at = 0
+            self.auth.claims_cache.clear()
+            self.assertEqual(self._get(token).status_code, 200)
+        self.assertEqual(self.fetch.call_count, 3)
+
+    def test_cached_user_is_not_shared_between_requests(self):
+        claims = self.auth.verify_id_token(self._token())
+        first = self.auth.FirebaseAuthentication._get_user(claims)
+        second = self.auth.FirebaseAuthentication._get_user(claims)
+
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+
+
+class LazyFirebaseInitTests(TestCase):
+    def setUp(self):
+        self.firebase_auth = firebase_auth
+        mock.patch.object(firebase_auth, '_initialized', False).start()
+        self.init_app = mock.patch.object(firebase_auth, '_initialize_app').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_initializes_once_across_threads(self):
+        threads = [threading.Thread(target=self.firebase_auth.initialize_firebase) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.init_app.call_count, 1)
+
+    def test_failed_init_is_retried(self):
+        self.init_app.side_effect = [FileNotFoundError('missing'), None]
+
+        with self.assertRaises(FileNotFoundError):
+            self.firebase_auth.initialize_firebase()
+        self.firebase_auth.initialize_firebase()
+
+        self.assertEqual(self.init_app.call_count, 2)